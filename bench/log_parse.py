@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+"""Benchmark byte-level log parsing against the original str-based implementation.
+
+Usage: ./bench/log_parse.py [line count] [rounds]
+"""
+
+import datetime
+import os
+import re
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import ESPKey
+from lib import LogEntry
+
+
+def legacy_parse_log(log_text):
+    """The str-based parsing ESPKey used before byte-level parsing, without timestamps.
+
+    Args:
+        log_text (str): Log text.
+
+    Returns:
+        list: List of LogEntry objects containing parsed log entries.
+    """
+
+    aux_entry_re = re.compile("^([0-9]+) (Aux changed to ([01]))$")
+    data_entry_re = re.compile("^([0-9]+) ([0-9a-f]+):([0-9]+)$")
+    log_entry_re = re.compile("^([0-9]+) (.+)$")
+
+    parsed = []
+
+    for line in log_text.replace("\r", "").split("\n"):
+        line_stripped = line.strip()
+
+        data_match = re.match(data_entry_re, line_stripped)
+        aux_entry_match = re.match(aux_entry_re, line_stripped)
+        log_match = re.match(log_entry_re, line_stripped)
+
+        if data_match:
+            data_groups = data_match.groups()
+            parsed.append(LogEntry(int(data_groups[0]), data_hex=data_groups[1],
+                data_len=int(data_groups[2])))
+
+        elif aux_entry_match:
+            log_groups = aux_entry_match.groups()
+            parsed.append(LogEntry(int(log_groups[0]), log_msg=log_groups[1],
+                aux_status=bool(int(log_groups[2]))))
+
+        elif log_match:
+            log_groups = log_match.groups()
+            parsed.append(LogEntry(int(log_groups[0]), log_msg=log_groups[1]))
+
+    return parsed
+
+
+def peak_bytes(func):
+    """Peak memory allocated while running a function.
+
+    Args:
+        func (callable): Function to run.
+
+    Returns:
+        int: Peak allocation in bytes.
+    """
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return peak
+
+
+def main():
+    line_ct = 500000
+    rounds = 3
+
+    if len(sys.argv) > 1:
+        line_ct = int(sys.argv[1])
+
+    if len(sys.argv) > 2:
+        rounds = int(sys.argv[2])
+
+    lines = []
+
+    for idx in range(line_ct):
+        raw_ts = 508 + (idx * 250)
+
+        if idx % 10 == 0:
+            lines.append(f"{raw_ts} Aux changed to {idx % 20 // 10}")
+
+        elif idx % 10 == 1:
+            lines.append(f"{raw_ts} Connected to wifi")
+
+        else:
+            lines.append(f"{raw_ts} {0x2000000 + idx:07x}:26")
+
+    log_bytes = ("\r\n".join(lines) + "\r\n").encode()
+
+    fd, log_file = tempfile.mkstemp(suffix=".txt")
+
+    with os.fdopen(fd, "wb") as f:
+        f.write(log_bytes)
+
+    try:
+        ek = ESPKey({"base_url": "http://127.0.0.1"})
+        parse_log = getattr(ek, "_ESPKey__parse_log")
+
+        legacy = legacy_parse_log(log_bytes.decode())
+        parsed = parse_log(log_bytes)
+
+        if [entry.to_dict() for entry in legacy] != [entry.to_dict() for entry in parsed]:
+            raise RuntimeError("Byte-level parsing doesn't match the legacy parser.")
+
+        legacy_sec = min(timeit.repeat(lambda: legacy_parse_log(log_bytes.decode()),
+                                       number=1, repeat=rounds))
+        bytes_sec = min(timeit.repeat(lambda: parse_log(log_bytes), number=1, repeat=rounds))
+        file_sec = min(timeit.repeat(lambda: ek.get_log(file_name=log_file, compact=True),
+                                     number=1, repeat=rounds))
+
+        legacy_peak = peak_bytes(lambda: legacy_parse_log(log_bytes.decode()))
+        bytes_peak = peak_bytes(lambda: parse_log(log_bytes))
+
+    finally:
+        os.unlink(log_file)
+
+    mib = 1024 * 1024
+
+    print(f"Lines:          {line_ct} ({len(log_bytes) / mib:.1f} MiB)")
+    print(f"Legacy:         {legacy_sec:.4f} s, peak {legacy_peak / mib:.1f} MiB")
+    print(f"Bytes:          {bytes_sec:.4f} s, peak {bytes_peak / mib:.1f} MiB")
+    print(f"Mapped file:    {file_sec:.4f} s")
+    print(f"Speedup:        {legacy_sec / bytes_sec:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""Benchmark log timestamp reconstruction against the original per-entry implementation.
+
+Usage: ./bench/timestamps.py [entry count] [rounds]
+"""
+
+from array import array
+import datetime
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import ESPKey
+
+
+def legacy_process_time_stamps(entries, now_ts, req_dts):
+    """The per-entry timestamp reconstruction ESPKey used before batch processing.
+
+    Args:
+        entries (list): List of parsed log entries as dicts.
+        now_ts (int): Timestamp from microncontroller Now header.
+        req_dts (datetime.datetime): Approximate time request to microcontroller was sent.
+
+    Returns:
+        dict: Entry index mapped to an ISO-8601 timestamp.
+    """
+
+    entries_parsed = {}
+
+    past_latest_entry = False
+    last_dts = None
+    last_raw_ts = None
+
+    for i in range(len(entries) - 1, 0, -1):
+        this_entry = entries[i]
+
+        if past_latest_entry:
+            if this_entry['time_raw'] > last_raw_ts:
+                break
+
+            delta_t = datetime.timedelta(milliseconds=this_entry['time_raw'] - last_raw_ts)
+            this_dts = last_dts + delta_t
+
+            last_dts = this_dts
+            last_raw_ts = this_entry['time_raw']
+            entries_parsed.update({i: this_dts.isoformat()})
+
+        else:
+            past_latest_entry = True
+
+            delta_t = datetime.timedelta(milliseconds=this_entry['time_raw'] - now_ts)
+            this_dts = req_dts + delta_t
+
+            last_dts = this_dts
+            last_raw_ts = now_ts
+            entries_parsed.update({i: this_dts.isoformat()})
+
+            if this_entry['time_raw'] < 540:
+                break
+
+    return entries_parsed
+
+
+def main():
+    entry_ct = 1000000
+    rounds = 3
+
+    if len(sys.argv) > 1:
+        entry_ct = int(sys.argv[1])
+
+    if len(sys.argv) > 2:
+        rounds = int(sys.argv[2])
+
+    # One reboot a quarter of the way in, then a long current boot segment.
+    reboot_at = entry_ct // 4
+    time_raw = array("q", [508 + (idx * 250) for idx in range(reboot_at)])
+    time_raw.extend(508 + (idx * 250) for idx in range(entry_ct - reboot_at))
+
+    now_ts = time_raw[-1] + 5000
+    req_dts = datetime.datetime.utcnow()
+    entries = [{"time_raw": raw_ts} for raw_ts in time_raw]
+
+    process_time_stamps = getattr(ESPKey, "_ESPKey__process_time_stamps")
+
+    legacy_sec = min(timeit.repeat(lambda: legacy_process_time_stamps(entries, now_ts, req_dts),
+                                   number=1, repeat=rounds))
+    batch_sec = min(timeit.repeat(lambda: process_time_stamps(time_raw, now_ts, req_dts),
+                                  number=1, repeat=rounds))
+
+    boot_start, timestamps = process_time_stamps(time_raw, now_ts, req_dts)
+
+    print(f"Entries:              {entry_ct}")
+    print(f"Current boot entries: {len(timestamps)} (from index {boot_start})")
+    print(f"Legacy:               {legacy_sec:.4f} s")
+    print(f"Batch:                {batch_sec:.4f} s")
+    print(f"Speedup:              {legacy_sec / batch_sec:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
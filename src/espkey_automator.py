@@ -1,14 +1,31 @@
 #!/usr/bin/env python3
 
 import argparse
+import cProfile
+import datetime
 import json
 from pprint import pprint
 import os
 import re
+import sys
+import tracemalloc
 
+from lib import ArchiveIndex
+from lib import Broker
+from lib import BrokerClient
+from lib import ConfigPush
 from lib import Configurator
+from lib import Discovery
 from lib import ESPKey
+from lib import EventStream
+from lib import LogAnalytics
+from lib import LogEntry
+from lib import METRICS
+from lib import Monitor
+from lib import PROFILER
 from lib import Recipe
+from lib import Upgrader
+from lib import WeigandEncoder
 
 
 # If we're being called as a script.
@@ -23,6 +40,9 @@ if __name__ == "__main__":
         Raises:
             ValueError: Exactly one action should be specified.
             ValueError: Weigand send data is invalid.
+            ValueError: Archive query options are invalid.
+            ValueError: Profiling modes are invalid.
+            ValueError: --via-broker is used with an action it doesn't support.
 
         Returns:
             dict: A dictionary containing the necessary data to execute ther equest.
@@ -30,8 +50,9 @@ if __name__ == "__main__":
 
         action_spec = None
         action_ct = 0
-        actions = ["delete_log", "get_config", "get_diagnostics", "get_log", "recipe",
-                   "restart", "send_weigand"]
+        actions = ["analyze", "archive", "broker", "delete_log", "discover", "encode_weigand",
+                   "get_config", "get_diagnostics", "get_log", "get_log_file", "get_version",
+                   "monitor", "recipe", "restart", "send_weigand", "set_config", "upgrade"]
         args_unwrapped = {}
 
         for arg in vars(args):
@@ -55,25 +76,224 @@ if __name__ == "__main__":
             raise ValueError(error_str)
 
         # Throw a ValueError if the weigand data isn't formatted correctly.
-        if action_spec == 'send_weigand':
-            if not re.match(r"([0-9a-fA-F]+):([0-9]+)", args_unwrapped['send_weigand']):
-                raise ValueError("--send-weigand value is not properly formatted.")
+        if action_spec in ['encode_weigand', 'send_weigand']:
+            try:
+                WeigandEncoder.parse_spec(args_unwrapped[action_spec])
+
+            except ValueError as e:
+                flag = action_spec.replace("_", "-")
+                raise ValueError(f"--{flag} value is not properly formatted: {e}")
+
+        # Archive queries.
+        for query_arg in ["card", "since", "until"]:
+            if args_unwrapped[query_arg] is not None:
+                if action_spec != "archive":
+                    raise ValueError(f"--{query_arg} can only be used with --archive.")
+
+                try:
+                    if query_arg == "card":
+                        WeigandEncoder.parse_spec(args_unwrapped[query_arg])
+
+                    else:
+                        datetime.datetime.fromisoformat(args_unwrapped[query_arg])
+
+                except ValueError as e:
+                    raise ValueError(f"--{query_arg} value is not properly formatted: {e}")
         
+        # Profiling modes.
+        if args_unwrapped['profile'] is not None:
+            for mode in args_unwrapped['profile'].split(","):
+                if mode not in ["spans", "cprofile", "tracemalloc"]:
+                    raise ValueError(f"Invalid --profile mode \"{mode}\". Use spans, cprofile " \
+                        "or tracemalloc.")
+
+        # The broker only stands in for ESPKey operations it serves.
+        if args_unwrapped['via_broker'] is not None and action_spec in ["analyze", "archive",
+           "broker", "discover", "encode_weigand", "recipe", "upgrade"]:
+            flag = action_spec.replace("_", "-")
+            raise ValueError(f"--via-broker can't be used with --{flag}.")
+
         return action_spec
 
 
+    def load_configurator(args, env_target="default"):
+        """Load the configuration file named by --config or EKA_CONFIG_FILE.
+
+        Args:
+            args (Argparse): Parsed argparse arguments.
+            env_target (str, optional): Target environment variables configure. Defaults to
+                                        "default".
+
+        Returns:
+            Configurator: Loaded configuration.
+        """
+
+        env_var_prefix = "EKA"
+        config_file_override = os.getenv(f"{env_var_prefix}_CONFIG_FILE", args.config)
+
+        return Configurator(env_var_prefix=env_var_prefix, config_file=config_file_override,
+                            env_target=env_target)
+
+
+    def target_config(args, configurator, target):
+        """Get a target's configuration with the CLI's overrides applied.
+
+        Args:
+            args (Argparse): Parsed argparse arguments.
+            configurator (Configurator): Loaded configuration.
+            target (str): Target name.
+
+        Returns:
+            dict: ESPKey configuration.
+        """
+
+        try:
+            ek_config = dict(configurator.get(target), name=target)
+
+        except (KeyError, ValueError) as e:
+            print(f"Error: {e.args[0]} Exiting.")
+            exit(1)
+
+        if args.rate_limit is not None:
+            ek_config.update({"rate_limit": args.rate_limit})
+
+        return ek_config
+
+
+    def make_espkey(args, ek_config):
+        """Create an ESPKey, or a client that reaches it through the broker named by
+           --via-broker.
+
+        Args:
+            args (Argparse): Parsed argparse arguments.
+            ek_config (dict): ESPKey configuration.
+
+        Returns:
+            ESPKey, BrokerClient: Object to run operations with.
+        """
+
+        if args.via_broker is not None:
+            return BrokerClient(dict(ek_config, broker=args.via_broker,
+                                     broker_token=os.getenv("EKA_BROKER_TOKEN")))
+
+        return ESPKey(ek_config)
+
+
+    def load_fleet(args, targets):
+        """Create ESPKeys for several targets in the configuration. Only the targets used are
+           validated.
+
+        Args:
+            args (Argparse): Parsed argparse arguments.
+            targets (str): "all" or a comma-separated list of target names, tag:<tag> and
+                           group:<group>.
+
+        Returns:
+            dict: Target name mapped to ESPKey object.
+        """
+
+        configurator = load_configurator(args)
+
+        try:
+            target_names = configurator.resolve(targets)
+
+        except KeyError as e:
+            print(f"Error: {e.args[0]} Exiting.")
+            exit(1)
+
+        return {target: make_espkey(args, target_config(args, configurator, target))
+                for target in target_names}
+
+
+    def positive_int(value):
+        """Argparse type for options that need a whole number of at least 1.
+
+        Args:
+            value (str): Option value.
+
+        Raises:
+            argparse.ArgumentTypeError: The value isn't an int of at least 1.
+
+        Returns:
+            int: Option value.
+        """
+
+        try:
+            number = int(value)
+
+        except ValueError:
+            number = 0
+
+        if number < 1:
+            raise argparse.ArgumentTypeError(f"must be an int of at least 1: {value}")
+
+        return number
+
+
     # Get the argument parser going.
     parser = argparse.ArgumentParser(
             prog='espkey_automator',
             description='Execute actions against ESPKey devices.')
 
+    parser.add_argument("--analyze", type=str, nargs="+", default=None, help="Summarize " \
+                        "the logs in recipe output files and raw log files, or directories of " \
+                        "them: credentials read per ESPKey, reads by hour of the day (UTC), " \
+                        "keypad PIN attempts and aux toggles. Raw log files are named after " \
+                        "their ESPKey. Use --processes to spread ESPKeys across processes.")
+    parser.add_argument("--analyze-table", action="store_true", help="Use with --analyze to " \
+                        "print aligned text tables instead of JSON.")
+    parser.add_argument("--analyze-top", type=int, default=20, help="Use with --analyze to set " \
+                        "the rows kept in the credential and PIN tables. Defaults to 20.")
+    parser.add_argument("--archive", type=str, default=None, help="Index the recipe output " \
+                        "files in this directory and search them. Prints a summary of the " \
+                        "archive unless --card, --since or --until are used.")
+    parser.add_argument("--card", type=str, default=None, help="Use with --archive to find " \
+                        "reads of a credential. Takes a --send-weigand specification such as " \
+                        "29b0bfc:26 or h10301:fc=77,cn=34302.")
+    parser.add_argument("--since", type=str, default=None, help="Use with --archive to find " \
+                        "entries logged at or after this ISO-8601 UTC time.")
+    parser.add_argument("--until", type=str, default=None, help="Use with --archive to find " \
+                        "entries logged at or before this ISO-8601 UTC time.")
+    parser.add_argument("--broker", type=str, nargs="?", const="all", default=None,
+                        help="Serve a local JSON API in front of every ESPKey in the " \
+                        "configuration, or a comma-separated list of them, until stopped with " \
+                        "Ctrl-C. Requests to each ESPKey are sent one at a time over kept-alive " \
+                        "connections, identical reads share one request, version and config " \
+                        "responses are cached and logs are mirrored. Other tools and " \
+                        "--via-broker use it instead of the ESPKeys. Set EKA_BROKER_TOKEN to " \
+                        "require a token and allow write operations.")
+    parser.add_argument("--broker-duration", type=float, default=None, help="Stop --broker " \
+                        "after this many seconds.")
+    parser.add_argument("--broker-host", type=str, default="127.0.0.1", help="Address for " \
+                        "--broker to listen on. Defaults to 127.0.0.1.")
+    parser.add_argument("--broker-interval", type=float, default=5.0, help="Seconds between " \
+                        "--broker log mirror pulls. Defaults to 5.")
+    parser.add_argument("--broker-port", type=int, default=8780, help="Port for --broker to " \
+                        "listen on. Defaults to 8780.")
+    parser.add_argument("--cache-file", type=str, default=None, help="Cache version and " \
+                        "config responses in this file so they're shared between runs.")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="Seconds to use cached " \
+                        "version and config responses before checking with the ESPKey again. " \
+                        "Defaults to 300 when --cache-file is used.")
     parser.add_argument("--config", type=str, default="config.json",
                         help="Specify configuration file.")
+    parser.add_argument("--discover", type=str, default=None, help="Scan a CIDR range such as " \
+                        "192.168.4.0/22 for ESPKeys and print what was found and how it " \
+                        "compares with the configuration. Credentials for new ESPKeys come " \
+                        "from EKA_WEB_USER and EKA_WEB_PASS.")
+    parser.add_argument("--discover-ports", type=str, default="80", help="Use with --discover " \
+                        "to set a comma-separated list of ports to try. Defaults to 80.")
+    parser.add_argument("--discover-timeout", type=float, default=0.5, help="Use with " \
+                        "--discover to set the seconds to wait for each address. Defaults to 0.5.")
+    parser.add_argument("--discover-write", action="store_true", help="Use with --discover to " \
+                        "save the merged configuration to the configuration file.")
     parser.add_argument("--delete-log", action="store_true", help="Delete the log on the device. " \
                         "Maybe used in combination with --with-post.")
     parser.add_argument("--with-post", action="store_true",  help="Use with --delete-log " \
                         "to trigger log deletion using a POST. Used with some versions of " \
                         "the ESPKey firmware that don't have a /delete endpoint.")
+    parser.add_argument("--encode-weigand", type=str, default=None, help="Print the weigand data " \
+                        "for a --send-weigand specification without sending it.")
     parser.add_argument("--get-config", action="store_true", help="Get the ESPKey's config.")
     parser.add_argument("--get-diagnostics", action="store_true", help="Get diagnostic data from "\
                         "the ESPKey.")
@@ -81,53 +301,277 @@ if __name__ == "__main__":
     parser.add_argument("--get-log-file", type=str, default=None, help="Get logs an ESPKey test " \
                         "file. Human-redable timestamps can't be derived from a text file.")
     parser.add_argument("--get-version", action="store_true", help="Get ESPKey version data.")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus " \
+                        "metrics from http://127.0.0.1:<port>/metrics while running.")
+    parser.add_argument("--metrics-summary", action="store_true", help="Print a summary of " \
+                        "request, parse and operation metrics to stderr when finished.")
+    parser.add_argument("--monitor", type=str, nargs="?", const="all", default=None,
+                        help="Poll diagnostics from every ESPKey in the configuration, or a " \
+                        "comma-separated list of them, and alert on heap leaks, low heap, " \
+                        "voltage drops, line state changes and unreachable devices until " \
+                        "stopped with Ctrl-C. Alerts go to --stream sinks, stdout by default.")
+    parser.add_argument("--monitor-duration", type=float, default=None, help="Stop --monitor " \
+                        "after this many seconds.")
+    parser.add_argument("--monitor-interval", type=float, default=1.0, help="Seconds between " \
+                        "--monitor polls. Defaults to 1.")
+    parser.add_argument("--processes", type=positive_int, default=None, help="Split the " \
+                        "ESPKeys in a recipe or --analyze across this many processes. Overrides " \
+                        "the recipe's \"processes\" key.")
+    parser.add_argument("--profile", type=str, nargs="?", const="spans", default=None,
+                        help="Time each phase of the run (HTTP requests, log parsing, timestamp " \
+                        "reconstruction, serialization and writing) and write a trace and a " \
+                        "per-phase breakdown. Optionally add a comma-separated list of extra " \
+                        "profilers to run: cprofile, tracemalloc.")
+    parser.add_argument("--rate-limit", type=float, default=None, help="Maximum requests per " \
+                        "second to send to each ESPKey.")
     parser.add_argument("--recipe", type=str, default=None, help="Execute the specified recipe. " \
                         "This option is standalone. All configuration is derived from " \
                         "the recipe file.")
     parser.add_argument("--restart", action="store_true", help="Restart the ESPKey.")
+    parser.add_argument("--resume", action="store_true", help="Use with --recipe to continue " \
+                        "an interrupted run from its journal, skipping the tasks and actions " \
+                        "that already completed.")
     parser.add_argument("--send-weigand", type=str, help="Send weigand data with length in " \
-                        "format 0aabbcc:26 where there is a hex string and bit length to send.")
+                        "format 0aabbcc:26 where there is a hex string and bit length to send. " \
+                        "Data can also be encoded from a format: h10301:fc=77,cn=34302, " \
+                        "h10301:fc=77,cn=100-200 or keypad:pin=1234. Supported formats: " \
+                        f"{', '.join(WeigandEncoder.formats())}, keypad.")
+    parser.add_argument("--set-config", type=str, default=None, help="Upload the configuration " \
+                        "in this JSON file to the ESPKeys in --target that differ from it, then " \
+                        "read it back to verify. --target may be a comma-separated list or all.")
+    parser.add_argument("--merge-config", action="store_true", help="Use with --set-config to " \
+                        "only change the keys in the file and keep the rest of each ESPKey's " \
+                        "configuration.")
+    parser.add_argument("--restart-after", action="store_true", help="Use with --set-config to " \
+                        "restart ESPKeys whose configuration changed.")
+    parser.add_argument("--stream", type=str, action="append", default=[], help="Push each " \
+                        "new card read to an event stream as it's parsed. Used with --get-log, " \
+                        "--get-log-file and --recipe. May be given more than once. One of " \
+                        "stdout, unix:<socket path>, fifo:<named pipe path> or sse:<host>:<port>.")
     parser.add_argument("--target", type=str, default="default", help="Select ESPKey to use from " \
-                        "the configuration. Defaults to \"default\". Ignored if env vars are set.")
+                        "the configuration. Defaults to \"default\". Env vars configure this " \
+                        "ESPKey. Actions for several ESPKeys also take all or a comma-separated " \
+                        "list of names, tag:<tag> and group:<group>.")
+    parser.add_argument("--upgrade", type=str, default=None, help="Upgrade the firmware and " \
+                        "web UI files of the ESPKeys in --target from this manifest. ESPKeys " \
+                        "already at the manifest's firmware version are skipped. --target may " \
+                        "be a comma-separated list or all.")
+    parser.add_argument("--upgrade-state", type=str, default=None, help="Use with --upgrade " \
+                        "to record the files each ESPKey received in this file so an " \
+                        "interrupted upgrade resumes instead of starting over.")
+    parser.add_argument("--upgrade-workers", type=int, default=4, help="Use with --upgrade " \
+                        "to set the number of ESPKeys upgraded at the same time. Defaults to 4.")
+    parser.add_argument("--via-broker", type=str, default=None, help="Send ESPKey operations " \
+                        "through a --broker at this URL, for example http://127.0.0.1:8780, " \
+                        "instead of to the ESPKeys. Targets are still taken from the " \
+                        "configuration. The broker's token is read from EKA_BROKER_TOKEN.")
 
     args = parser.parse_args()
 
     try:
         action = process_args(args)
 
+        events_config = {}
+        for stream_spec in args.stream:
+            events_config.update(EventStream.parse_spec(stream_spec))
+
     except ValueError as e:
         print(f"{e}\n")
         parser.print_help()
+        exit(1)
+
+    if args.metrics_port is not None:
+        METRICS.serve(port=args.metrics_port)
+
+    # Profile the whole run.
+    profile_modes = []
+    cprofiler = None
+
+    if args.profile is not None:
+        profile_modes = args.profile.split(",")
+        PROFILER.enable()
+
+        if "tracemalloc" in profile_modes:
+            tracemalloc.start()
+
+        if "cprofile" in profile_modes:
+            cprofiler = cProfile.Profile()
+            cprofiler.enable()
 
     # Recipes are a special case.
     if action == "recipe":
-            rcp = Recipe(args.recipe)
+            rcp = Recipe(args.recipe, events=events_config, processes=args.processes,
+                         resume=args.resume)
             rcp.run()
 
+    # Log analytics only read files.
+    elif action == "analyze":
+        log_analytics = LogAnalytics(args.analyze, processes=args.processes or 1,
+                                     top=args.analyze_top)
+        summary = log_analytics.run()
+
+        if args.analyze_table:
+            print(LogAnalytics.format_tables(summary))
+
+        else:
+            print(json.dumps(summary))
+
+    # Archive queries only read recipe output files.
+    elif action == "archive":
+        archive_index = ArchiveIndex(args.archive)
+        archive_index.update()
+
+        if args.card is None and args.since is None and args.until is None:
+            print(json.dumps(archive_index.stats()))
+
+        else:
+            query_kwargs = {}
+
+            for query_arg in ["since", "until"]:
+                if getattr(args, query_arg) is not None:
+                    query_kwargs.update({
+                        query_arg: datetime.datetime.fromisoformat(getattr(args, query_arg))
+                    })
+
+            cards = [None]
+
+            if args.card is not None:
+                cards = WeigandEncoder.parse_spec(args.card)
+
+            matches = []
+
+            for card in cards:
+                matches.extend(archive_index.query(card=card, **query_kwargs))
+
+            print(json.dumps(matches))
+
+    # Find ESPKeys on the network.
+    elif action == "discover":
+        config_file = os.getenv("EKA_CONFIG_FILE", args.config)
+        credentials = {}
+
+        for item in ["web_user", "web_pass"]:
+            if os.getenv(f"EKA_{item.upper()}") is not None:
+                credentials.update({item: os.getenv(f"EKA_{item.upper()}")})
+
+        auth = None
+
+        if len(credentials) == 2:
+            auth = (credentials['web_user'], credentials['web_pass'])
+
+        discovery = Discovery(args.discover, timeout=args.discover_timeout, auth=auth,
+            ports=[int(port) for port in args.discover_ports.split(",")])
+        found = discovery.scan()
+
+        # Match against every ESPKey, including those in included inventory files.
+        configurator = Configurator(config_file if os.path.exists(config_file) else None)
+        config = configurator.configuration
+        merged_config, changes = Discovery.merge(config, found, credentials)
+
+        if args.discover_write and (changes['added'] or changes['updated']):
+            written = Discovery.write(merged_config, changes, config_file,
+                {target: configurator.source(target) for target in config})
+
+            for file_name in written:
+                print(f"Wrote configuration: {file_name}", file=sys.stderr)
+
+        print(json.dumps({"found": found, **changes}))
+
+    # Monitor the fleet.
+    elif action == "monitor":
+        espkeys = load_fleet(args, args.monitor)
+
+        # Alerts go to stdout unless other sinks were asked for.
+        event_stream = EventStream.from_config(events_config or {"stdout": True})
+        history_file = f"{datetime.datetime.utcnow().strftime('%Y%m%d-%H%M%S')}_monitor.jsonl"
+
+        try:
+            monitor = Monitor(espkeys, interval=args.monitor_interval, history_file=history_file,
+                event_stream=event_stream)
+            status = monitor.run(duration=args.monitor_duration)
+
+        finally:
+            event_stream.close()
+
+        print(json.dumps(status), file=sys.stderr)
+        print(f"Wrote monitor history: {history_file}", file=sys.stderr)
+
+    # Serve the fleet to other tools.
+    elif action == "broker":
+        configurator = load_configurator(args)
+
+        try:
+            target_names = configurator.resolve(args.broker)
+
+        except KeyError as e:
+            print(f"Error: {e.args[0]} Exiting.")
+            exit(1)
+
+        # Read endpoints are always cached by the broker.
+        cache_config = {"file": args.cache_file}
+
+        if args.cache_ttl is not None:
+            cache_config.update({"ttl": args.cache_ttl})
+
+        espkey_configs = {target: dict(target_config(args, configurator, target),
+                                       cache=cache_config) for target in target_names}
+
+        try:
+            broker = Broker(espkey_configs, host=args.broker_host, port=args.broker_port,
+                interval=args.broker_interval, token=os.getenv("EKA_BROKER_TOKEN"))
+
+        except ValueError as e:
+            print(f"Error: {e} Exiting.")
+            exit(1)
+
+        print(f"Serving {len(espkey_configs)} ESPKeys on " \
+              f"http://{args.broker_host}:{args.broker_port}", file=sys.stderr)
+
+        print(json.dumps(broker.run(duration=args.broker_duration)), file=sys.stderr)
+
+    # Push a configuration to one or more ESPKeys.
+    elif action == "set_config":
+        with open(args.set_config, "r") as f:
+            desired_config = json.loads(f.read())
+
+        config_push = ConfigPush(load_fleet(args, args.target))
+        results = config_push.run(desired_config, merge=args.merge_config,
+            restart=args.restart_after)
+
+        print(json.dumps({"summary": ConfigPush.summarize(results), "results": results}))
+
+    # Upgrade one or more ESPKeys.
+    elif action == "upgrade":
+        manifest = Upgrader.load_manifest(args.upgrade)
+        upgrader = Upgrader(load_fleet(args, args.target), manifest,
+            max_workers=args.upgrade_workers, state_file=args.upgrade_state)
+        results = upgrader.run()
+
+        print(json.dumps({"summary": Upgrader.summarize(results), "results": results}))
+
+    # Encoding doesn't need an ESPKey.
+    elif action == "encode_weigand":
+        frames = WeigandEncoder.parse_spec(args.encode_weigand)
+        print(json.dumps([f"{weigand_hex}:{bit_len}" for weigand_hex, bit_len in frames]))
+
     # Perform single action.
     else:
-        # Configuration
-        use_config = {}
-        env_var_prefix = "EKA"
-        config_file_override = os.getenv(f"{env_var_prefix}_CONFIG_FILE", args.config)
-        configurator = Configurator(env_var_prefix=env_var_prefix, config_file=config_file_override)
-        config = configurator.configuration
+        # Configuration, environment variables configure the target directly.
+        configurator = load_configurator(args, env_target=args.target)
+        use_config = target_config(args, configurator, args.target)
 
-        # Do we have the specified target?
-        if args.target in config:
-            use_config = config[args.target]
+        # Cache slow-changing responses if asked to.
+        if args.cache_file is not None or args.cache_ttl is not None:
+            use_config = dict(use_config)
+            cache_config = {"file": args.cache_file}
 
-        # Try to use environment variables alone.
-        else:
-            if 'base_url' in config:
-                use_config = config
+            if args.cache_ttl is not None:
+                cache_config.update({"ttl": args.cache_ttl})
 
-            else:
-                raise RuntimeError(f"No valid --target argument or {env_var_prefix}_BASE_URL env " \
-                                    "var set.")
+            use_config.update({"cache": cache_config})
 
         # Use specific configuration data.
-        ek = ESPKey(use_config)
+        ek = make_espkey(args, use_config)
 
         # Single action if/else stack.
         if action == "delete_log":
@@ -142,11 +586,19 @@ if __name__ == "__main__":
         elif action == "get_diagnostics":
             print(json.dumps(ek.get_diagnostics()))
 
-        elif action == "get_log":
-            print(json.dumps(ek.get_log()))
+        elif action in ["get_log", "get_log_file"]:
+            event_stream = EventStream.from_config(events_config)
+
+            try:
+                log_entries = ek.get_log(file_name=args.get_log_file, compact=True)
+                event_stream.publish_entries(args.target, log_entries)
+
+            finally:
+                event_stream.close()
 
-        elif action == "get_log_file":
-            print(json.dumps(ek.get_log(file_name=args.get_log_file)))
+            # Events written to stdout are the output, so the log goes to stderr beside them.
+            print(json.dumps(log_entries, default=LogEntry.json_default),
+                  file=sys.stderr if events_config.get('stdout') else sys.stdout)
 
         elif action == "get_version":
             print(json.dumps(ek.get_version()))
@@ -155,10 +607,30 @@ if __name__ == "__main__":
             print(json.dumps(ek.restart()))
 
         elif action == "send_weigand":
-            weigand_parts = args.send_weigand.split(":")
-            weigand_parts[1] = int(weigand_parts[1])
-            print(json.dumps(ek.send_weigand(weigand_parts[0], weigand_parts[1])))
+            frames = WeigandEncoder.parse_spec(args.send_weigand)
+
+            if len(frames) == 1:
+                print(json.dumps(ek.send_weigand(*frames[0])))
+
+            else:
+                print(json.dumps(ek.send_weigand_sequence(frames)))
 
         else:
             print("Invalid action. Please specify an action.\n")
             parser.print_help()
+
+    if args.profile is not None:
+        if cprofiler is not None:
+            cprofiler.disable()
+
+        # Profiles go next to recipe output, named the same way.
+        profile_name = f"{datetime.datetime.utcnow().strftime('%Y%m%d-%H%M%S')}_profile"
+
+        for file_name in PROFILER.write_report(profile_name, cprofile=cprofiler,
+                                               memory="tracemalloc" in profile_modes):
+            print(f"Wrote profile: {file_name}", file=sys.stderr)
+
+    if args.metrics_summary:
+        print(json.dumps(METRICS.summary(), indent=4), file=sys.stderr)
+
+    METRICS.stop()
@@ -1,3 +1,17 @@
+from .analytics import LogAnalytics
+from .archive_index import ArchiveIndex
+from .broker import Broker, BrokerClient
+from .config_push import ConfigPush
 from .configurator import Configurator
+from .correlator import Correlator
+from .dict_diff import dict_diff
+from .discovery import Discovery
 from .espkey import ESPKey
+from .event_stream import EventStream
+from .log_entry import LogEntry
+from .metrics import METRICS, MetricsRegistry
+from .monitor import DeviceTrend, Monitor
+from .profiler import PROFILER, Profiler
 from .recipe import Recipe
+from .upgrade import Upgrader
+from .weigand import WeigandEncoder
@@ -0,0 +1,344 @@
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import re
+
+from .espkey import ESPKey
+from .log_entry import LogEntry
+
+
+# Keypad presses further apart than this start a new PIN attempt.
+PIN_GAP_MS = 10000
+
+
+def _output_espkey(file_name):
+    """Find the ESPKey a recipe output file belongs to without parsing the whole file. The
+       metadata is always written after the actions.
+
+    Args:
+        file_name (str): Recipe output file.
+
+    Returns:
+        str, None: ESPKey name, or None if it couldn't be found.
+    """
+
+    with open(file_name, "rb") as f:
+        f.seek(max(0, os.path.getsize(file_name) - 4096))
+        tail = f.read().decode("utf-8", "replace")
+
+    metadata_idx = tail.rfind('"metadata"')
+
+    if metadata_idx == -1:
+        return None
+
+    espkey_match = re.search(r'"espkey":\s*("(?:[^"\\]|\\.)*")', tail[metadata_idx:])
+
+    if espkey_match is None:
+        return None
+
+    return json.loads(espkey_match.group(1))
+
+
+def _new_aggregate():
+    return {
+        "files": 0,
+        "entries": 0,
+        "reads": 0,
+        "credentials": Counter(),
+        # Reads by hour of the day, then reads without a timestamp.
+        "hours": [0] * 25,
+        "keypad_presses": 0,
+        "pins": Counter(),
+        "aux_toggles": 0,
+        "first_dts": None,
+        "last_dts": None
+    }
+
+
+def _file_entries(file_name, device):
+    """Read the log entries from a recipe output file or a raw log file. Recipe output files
+       are decoded one action at a time, so only one get_log result is held at once.
+
+    Args:
+        file_name (str): File name.
+        device (str): ESPKey name.
+
+    Yields:
+        list: Log entries of one log pull in the file.
+    """
+
+    if not file_name.endswith(".json"):
+        yield ESPKey({"name": device}).get_log(file_name=file_name, compact=True)
+        return
+
+    with open(file_name, "r") as f:
+        text = f.read()
+
+    actions_match = re.search(r'"actions":\s*\[', text)
+
+    if actions_match is None:
+        return
+
+    decoder = json.JSONDecoder()
+    cursor = actions_match.end()
+
+    while True:
+        while text[cursor].isspace() or text[cursor] == ",":
+            cursor += 1
+
+        if text[cursor] == "]":
+            break
+
+        action, cursor = decoder.raw_decode(text, cursor)
+
+        if action.get('action') == "get_log" and isinstance(action.get('result'), list):
+            yield action['result']
+
+
+def _analyze_device(device, file_names):
+    """Aggregate every log of one ESPKey. Entries that show up in more than one pull are only
+       counted once.
+
+    Args:
+        device (str): ESPKey name.
+        file_names (list): Files holding its logs, oldest first.
+
+    Returns:
+        dict: Aggregates for the ESPKey.
+    """
+
+    aggregate = _new_aggregate()
+    seen = set()
+    boots = []
+    pin = []
+    last_key_ms = None
+
+    for file_name in file_names:
+        aggregate['files'] += 1
+
+        for entries in _file_entries(file_name, device):
+            # Boots are identified by their start time so pulls that overlap agree on them.
+            boot_ids = LogEntry.boot_ids(entries, boots)
+
+            for entry, boot in zip(entries, boot_ids):
+                # Build the dict form of parsed entries once rather than per field lookup.
+                if isinstance(entry, LogEntry):
+                    entry = entry.to_dict()
+
+                time_raw = entry['time_raw']
+                data_hex = entry.get('data_hex')
+                entry_key = (boot, time_raw, data_hex or entry.get('log_msg'))
+
+                if entry_key in seen:
+                    continue
+
+                seen.add(entry_key)
+                aggregate['entries'] += 1
+
+                if data_hex is None:
+                    if entry.get('aux_status') is not None:
+                        aggregate['aux_toggles'] += 1
+
+                    continue
+
+                dts = entry.get('dts')
+
+                if dts is not None:
+                    if aggregate['first_dts'] is None or dts < aggregate['first_dts']:
+                        aggregate['first_dts'] = dts
+
+                    if aggregate['last_dts'] is None or dts > aggregate['last_dts']:
+                        aggregate['last_dts'] = dts
+
+                keys = entry.get('possible_hid_keypad')
+
+                # A gap, a reboot or a card read ends a PIN attempt.
+                if pin and (keys is None or last_key_ms is None or
+                            not 0 <= time_raw - last_key_ms <= PIN_GAP_MS):
+                    aggregate['pins'][''.join(pin)] += 1
+                    pin = []
+
+                if keys is None:
+                    aggregate['reads'] += 1
+                    aggregate['credentials'][f"{data_hex}:{entry['data_len']}"] += 1
+                    aggregate['hours'][24 if dts is None else int(dts[11:13])] += 1
+                    continue
+
+                aggregate['keypad_presses'] += len(keys)
+                last_key_ms = time_raw
+
+                for key in keys:
+                    if key == "#":
+                        if pin:
+                            aggregate['pins'][''.join(pin)] += 1
+                            pin = []
+
+                    else:
+                        pin.append(key)
+
+    if pin:
+        aggregate['pins'][''.join(pin)] += 1
+
+    return aggregate
+
+
+class LogAnalytics:
+    def __init__(self, paths, processes=1, top=20):
+        """Summarize logs across recipe output files and raw log files: credentials read per
+           ESPKey, reads by hour of the day, keypad PIN attempts and aux line toggles. Each
+           ESPKey's files are read once, and ESPKeys can be spread across processes.
+
+        Args:
+            paths (list): Recipe output files, raw log files, or directories of them.
+            processes (int, optional): Processes to spread ESPKeys across. Defaults to 1.
+            top (int, optional): Rows to keep in the credential and PIN tables. Defaults to 20.
+        """
+
+        self.__paths = paths
+        self.__processes = processes
+        self.__top = top
+
+
+    def __group_files(self):
+        """Find the files to analyze and group them by ESPKey. Raw log files are named after
+           their ESPKey.
+
+        Returns:
+            dict: ESPKey names mapped to file names, oldest first.
+        """
+
+        file_names = []
+
+        for path in self.__paths:
+            if os.path.isdir(path):
+                file_names.extend(os.path.join(path, name) for name in os.listdir(path)
+                                  if name.endswith((".json", ".txt", ".log")))
+
+            else:
+                file_names.append(path)
+
+        groups = {}
+
+        for file_name in sorted(file_names):
+            if file_name.endswith(".json"):
+                device = _output_espkey(file_name)
+
+                # Not a recipe output file.
+                if device is None:
+                    continue
+
+            else:
+                device = os.path.splitext(os.path.basename(file_name))[0]
+
+            groups.setdefault(device, []).append(file_name)
+
+        # Recipe outputs start with their run time, so name order is time order.
+        for device in groups:
+            groups[device].sort(key=os.path.basename)
+
+        return groups
+
+
+    def run(self):
+        """Analyze the logs.
+
+        Returns:
+            dict: Summary tables: "devices", "credentials", "hours" and "pins".
+        """
+
+        groups = self.__group_files()
+
+        if self.__processes > 1 and len(groups) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.__processes, len(groups))) as executor:
+                aggregates = dict(zip(groups, executor.map(_analyze_device, groups,
+                                                           groups.values())))
+
+        else:
+            aggregates = {device: _analyze_device(device, file_names)
+                          for device, file_names in groups.items()}
+
+        return self.__summarize(aggregates)
+
+
+    def __summarize(self, aggregates):
+        """Build summary tables from per-ESPKey aggregates.
+
+        Args:
+            aggregates (dict): ESPKey names mapped to aggregates.
+
+        Returns:
+            dict: Summary tables.
+        """
+
+        devices = []
+        credentials = Counter()
+        credential_devices = Counter()
+        pins = Counter()
+        pin_devices = Counter()
+        hours = [0] * 25
+
+        for device, aggregate in sorted(aggregates.items()):
+            devices.append({
+                "espkey": device,
+                "files": aggregate['files'],
+                "entries": aggregate['entries'],
+                "reads": aggregate['reads'],
+                "unique_credentials": len(aggregate['credentials']),
+                "keypad_presses": aggregate['keypad_presses'],
+                "pin_attempts": sum(aggregate['pins'].values()),
+                "aux_toggles": aggregate['aux_toggles'],
+                "first": aggregate['first_dts'],
+                "last": aggregate['last_dts']
+            })
+
+            credentials.update(aggregate['credentials'])
+            credential_devices.update(aggregate['credentials'].keys())
+            pins.update(aggregate['pins'])
+            pin_devices.update(aggregate['pins'].keys())
+
+            for hour, read_ct in enumerate(aggregate['hours']):
+                hours[hour] += read_ct
+
+        return {
+            "devices": devices,
+            "credentials": [{"credential": credential, "reads": read_ct,
+                             "espkeys": credential_devices[credential]}
+                            for credential, read_ct in credentials.most_common(self.__top)],
+            "hours": [{"hour": hour, "reads": read_ct}
+                      for hour, read_ct in enumerate(hours[:24])] +
+                     ([{"hour": None, "reads": hours[24]}] if hours[24] else []),
+            "pins": [{"pin": pin, "attempts": attempt_ct, "espkeys": pin_devices[pin]}
+                     for pin, attempt_ct in pins.most_common(self.__top)]
+        }
+
+
+    @staticmethod
+    def format_tables(summary):
+        """Render summary tables as aligned text.
+
+        Args:
+            summary (dict): Summary from run().
+
+        Returns:
+            str: Tables.
+        """
+
+        sections = []
+
+        for name, rows in summary.items():
+            if not rows:
+                continue
+
+            columns = list(rows[0])
+            cells = [columns] + [["" if row[column] is None else str(row[column])
+                                  for column in columns] for row in rows]
+            widths = [max(len(cell_row[idx]) for cell_row in cells)
+                      for idx in range(len(columns))]
+            lines = ["  ".join(cell.ljust(width) for cell, width in zip(cell_row, widths)).rstrip()
+                     for cell_row in cells]
+            lines.insert(1, "  ".join("-" * width for width in widths))
+
+            sections.append("\n".join([name] + lines))
+
+        return "\n\n".join(sections)
@@ -0,0 +1,505 @@
+from bisect import bisect_left
+import datetime
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+
+from .log_entry import EPOCH, LogEntry
+
+
+# Recipe output files: <YYYYMMDD-HHMMSS>_<espkey>_<task>[_<iteration>].json
+_OUTPUT_FILE_RE = re.compile(r"^[0-9]{8}-[0-9]{6}_.+\.json$")
+
+# Every binary index file starts with a magic number and a format version.
+_HEADER = struct.Struct("<4sI")
+_MAGIC = b"EKAI"
+_VERSION = 1
+
+# One get_log result: file id, action index, byte offset and length of the result list, first
+# and last entry times and the action's run time in microseconds since the Unix epoch, and the
+# entry count.
+_SEGMENT = struct.Struct("<IIQQqqqI")
+
+# One credential read in a segment, sorted by card hash: card hash, segment id.
+_CARD = struct.Struct("<QI")
+
+
+class _CardHashes:
+    def __init__(self, buffer):
+        """Read-only sequence of the card hashes in a memory-mapped card table, so it can be
+           binary searched without unpacking it.
+
+        Args:
+            buffer (mmap.mmap): Card table including its header.
+        """
+
+        self.__buffer = buffer
+        self.__len = (len(buffer) - _HEADER.size) // _CARD.size
+
+
+    def __len__(self):
+        return self.__len
+
+
+    def __getitem__(self, idx):
+        return _CARD.unpack_from(self.__buffer, _HEADER.size + (idx * _CARD.size))[0]
+
+
+class ArchiveIndex:
+    def __init__(self, archive_dir):
+        """Binary index over a directory of recipe output files. It records where each get_log
+           result sits in each file along with its time range and hashes of the credentials
+           read in it, so queries only read the slices of the files they need.
+
+           The index is kept in a .espkey_index directory inside the archive:
+           - files.json lists the indexed files with their size and mtime, ESPKey and task.
+           - segments.bin is a table of fixed-size get_log result records.
+           - cards.bin is a table of (card hash, segment) records sorted by hash.
+
+        Args:
+            archive_dir (str): Directory recipe output files are written to.
+        """
+
+        self.__archive_dir = archive_dir
+        self.__index_dir = os.path.join(archive_dir, ".espkey_index")
+
+
+    @staticmethod
+    def card_hash(data_hex, data_len):
+        """Hash a credential read. Leading zeros and case in the hex data don't matter.
+
+        Args:
+            data_hex (str): Weigand data as hex.
+            data_len (int): Weigand data length in bits.
+
+        Returns:
+            int: Unsigned 64-bit hash.
+        """
+
+        card_key = f"{int(data_hex, 16):x}:{data_len}".encode()
+
+        return int.from_bytes(hashlib.blake2b(card_key, digest_size=8).digest(), "little")
+
+
+    @staticmethod
+    def __iso_to_us(iso_dts):
+        """Convert an ISO-8601 timestamp written by the automator to microseconds since the
+           Unix epoch.
+
+        Args:
+            iso_dts (str): Naive UTC timestamp.
+
+        Returns:
+            int: Microseconds since the Unix epoch.
+        """
+
+        return LogEntry.dts_to_us(datetime.datetime.fromisoformat(iso_dts))
+
+
+    def __index_path(self, name):
+        return os.path.join(self.__index_dir, name)
+
+
+    def __read_table(self, name, record):
+        """Read every record in a binary table.
+
+        Args:
+            name (str): Table file name.
+            record (struct.Struct): Record layout.
+
+        Returns:
+            list: Record tuples. Missing or incompatible tables are empty.
+        """
+
+        try:
+            with open(self.__index_path(name), "rb") as f:
+                table = f.read()
+
+        except FileNotFoundError:
+            return []
+
+        if len(table) < _HEADER.size or _HEADER.unpack_from(table) != (_MAGIC, _VERSION):
+            return []
+
+        return list(record.iter_unpack(memoryview(table)[_HEADER.size:]))
+
+
+    def __write_file(self, name, data):
+        """Write an index file atomically so readers never see a partial file.
+
+        Args:
+            name (str): Index file name.
+            data (bytes): File contents.
+        """
+
+        fd, tmp_name = tempfile.mkstemp(dir=self.__index_dir, prefix=".tmp")
+
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+
+        os.replace(tmp_name, self.__index_path(name))
+
+
+    def __write_table(self, name, record, rows):
+        """Write a binary table.
+
+        Args:
+            name (str): Table file name.
+            record (struct.Struct): Record layout.
+            rows (list): Record tuples.
+        """
+
+        table = bytearray(_HEADER.pack(_MAGIC, _VERSION))
+
+        for row in rows:
+            table += record.pack(*row)
+
+        self.__write_file(name, bytes(table))
+
+
+    def __load_files(self):
+        """Load the list of indexed files.
+
+        Returns:
+            list: Indexed file dicts, the position in the list is the file id.
+        """
+
+        try:
+            with open(self.__index_path("files.json"), "r") as f:
+                return json.loads(f.read())
+
+        except (FileNotFoundError, ValueError):
+            return []
+
+
+    def __scan_file(self, file_name):
+        """Find the get_log results in a recipe output file. The automator writes ASCII-only
+           JSON so character offsets are byte offsets.
+
+        Args:
+            file_name (str): Output file name in the archive.
+
+        Returns:
+            tuple(dict, list): File metadata, or None if it isn't a task output file, and a list
+                of (segment record without file id, card hashes) tuples.
+        """
+
+        with open(os.path.join(self.__archive_dir, file_name), "r", encoding="ascii",
+                  errors="replace") as f:
+            text = f.read()
+
+        decoder = json.JSONDecoder()
+        segments = []
+
+        actions_match = re.search(r'"actions":\s*\[', text)
+
+        if actions_match is None:
+            return (None, [])
+
+        cursor = actions_match.end()
+        action_idx = 0
+
+        # Walk the actions array one object at a time to get each object's span.
+        while True:
+            while text[cursor].isspace() or text[cursor] == ",":
+                cursor += 1
+
+            if text[cursor] == "]":
+                break
+
+            action_start = cursor
+            action, cursor = decoder.raw_decode(text, cursor)
+
+            if action.get('action') == "get_log" and isinstance(action.get('result'), list):
+                # The result is the last key of a get_log action.
+                result_start = text.index('"result":', action_start, cursor) + len('"result":')
+
+                while text[result_start].isspace():
+                    result_start += 1
+
+                result_end = cursor - 1
+
+                while text[result_end - 1].isspace():
+                    result_end -= 1
+
+                run_us = self.__iso_to_us(action['run'])
+                entry_us = [self.__iso_to_us(entry['dts']) for entry in action['result']
+                            if 'dts' in entry]
+                card_hashes = {self.card_hash(entry['data_hex'], entry['data_len'])
+                               for entry in action['result'] if 'data_hex' in entry}
+
+                segments.append(((action_idx, result_start, result_end - result_start,
+                                  min(entry_us, default=run_us), max(entry_us, default=run_us),
+                                  run_us, len(action['result'])), card_hashes))
+
+            action_idx += 1
+
+        metadata_match = re.search(r'"metadata":\s*', text[cursor:])
+
+        if metadata_match is None:
+            return (None, [])
+
+        metadata = decoder.raw_decode(text, cursor + metadata_match.end())[0]
+
+        # The task name is whatever is left between the ESPKey name and the iteration.
+        prefix = f"{file_name[:15]}_{metadata['espkey']}_"
+        task = file_name[len(prefix):-len(".json")] if file_name.startswith(prefix) else None
+
+        if task is not None and 'iteration' in metadata:
+            task = task[:-len(f"_{metadata['iteration']}")]
+
+        file_meta = {
+            "espkey": metadata['espkey'],
+            "task": task,
+            "run_start": metadata['run_start']
+        }
+
+        return (file_meta, segments)
+
+
+    def update(self):
+        """Bring the index up to date with the archive. Only files that are new or changed
+           since the last update are read.
+
+        Returns:
+            dict: Counts of "indexed", "unchanged" and "removed" files.
+        """
+
+        os.makedirs(self.__index_dir, exist_ok=True)
+
+        old_files = self.__load_files()
+        old_segments = self.__read_table("segments.bin", _SEGMENT)
+        old_cards = self.__read_table("cards.bin", _CARD)
+
+        # Group existing records by file so unchanged files can be carried over.
+        old_segment_cards = [(segment[1:], set()) for segment in old_segments]
+
+        for card_hash, segment_id in old_cards:
+            if segment_id < len(old_segment_cards):
+                old_segment_cards[segment_id][1].add(card_hash)
+
+        old_by_name = {file_meta['name']: (file_meta, []) for file_meta in old_files}
+
+        for segment, segment_cards in zip(old_segments, old_segment_cards):
+            if segment[0] < len(old_files):
+                old_by_name[old_files[segment[0]]['name']][1].append(segment_cards)
+
+        counts = {"indexed": 0, "unchanged": 0, "removed": 0}
+        files = []
+        segments = []
+        cards = []
+
+        for file_name in sorted(os.listdir(self.__archive_dir)):
+            if not _OUTPUT_FILE_RE.match(file_name):
+                continue
+
+            file_stat = os.stat(os.path.join(self.__archive_dir, file_name))
+            old = old_by_name.pop(file_name, None)
+
+            if old is not None and old[0]['size'] == file_stat.st_size and \
+               old[0]['mtime_ns'] == file_stat.st_mtime_ns:
+                file_meta, file_segments = old
+                counts['unchanged'] += 1
+
+            else:
+                try:
+                    scanned_meta, file_segments = self.__scan_file(file_name)
+
+                # Files that aren't task outputs are remembered so they aren't read again.
+                except (ValueError, KeyError, IndexError, TypeError):
+                    scanned_meta, file_segments = (None, [])
+
+                file_meta = {
+                    "name": file_name,
+                    "size": file_stat.st_size,
+                    "mtime_ns": file_stat.st_mtime_ns
+                }
+
+                if scanned_meta is not None:
+                    file_meta.update(scanned_meta)
+
+                counts['indexed'] += 1
+
+            file_id = len(files)
+            files.append(file_meta)
+
+            for segment, card_hashes in file_segments:
+                segment_id = len(segments)
+                segments.append((file_id,) + tuple(segment))
+                cards.extend((card_hash, segment_id) for card_hash in card_hashes)
+
+        counts['removed'] = len(old_by_name)
+
+        cards.sort()
+
+        self.__write_table("segments.bin", _SEGMENT, segments)
+        self.__write_table("cards.bin", _CARD, cards)
+        self.__write_file("files.json", json.dumps(files).encode())
+
+        return counts
+
+
+    def __open_table(self, name):
+        """Memory-map a binary table.
+
+        Args:
+            name (str): Table file name.
+
+        Returns:
+            mmap.mmap, bytes: Mapped table, or an empty table if it doesn't exist yet.
+        """
+
+        try:
+            with open(self.__index_path(name), "rb") as f:
+                table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        except (FileNotFoundError, ValueError):
+            return _HEADER.pack(_MAGIC, _VERSION)
+
+        if _HEADER.unpack_from(table) != (_MAGIC, _VERSION):
+            table.close()
+            raise ValueError(f"Unsupported index format in {self.__index_path(name)}. " \
+                "Delete the index directory to rebuild it.")
+
+        return table
+
+
+    def __read_segment(self, file_name, offset, length):
+        """Read one get_log result from an output file.
+
+        Args:
+            file_name (str): Output file name in the archive.
+            offset (int): Byte offset of the result.
+            length (int): Byte length of the result.
+
+        Returns:
+            list: Log entry dicts.
+        """
+
+        with open(os.path.join(self.__archive_dir, file_name), "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+                return json.loads(file_map[offset:offset + length])
+
+
+    def query(self, card=None, since=None, until=None):
+        """Find log entries in the archive. Entries without a reconstructed timestamp are
+           matched on the time the get_log action ran.
+
+        Args:
+            card (tuple, optional): (hex string, bit length) of a credential to find. Defaults to
+                                    None which matches every entry.
+            since (datetime.datetime, optional): Earliest naive UTC time to match. Defaults to
+                                                 None.
+            until (datetime.datetime, optional): Latest naive UTC time to match. Defaults to
+                                                 None.
+
+        Returns:
+            list: Dicts with "file", "espkey", "task", "run" and the matching "entry".
+        """
+
+        files = self.__load_files()
+        since_us = None if since is None else LogEntry.dts_to_us(since)
+        until_us = None if until is None else LogEntry.dts_to_us(until)
+        card_int = None
+        matches = []
+
+        segment_table = self.__open_table("segments.bin")
+        card_table = self.__open_table("cards.bin")
+
+        try:
+            segment_ct = (len(segment_table) - _HEADER.size) // _SEGMENT.size
+
+            # Narrow down to segments containing the card with a binary search.
+            if card is not None:
+                card_int = int(card[0], 16)
+                card_hash = self.card_hash(*card)
+                card_hashes = _CardHashes(card_table)
+                segment_ids = []
+                card_idx = bisect_left(card_hashes, card_hash)
+
+                while card_idx < len(card_hashes) and card_hashes[card_idx] == card_hash:
+                    segment_ids.append(_CARD.unpack_from(card_table,
+                        _HEADER.size + (card_idx * _CARD.size))[1])
+                    card_idx += 1
+
+                segment_ids.sort()
+
+            else:
+                segment_ids = range(segment_ct)
+
+            for segment_id in segment_ids:
+                file_id, action_idx, offset, length, first_us, last_us, run_us, entry_ct = \
+                    _SEGMENT.unpack_from(segment_table, _HEADER.size + (segment_id * _SEGMENT.size))
+
+                # Skip segments entirely outside the time range.
+                if (since_us is not None and max(last_us, run_us) < since_us) or \
+                   (until_us is not None and min(first_us, run_us) > until_us):
+                    continue
+
+                file_meta = files[file_id]
+                run = EPOCH + datetime.timedelta(microseconds=run_us)
+
+                for entry in self.__read_segment(file_meta['name'], offset, length):
+                    if card_int is not None and ('data_hex' not in entry or
+                       int(entry['data_hex'], 16) != card_int or
+                       entry['data_len'] != card[1]):
+                        continue
+
+                    entry_us = self.__iso_to_us(entry['dts']) if 'dts' in entry else run_us
+
+                    if (since_us is not None and entry_us < since_us) or \
+                       (until_us is not None and entry_us > until_us):
+                        continue
+
+                    matches.append({
+                        "file": file_meta['name'],
+                        "espkey": file_meta.get('espkey'),
+                        "task": file_meta.get('task'),
+                        "run": run.isoformat(),
+                        "entry": entry
+                    })
+
+        finally:
+            for table in [segment_table, card_table]:
+                if isinstance(table, mmap.mmap):
+                    table.close()
+
+        return matches
+
+
+    def stats(self):
+        """Summarize what's in the index.
+
+        Returns:
+            dict: File, segment and card read counts, ESPKeys and the time range covered.
+        """
+
+        files = self.__load_files()
+        segments = self.__read_table("segments.bin", _SEGMENT)
+        cards = self.__read_table("cards.bin", _CARD)
+
+        stats = {
+            "files": len(files),
+            "get_log_results": len(segments),
+            "entries": sum(segment[7] for segment in segments),
+            "cards": len({card_hash for card_hash, _ in cards}),
+            "espkeys": sorted({file_meta['espkey'] for file_meta in files
+                               if 'espkey' in file_meta}),
+            "first": None,
+            "last": None
+        }
+
+        if segments:
+            first_us = min(segment[4] for segment in segments)
+            last_us = max(segment[5] for segment in segments)
+
+            stats.update({
+                "first": (EPOCH + datetime.timedelta(microseconds=first_us)).isoformat(),
+                "last": (EPOCH + datetime.timedelta(microseconds=last_us)).isoformat()
+            })
+
+        return stats
@@ -0,0 +1,598 @@
+from concurrent.futures import ThreadPoolExecutor
+import hmac
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import ipaddress
+import json
+import threading
+import time
+from urllib.parse import parse_qs, quote, urlsplit
+
+import requests
+
+from .espkey import ESPKey
+from .log_entry import LogEntry
+from .metrics import METRICS
+from .single_flight import SingleFlight
+
+
+class LogMirror:
+    def __init__(self, max_entries=100000):
+        """Local copy of an ESPKey's log that only grows by the entries added since the last
+           pull. Entries are numbered from when the mirror started so clients can ask for what
+           they haven't seen yet.
+
+        Args:
+            max_entries (int, optional): Entries to keep. The oldest are dropped past this.
+                                         Defaults to 100000.
+        """
+
+        self.__max_entries = max_entries
+        self.__lock = threading.Lock()
+        self.__entries = []
+
+        # Position of the first kept entry, and of the first entry in the ESPKey's current log.
+        self.__base = 0
+        self.__log_start = 0
+
+        # Entries in the ESPKey's log at the last pull and the first of them.
+        self.__device_count = 0
+        self.__device_first = None
+
+        self.updated = None
+        self.error = None
+
+
+    @staticmethod
+    def __entry_id(entry):
+        return (entry.time_raw, entry.data_hex, entry.log_msg, entry.aux_status)
+
+
+    def update(self, entries):
+        """Add the entries from a new pull of the ESPKey's log. The ESPKey only appends to its
+           log, so if it still starts the same way only entries past the last pull are new.
+
+        Args:
+            entries (list): LogEntry objects in log order.
+        """
+
+        with self.__lock:
+            end = self.__base + len(self.__entries)
+
+            if entries and self.__device_first == self.__entry_id(entries[0]) and \
+               len(entries) >= self.__device_count:
+                new_entries = entries[self.__device_count:]
+
+            else:
+                # The log was deleted or replaced.
+                new_entries = entries
+                self.__log_start = end
+
+            self.__entries.extend(new_entries)
+            self.__device_count = len(entries)
+            self.__device_first = self.__entry_id(entries[0]) if entries else None
+
+            overflow = len(self.__entries) - self.__max_entries
+
+            if overflow > 0:
+                del self.__entries[:overflow]
+                self.__base += overflow
+
+            self.updated = time.monotonic()
+            self.error = None
+
+
+    def reset(self):
+        """Note that the ESPKey's log was deleted so the next pull starts a new log.
+        """
+
+        with self.__lock:
+            self.__device_count = 0
+            self.__device_first = None
+
+
+    def read(self, since=None):
+        """Get mirrored entries.
+
+        Args:
+            since (int, optional): Position to read from. Defaults to None which reads the
+                                   ESPKey's current log.
+
+        Returns:
+            dict: "entries", the "start" position they begin at and the "next" position to
+                  read from.
+        """
+
+        with self.__lock:
+            end = self.__base + len(self.__entries)
+            start = self.__log_start if since is None else since
+            start = min(max(start, self.__base), end)
+
+            return {
+                "entries": self.__entries[start - self.__base:],
+                "start": start,
+                "next": end
+            }
+
+
+    def status(self):
+        with self.__lock:
+            return {
+                "entries": len(self.__entries),
+                "next": self.__base + len(self.__entries),
+                "age_sec": None if self.updated is None else
+                           round(time.monotonic() - self.updated, 3),
+                "error": self.error
+            }
+
+
+class Broker:
+    # Operations clients can read with GET, and the ones with side effects sent with POST.
+    READ_OPERATIONS = ["get_config", "get_diagnostics", "get_version", "log"]
+    WRITE_OPERATIONS = ["delete_log", "restart", "send_weigand", "set_config"]
+
+
+    def __init__(self, espkey_configs, host="127.0.0.1", port=8780, interval=5.0,
+                 mirror_max=100000, token=None):
+        """Local service the rest of the tools can use instead of talking to ESPKeys directly.
+           Each ESPKey gets one ESPKey object, so one pool of kept-alive connections, and only
+           one request is sent to it at a time. Identical reads that arrive while one is in
+           flight share its response, version and configuration responses are cached as
+           configured, and each ESPKey's log is pulled on an interval into a mirror that
+           clients read from. With a token every request must send it as a bearer token.
+           Without one only reads are served, and only on a loopback address.
+
+        Args:
+            espkey_configs (dict): ESPKey names mapped to their configuration.
+            host (str, optional): Address to listen on. Defaults to "127.0.0.1".
+            port (int, optional): Port to listen on. Defaults to 8780.
+            interval (int, float, optional): Seconds between log pulls. Defaults to 5.
+            mirror_max (int, optional): Log entries to keep for each ESPKey. Defaults to 100000.
+            token (str, optional): Token clients must send. Defaults to None.
+
+        Raises:
+            ValueError: The broker would listen beyond loopback without a token.
+        """
+
+        try:
+            loopback = ipaddress.ip_address(host).is_loopback
+
+        except ValueError:
+            loopback = host == "localhost"
+
+        # The broker sends requests with the ESPKeys' credentials, so don't hand them out.
+        if not loopback and not token:
+            raise ValueError(f"A broker token is required to listen on {host}.")
+
+        self.__espkeys = {name: ESPKey(config) for name, config in espkey_configs.items()}
+        self.__device_locks = {name: threading.Lock() for name in self.__espkeys}
+        self.__mirrors = {name: LogMirror(mirror_max) for name in self.__espkeys}
+        self.__in_flight = SingleFlight()
+        self.__host = host
+        self.__port = port
+        self.__interval = interval
+        self.__stop_event = threading.Event()
+        self.__token = token
+
+
+    def authorized(self, authorization):
+        """Check a request's Authorization header against the token.
+
+        Args:
+            authorization (str, None): Authorization header.
+
+        Returns:
+            bool: True if no token is required or the header has it.
+        """
+
+        if not self.__token:
+            return True
+
+        return hmac.compare_digest((authorization or "").encode(),
+                                   f"Bearer {self.__token}".encode())
+
+
+    @property
+    def writable(self):
+        """Are write operations allowed? They need a token.
+        """
+
+        return bool(self.__token)
+
+
+    def __call(self, name, operation, *call_args, coalesce=False):
+        """Run an ESPKey method while holding the ESPKey's lock.
+
+        Args:
+            name (str): ESPKey name.
+            operation (str): ESPKey method name.
+            *call_args: Arguments for the method.
+            coalesce (bool, optional): Share the result with identical calls made while it
+                                       runs. Defaults to False.
+
+        Returns:
+            object: What the method returned.
+        """
+
+        def call():
+            with self.__device_locks[name]:
+                return getattr(self.__espkeys[name], operation)(*call_args)
+
+        if coalesce:
+            return self.__in_flight.do((name, operation, call_args), call)[0]
+
+        return call()
+
+
+    def __pull_log(self, name):
+        """Pull an ESPKey's log into its mirror.
+
+        Args:
+            name (str): ESPKey name.
+        """
+
+        try:
+            self.__mirrors[name].update(self.__call(name, "get_log", None, True, coalesce=True))
+
+        except (requests.RequestException, RuntimeError, ValueError) as e:
+            self.__mirrors[name].error = str(e)
+
+
+    def log(self, name, since=None, max_age=None):
+        """Read an ESPKey's mirrored log, pulling it first if the mirror is too old.
+
+        Args:
+            name (str): ESPKey name.
+            since (int, optional): Position to read from. Defaults to None which reads the
+                                   ESPKey's current log.
+            max_age (int, float, optional): Seconds old the mirror can be. Defaults to None
+                                            which uses the pull interval.
+
+        Raises:
+            RuntimeError: The log couldn't be pulled.
+
+        Returns:
+            dict: Entries and positions from LogMirror.read().
+        """
+
+        mirror = self.__mirrors[name]
+        max_age = self.__interval if max_age is None else max_age
+
+        if mirror.updated is None or time.monotonic() - mirror.updated > max_age:
+            self.__pull_log(name)
+
+            if mirror.error is not None:
+                raise RuntimeError(mirror.error)
+
+        return mirror.read(since)
+
+
+    def handle(self, name, operation, body=None):
+        """Run an API operation against an ESPKey.
+
+        Args:
+            name (str): ESPKey name.
+            operation (str): get_version, get_config, get_diagnostics, restart, delete_log,
+                             send_weigand or set_config.
+            body (dict, optional): Operation arguments. Defaults to None.
+
+        Raises:
+            KeyError: The operation isn't supported or an argument is missing from body.
+
+        Returns:
+            object: Operation result.
+        """
+
+        body = body or {}
+
+        if operation in ["get_version", "get_config", "get_diagnostics"]:
+            return self.__call(name, operation, coalesce=True)
+
+        if operation == "restart":
+            return self.__call(name, "restart")
+
+        if operation == "delete_log":
+            deleted = self.__call(name, "delete_log", body.get('post_method', False))
+
+            if deleted:
+                self.__mirrors[name].reset()
+
+            return deleted
+
+        if operation == "send_weigand":
+            frames = [tuple(frame) for frame in body['frames']]
+
+            if len(frames) == 1 and not body.get('sequence'):
+                return self.__call(name, "send_weigand", *frames[0])
+
+            return self.__call(name, "send_weigand_sequence", frames, body.get('rate'),
+                               body.get('verify_log', False))
+
+        if operation == "set_config":
+            return self.__call(name, "set_config", body['config'], body.get('merge', False),
+                               body.get('verify', True), body.get('restart', False))
+
+        raise KeyError(operation)
+
+
+    def status(self):
+        """Mirror status for every ESPKey.
+
+        Returns:
+            dict: ESPKey names mapped to their mirror's entry count, next position, age and
+                  last error.
+        """
+
+        return {name: mirror.status() for name, mirror in self.__mirrors.items()}
+
+
+    def __serve(self):
+        """Start the JSON API in a background thread.
+
+        Returns:
+            ThreadingHTTPServer: The server.
+        """
+
+        broker = self
+
+        class BrokerHandler(BaseHTTPRequestHandler):
+            # Keep client connections open between requests.
+            protocol_version = "HTTP/1.1"
+
+
+            def log_message(self, format, *args):
+                pass
+
+
+            def __respond(self, status, data, content_type="application/json"):
+                if content_type == "application/json":
+                    data = json.dumps(data, default=LogEntry.json_default,
+                                      separators=(",", ":")).encode()
+
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+
+            def __route(self, method):
+                url = urlsplit(self.path)
+                parts = [part for part in url.path.split("/") if part]
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+
+                if not broker.authorized(self.headers.get("Authorization")):
+                    self.__respond(401, {"error": "A valid broker token is required."})
+                    return
+
+                if method == "GET" and parts == ["metrics"]:
+                    self.__respond(200, METRICS.render().encode(),
+                                   "text/plain; version=0.0.4; charset=utf-8")
+                    return
+
+                if method == "GET" and parts == ["espkeys"]:
+                    self.__respond(200, broker.status())
+                    return
+
+                if len(parts) != 3 or parts[0] != "espkeys" or parts[1] not in broker.status():
+                    self.__respond(404, {"error": "Not found."})
+                    return
+
+                name, operation = parts[1:]
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+                operations = Broker.READ_OPERATIONS if method == "GET" else \
+                             Broker.WRITE_OPERATIONS
+
+                if operation not in operations:
+                    self.__respond(404, {"error": f"Unknown {method} operation {operation}."})
+                    return
+
+                if method == "POST" and not broker.writable:
+                    self.__respond(403, {"error": "Write operations need a broker token."})
+                    return
+
+                try:
+                    if operation == "log":
+                        since = int(query['since']) if 'since' in query else None
+                        max_age = float(query['max_age']) if 'max_age' in query else None
+                        result = broker.log(name, since=since, max_age=max_age)
+
+                    else:
+                        arguments = json.loads(body or b"{}")
+
+                        if not isinstance(arguments, dict):
+                            raise ValueError("The request body must be a JSON object.")
+
+                        result = broker.handle(name, operation, arguments)
+
+                except KeyError as e:
+                    self.__respond(400, {"error": f"Missing {e.args[0]}."})
+                    return
+
+                except (TypeError, ValueError) as e:
+                    self.__respond(400, {"error": str(e)})
+                    return
+
+                except (requests.RequestException, RuntimeError) as e:
+                    self.__respond(502, {"error": str(e)})
+                    return
+
+                self.__respond(200, {"result": result})
+
+
+            def do_GET(self):
+                self.__route("GET")
+
+
+            def do_POST(self):
+                self.__route("POST")
+
+        server = ThreadingHTTPServer((self.__host, self.__port), BrokerHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        return server
+
+
+    def run(self, duration=None):
+        """Serve the API and keep the log mirrors up to date until stop() is called or the
+           duration passes.
+
+        Args:
+            duration (int, float, optional): Seconds to run. Defaults to None which runs until
+                                             stop() is called or the user hits Ctrl-C.
+
+        Returns:
+            dict: Final status from status().
+        """
+
+        deadline = None if duration is None else time.monotonic() + duration
+        server = self.__serve()
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(32, max(1, len(self.__espkeys)))) \
+                 as executor:
+                while not self.__stop_event.is_set():
+                    cycle_start = time.monotonic()
+
+                    list(executor.map(self.__pull_log, self.__espkeys))
+
+                    if deadline is not None and time.monotonic() >= deadline:
+                        break
+
+                    self.__stop_event.wait(max(0, self.__interval -
+                                               (time.monotonic() - cycle_start)))
+
+        # Ctrl-C is the normal way to stop the broker.
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        return self.status()
+
+
+    def stop(self):
+        """Stop the broker after the current pull cycle.
+        """
+
+        self.__stop_event.set()
+
+
+class BrokerClient:
+    def __init__(self, config):
+        """Stand-in for ESPKey that sends operations through a Broker instead of to the ESPKey.
+
+        Args:
+            config (dict): ESPKey "name" and the "broker" URL, for example
+                           "http://127.0.0.1:8780". Optional keys: "broker_token" to send,
+                           "broker_max_age" for how many seconds old a mirrored log can be and
+                           "broker_timeout" for the seconds to wait for the broker to connect
+                           and respond, as one number or a [connect, read] pair.
+        """
+
+        self.__config = config
+        self.__url = f"{config['broker'].rstrip('/')}/espkeys/{quote(config['name'], safe='')}"
+        self.__session = requests.Session()
+
+        # Requests can wait behind others for the same ESPKey, so allow longer than one request.
+        self.__timeout = config.get('broker_timeout', (5, 120))
+
+        if isinstance(self.__timeout, list):
+            self.__timeout = tuple(self.__timeout)
+
+        if config.get('broker_token'):
+            self.__session.headers.update({"Authorization": f"Bearer {config['broker_token']}"})
+
+
+    def __request(self, method, operation, body=None, params=None):
+        """Send an operation to the broker.
+
+        Args:
+            method (str): HTTP method.
+            operation (str): Broker operation.
+            body (dict, optional): Operation arguments. Defaults to None.
+            params (dict, optional): Query parameters. Defaults to None.
+
+        Raises:
+            RuntimeError: The broker or the ESPKey returned an error.
+
+        Returns:
+            object: Operation result.
+        """
+
+        r = self.__session.request(method, f"{self.__url}/{operation}", json=body, params=params,
+                                   timeout=self.__timeout)
+
+        try:
+            response = r.json()
+
+        except ValueError:
+            raise RuntimeError(f"HTTP status: {r.status_code}")
+
+        if r.status_code != 200:
+            raise RuntimeError(response.get('error', f"HTTP status: {r.status_code}"))
+
+        return response['result']
+
+
+    def delete_log(self, post_method=False):
+        return self.__request("POST", "delete_log", {"post_method": post_method})
+
+
+    def get_config(self):
+        return self.__request("GET", "get_config")
+
+
+    def set_config(self, config, merge=False, verify=True, restart=False):
+        return self.__request("POST", "set_config", {"config": config, "merge": merge,
+                                                     "verify": verify, "restart": restart})
+
+
+    def get_diagnostics(self):
+        return self.__request("GET", "get_diagnostics")
+
+
+    def get_log(self, file_name=None, compact=False):
+        """Get the ESPKey's log from the broker's mirror. Log files are parsed locally.
+
+        Args:
+            file_name (str, optional): Optional text log file. Defaults to None.
+            compact (bool, optional): Return LogEntry objects for log files. Entries from the
+                                      broker are always dicts. Defaults to False.
+
+        Returns:
+            list: Log entries.
+        """
+
+        if file_name:
+            return ESPKey({"name": self.__config['name']}).get_log(file_name=file_name,
+                                                                    compact=compact)
+
+        params = {}
+
+        if self.__config.get('broker_max_age') is not None:
+            params.update({"max_age": self.__config['broker_max_age']})
+
+        return self.__request("GET", "log", params=params)['entries']
+
+
+    def get_version(self):
+        return self.__request("GET", "get_version")
+
+
+    def restart(self):
+        return self.__request("POST", "restart")
+
+
+    def send_weigand(self, weigand_hex, bit_len):
+        return self.__request("POST", "send_weigand", {"frames": [[weigand_hex, bit_len]]})
+
+
+    def send_weigand_sequence(self, frames, rate=None, verify_log=False):
+        return self.__request("POST", "send_weigand", {"frames": [list(frame) for frame in frames],
+                                                       "sequence": True, "rate": rate,
+                                                       "verify_log": verify_log})
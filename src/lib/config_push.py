@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ConfigPush:
+    def __init__(self, espkeys, max_workers=16):
+        """Distribute a configuration to many ESPKeys at once. Only ESPKeys whose current
+           configuration differs are uploaded to. Per-ESPKey rate limits come from each
+           ESPKey's "rate_limit" setting.
+
+        Args:
+            espkeys (dict): ESPKey name mapped to ESPKey object.
+            max_workers (int, optional): ESPKeys to push to at the same time. Defaults to 16.
+        """
+
+        self.__espkeys = espkeys
+        self.__max_workers = max_workers
+
+
+    def __push_one(self, name, config, set_config_kwargs):
+        """Push to a single ESPKey, capturing errors so one failure doesn't stop the others.
+
+        Args:
+            name (str): ESPKey name.
+            config (dict): Desired configuration.
+            set_config_kwargs (dict): Keyword arguments for ESPKey.set_config().
+
+        Returns:
+            dict: Result from ESPKey.set_config() or a dict with an "error".
+        """
+
+        try:
+            return self.__espkeys[name].set_config(config, **set_config_kwargs)
+
+        except Exception as e:
+            return {"changed": False, "error": str(e)}
+
+
+    def run(self, config, merge=False, verify=True, restart=False):
+        """Push the configuration to every ESPKey.
+
+        Args:
+            config (dict): Desired configuration.
+            merge (bool, optional): Only set the keys in config. Defaults to False.
+            verify (bool, optional): Read each configuration back after uploading it. Defaults
+                                     to True.
+            restart (bool, optional): Restart ESPKeys that changed. Defaults to False.
+
+        Returns:
+            dict: ESPKey name mapped to its result.
+        """
+
+        set_config_kwargs = {"merge": merge, "verify": verify, "restart": restart}
+        names = list(self.__espkeys)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.__max_workers, len(names)))) \
+             as executor:
+            results = executor.map(lambda name: self.__push_one(name, config, set_config_kwargs),
+                                   names)
+
+            return dict(zip(names, results))
+
+
+    @staticmethod
+    def summarize(results):
+        """Count the outcome of a push.
+
+        Args:
+            results (dict): Results from run().
+
+        Returns:
+            dict: Counts of ESPKeys that were "unchanged", "changed", "verified" and "failed".
+        """
+
+        summary = {"unchanged": 0, "changed": 0, "verified": 0, "failed": 0}
+
+        for result in results.values():
+            if 'error' in result or result.get('verified') is False:
+                summary['failed'] += 1
+
+            elif result['changed']:
+                summary['changed'] += 1
+
+                if result.get('verified'):
+                    summary['verified'] += 1
+
+            else:
+                summary['unchanged'] += 1
+
+        return summary
@@ -1,15 +1,17 @@
+import glob
 import json
 import os
 
 
 class Configurator:
-    def __init__(self, config_file=None, env_var_prefix=None, args={}):
+    def __init__(self, config_file=None, env_var_prefix=None, args={}, env_target="default"):
         """Configurator
 
         Args:
             config_file (str, optional): Name of a JSON-formatted config file to use. Defaults to None.
             env_var_prefix (str, optional): Environment variable prefix prepended to env vars. Defaults to None.
             args (dict, optional): Initial configuration options. Defaults to {}.
+            env_target (str, optional): Target environment variables configure. Defaults to "default".
         """
 
         # Configuration keys required.
@@ -20,7 +22,7 @@ class Configurator:
         ]
 
         # Built-in defaults.
-        self.__config = {
+        self.__defaults = {
         }
 
         # Type conversions for configuration values.
@@ -32,65 +34,60 @@ class Configurator:
 
         # Environment variable prefix.
         self.__env_var_prefix = env_var_prefix
+        self.__env_target = env_target
+        self.__args = args
 
         # Configure!
-        self.__configure(args)
+        self.__configure()
 
 
-    def __configure(self, args):
+    def __configure(self):
         """Create a configuration from a variety of sources. Each source is overriden by the next.
         1) Defaults specified in the constructor
-        2) JSON configuration file if specified
+        2) JSON configuration file and its includes if specified
         3) Environment variables
         4) Arguments sent in
 
-        Args:
-            args (dict): Initially-specified arguments.
-
-        Raises:
-            KeyError: Indicates a missing mandatory config option.
+        Targets are validated when they're first used rather than here, so a fleet with an
+        incomplete entry can still be used for its other targets.
         """
 
-        # Die on an error
-        die = False
+        self.__config = dict(self.__defaults)
+
+        # Target names mapped to the file that defines them.
+        self.__target_sources = {}
 
         # Load configuration from files.
         if self.__config_file is not None:
-            self.__configure_from_file()
+            self.__configure_from_file(self.__config_file, [])
 
         # Configure from environment variables.
         self.__configure_from_env()
 
         # Add any incoming arguments.
-        self.__config.update(args)
+        self.__config.update(self.__args)
 
-        # Validate that we have all our configuration.
-        for target in self.__config:
-            for item in self.__required_items_per_ek:
-                if item not in self.__config[target]:
-                    print(f"Error: Required configuration item missing: {target}.{item}")
-                    die = True
+        # Validated targets.
+        self.__validated = {}
 
-        # Type conversions
-        for item in self.__config:
-            if item in self.__config_type_conversions:
-                try:
-                    self.__config[item] = self.__config_type_conversions[item](self.__config[item])
+        # Names by tag and by group.
+        self.__tags = {}
+        self.__groups = {}
 
-                except ValueError:
-                    arg_type = self.__config_type_conversions[item].__name__
-                    print(f"Error: '{item}' must be of type '{arg_type}'.")
-                    die = True
+        for target, target_config in self.__config.items():
+            for tag in target_config.get('tags', []):
+                self.__tags.setdefault(tag, []).append(target)
 
-        if die:
-            print("Error: Invalid configuaration. Exiting.")
-            exit(1)
+            if 'group' in target_config:
+                self.__groups.setdefault(target_config['group'], []).append(target)
 
 
     def __configure_from_env(self):
-        """Load configuration from environment variables.
+        """Load configuration from environment variables. They configure the env target, on top
+           of anything the files set for it.
         """
         env_vars = os.environ
+        env_config = {}
 
         # Search for any of our items in environment variables.
         for item in self.__required_items_per_ek:
@@ -101,21 +98,194 @@ class Configurator:
 
             # If we have a match use it.
             if item_upper in env_vars:
-                self.__config.update({item: env_vars[item_upper]})
+                env_config.update({item: env_vars[item_upper]})
+
+        if env_config:
+            self.__config.update({
+                self.__env_target: dict(self.__config.get(self.__env_target, {}), **env_config)
+            })
+
 
+    def __configure_from_file(self, file_name, stack):
+        """Load configuration from a JSON file. Files listed in its "include" key, which may be
+           glob patterns relative to the file, are loaded first so the file's own targets take
+           precedence.
 
-    def __configure_from_file(self):
-        """Load configuration from a JSON file.
+        Args:
+            file_name (str): Name of the JSON file.
+            stack (list): Files that include this one, to catch include loops.
+
+        Raises:
+            ValueError: Files include each other.
         """
-        if self.__config_file is not None:
-            with open(self.__config_file, "r") as f:
-                contents = f.read()
-                self.__config.update(json.loads(contents))
+        file_name = os.path.abspath(file_name)
+
+        if file_name in stack:
+            raise ValueError(f"Configuration include loop: {' -> '.join(stack + [file_name])}")
+
+        with open(file_name, "r") as f:
+            contents = json.loads(f.read())
+
+        base_dir = os.path.dirname(file_name)
+
+        for pattern in contents.get('include', []):
+            pattern = os.path.join(base_dir, pattern)
+            include_files = sorted(glob.glob(pattern))
+
+            if not include_files and not glob.has_magic(pattern):
+                raise FileNotFoundError(f"Included configuration file not found: {pattern}")
+
+            for include_file in include_files:
+                self.__configure_from_file(include_file, stack + [file_name])
+
+        self.__config.update({target: target_config for target, target_config in contents.items()
+                              if target != "include"})
+        self.__target_sources.update({target: file_name for target in contents
+                                      if target != "include"})
+
+
+    def get(self, target):
+        """Get a validated target configuration.
+
+        Args:
+            target (str): Target name.
+
+        Raises:
+            KeyError: The target isn't in the configuration.
+            ValueError: The target is missing a required item or has a value of the wrong type.
+
+        Returns:
+            dict: Target configuration.
+        """
+
+        if target in self.__validated:
+            return self.__validated[target]
+
+        if target not in self.__config:
+            raise KeyError(f"No ESPKey named {target} in the configuration.")
+
+        target_config = dict(self.__config[target])
+        errors = []
+
+        # Validate that we have all our configuration.
+        for item in self.__required_items_per_ek:
+            if item not in target_config:
+                errors.append(f"Required configuration item missing: {target}.{item}.")
+
+        # Type conversions
+        for item in target_config:
+            if item in self.__config_type_conversions:
+                try:
+                    target_config[item] = self.__config_type_conversions[item](target_config[item])
+
+                except ValueError:
+                    arg_type = self.__config_type_conversions[item].__name__
+                    errors.append(f"'{target}.{item}' must be of type '{arg_type}'.")
+
+        if errors:
+            raise ValueError(" ".join(errors))
+
+        self.__validated.update({target: target_config})
+
+        return target_config
+
+
+    def source(self, target):
+        """File a target is defined in.
+
+        Args:
+            target (str): Target name.
+
+        Returns:
+            str, None: Absolute file name, or None if the target only comes from environment
+                       variables or arguments.
+        """
+
+        return self.__target_sources.get(target)
+
+
+    def targets(self):
+        """Names of every target.
+
+        Returns:
+            list: Target names.
+        """
+
+        return list(self.__config)
+
+
+    def tagged(self, tag):
+        """Names of the targets with a tag in their "tags" list.
+
+        Args:
+            tag (str): Tag.
+
+        Returns:
+            list: Target names.
+        """
+
+        return list(self.__tags.get(tag, []))
+
+
+    def group(self, group):
+        """Names of the targets whose "group" is group.
+
+        Args:
+            group (str): Group name.
+
+        Returns:
+            list: Target names.
+        """
+
+        return list(self.__groups.get(group, []))
+
+
+    def resolve(self, spec):
+        """Resolve a target specification to target names.
+
+        Args:
+            spec (str): "all", or a comma-separated list of target names, "tag:<tag>" and
+                        "group:<group>".
+
+        Raises:
+            KeyError: A target, tag or group isn't in the configuration.
+
+        Returns:
+            list: Target names, without duplicates, in the order they were asked for.
+        """
+
+        if spec == "all":
+            return self.targets()
+
+        targets = {}
+
+        for item in spec.split(","):
+            kind, _, value = item.partition(":")
+
+            if kind == "tag" and value:
+                if value not in self.__tags:
+                    raise KeyError(f"No ESPKeys tagged {value} in the configuration.")
+
+                targets.update(dict.fromkeys(self.__tags[value]))
+
+            elif kind == "group" and value:
+                if value not in self.__groups:
+                    raise KeyError(f"No ESPKey group {value} in the configuration.")
+
+                targets.update(dict.fromkeys(self.__groups[value]))
+
+            else:
+                if item not in self.__config:
+                    raise KeyError(f"No ESPKey named {item} in the configuration.")
+
+                targets.update({item: None})
+
+        return list(targets)
 
 
     @property
     def configuration(self):
-        """A dictionary containing the configuration.
+        """A dictionary containing the configuration. Targets haven't necessarily been validated.
         """
 
         return self.__config
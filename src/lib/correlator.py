@@ -0,0 +1,208 @@
+from collections import OrderedDict
+import datetime
+import threading
+import time
+
+from .log_entry import LogEntry
+
+
+class Correlator:
+    def __init__(self, max_entries=100000, window_sec=None):
+        """Deduplicate log entries pulled from one or more ESPKeys and correlate card reads
+           across devices. Both indexes are bounded LRUs so long-running pollers don't grow
+           without limit.
+
+        Args:
+            max_entries (int, optional): Maximum number of entries and credentials to remember.
+                                         Defaults to 100000.
+            window_sec (int, float, optional): Forget entries and credentials that haven't been
+                                               seen for this many seconds. Defaults to None which
+                                               only limits by max_entries.
+        """
+
+        self.__max_entries = max_entries
+        self.__window_sec = window_sec
+
+        # (device, boot, time_raw, data) -> monotonic time the entry was last seen.
+        self.__entries = OrderedDict()
+
+        # device -> start times of its boots, see LogEntry.boot_ids().
+        self.__boots = {}
+
+        # data_hex -> correlation record.
+        self.__credentials = OrderedDict()
+
+        self.__lock = threading.Lock()
+
+
+    def __expire(self, index, now):
+        """Drop the least recently seen items from an index that are over the size limit or
+           outside the time window.
+
+        Args:
+            index (OrderedDict): Index to prune. Values are monotonic times or dicts with a
+                                 "last_seen_mono" key.
+            now (float): Current monotonic time.
+        """
+
+        while len(index) > self.__max_entries:
+            index.popitem(last=False)
+
+        if self.__window_sec is None:
+            return
+
+        while len(index) > 0:
+            oldest = next(iter(index.values()))
+
+            if isinstance(oldest, dict):
+                oldest = oldest['last_seen_mono']
+
+            if now - oldest <= self.__window_sec:
+                break
+
+            index.popitem(last=False)
+
+
+    def __correlate(self, device, entry, seen_dts, now):
+        """Record a new card read in the cross-device index.
+
+        Args:
+            device (str): ESPKey name.
+            entry (dict): Parsed data entry.
+            seen_dts (str): Time the entry was pulled from the ESPKey.
+            now (float): Current monotonic time.
+        """
+
+        data_hex = entry['data_hex']
+        entry_dts = entry.get('dts')
+
+        if data_hex not in self.__credentials:
+            record = {
+                "data_hex": data_hex,
+                "data_len": entry['data_len'],
+                "count": 0,
+                "first_seen": {
+                    "device": device,
+                    "dts": entry_dts,
+                    "seen": seen_dts
+                },
+                "seen_at": {}
+            }
+
+            # Keep any decoded credential data.
+            for key in entry:
+                if key.startswith("possible_"):
+                    record.update({key: entry[key]})
+
+            self.__credentials.update({data_hex: record})
+
+        record = self.__credentials[data_hex]
+        self.__credentials.move_to_end(data_hex)
+
+        if device not in record['seen_at']:
+            record['seen_at'].update({device: {
+                "count": 0,
+                "first_dts": entry_dts,
+                "last_dts": entry_dts
+            }})
+
+        device_record = record['seen_at'][device]
+        device_record['count'] += 1
+        device_record['last_dts'] = entry_dts
+        record['count'] += 1
+        record['last_seen_mono'] = now
+
+
+    def observe(self, device, entries):
+        """Add entries from a log pull and return the ones that haven't been seen before.
+
+        Args:
+            device (str): ESPKey name.
+            entries (list): Parsed log entries in log order as returned by ESPKey.get_log().
+
+        Returns:
+            list: Entries that are new. Data entries among them are added to the cross-device
+                  index.
+        """
+
+        new_entries = []
+        seen_dts = datetime.datetime.utcnow().isoformat()
+        now = time.monotonic()
+
+        with self.__lock:
+            boot_ids = LogEntry.boot_ids(entries, self.__boots.setdefault(device, []))
+
+            for entry, boot in zip(entries, boot_ids):
+                data = entry.get('data_hex', entry.get('log_msg'))
+                key = (device, boot, entry['time_raw'], data)
+
+                if key in self.__entries:
+                    self.__entries.move_to_end(key)
+                    self.__entries[key] = now
+                    continue
+
+                self.__entries.update({key: now})
+                new_entries.append(entry)
+
+                if 'data_hex' in entry:
+                    self.__correlate(device, entry, seen_dts, now)
+
+            self.__expire(self.__entries, now)
+            self.__expire(self.__credentials, now)
+
+        return new_entries
+
+
+    @staticmethod
+    def merge_summaries(summaries):
+        """Combine summaries from correlators that watched different devices, for example one
+           per process in a sharded run.
+
+        Args:
+            summaries (list): Summaries returned by summary().
+
+        Returns:
+            dict: Combined summary in the same shape as summary().
+        """
+
+        merged = {}
+
+        for summary in summaries:
+            for data_hex, record in summary.items():
+                if data_hex not in merged:
+                    merged.update({data_hex: dict(record, seen_at=dict(record['seen_at']))})
+                    continue
+
+                this_record = merged[data_hex]
+                this_record['count'] += record['count']
+                this_record['seen_at'].update(record['seen_at'])
+                this_record['devices'] = len(this_record['seen_at'])
+
+                if record['first_seen']['seen'] < this_record['first_seen']['seen']:
+                    this_record['first_seen'] = record['first_seen']
+
+        return merged
+
+
+    def summary(self):
+        """Summarize card reads across devices.
+
+        Returns:
+            dict: Credentials keyed by hex data with the total read count, the number of devices,
+                  where and when each was first seen and per-device read counts and times.
+        """
+
+        summary = {}
+
+        with self.__lock:
+            for data_hex, record in self.__credentials.items():
+                this_record = {key: value for key, value in record.items()
+                               if key != "last_seen_mono"}
+                this_record.update({
+                    "devices": len(record['seen_at']),
+                    "seen_at": {device: dict(seen) for device, seen in record['seen_at'].items()}
+                })
+
+                summary.update({data_hex: this_record})
+
+        return summary
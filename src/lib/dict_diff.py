@@ -0,0 +1,35 @@
+def dict_diff(old, new, prefix=""):
+    """Compare two JSON-style dicts. Nested dicts are compared key by key and reported with
+       dotted paths, anything else is compared as a whole.
+
+    Args:
+        old (dict): Original dict.
+        new (dict): Updated dict.
+        prefix (str, optional): Path prefix for nested keys. Defaults to "".
+
+    Returns:
+        dict: Paths that were "added" and "removed" mapped to their values, and paths that
+              "changed" mapped to dicts with the "old" and "new" values. Empty if the dicts are
+              the same.
+    """
+
+    diff = {}
+
+    for key in old.keys() | new.keys():
+        path = f"{prefix}{key}"
+
+        if key not in new:
+            diff.setdefault("removed", {}).update({path: old[key]})
+
+        elif key not in old:
+            diff.setdefault("added", {}).update({path: new[key]})
+
+        elif isinstance(old[key], dict) and isinstance(new[key], dict):
+            for change, changes in dict_diff(old[key], new[key], f"{path}.").items():
+                diff.setdefault(change, {}).update(changes)
+
+        elif old[key] != new[key] or type(old[key]) != type(new[key]):
+            diff.setdefault("changed", {}).update({path: {"old": old[key], "new": new[key]}})
+
+    # Stable output regardless of set ordering.
+    return {change: dict(sorted(changes.items())) for change, changes in sorted(diff.items())}
@@ -0,0 +1,223 @@
+from concurrent.futures import ThreadPoolExecutor
+import ipaddress
+import json
+import os
+import socket
+
+import requests
+
+
+class Discovery:
+    def __init__(self, network, ports=(80,), timeout=0.5, max_workers=256, auth=None):
+        """Find ESPKeys on a network. Each address is checked with a TCP connect first so
+           addresses with nothing listening cost one short timeout, then anything that accepts
+           is asked for /version and kept if the response looks like an ESPKey's.
+
+        Args:
+            network (str): CIDR range to scan, for example "192.168.4.0/22".
+            ports (tuple, optional): Ports to try on each address. Defaults to (80,).
+            timeout (int, float, optional): Seconds to wait for a connection or response.
+                                            Defaults to 0.5.
+            max_workers (int, optional): Addresses to probe at the same time. Defaults to 256.
+            auth (tuple, optional): Web user and password to send with /version. Defaults to
+                                    None.
+        """
+
+        self.__network = ipaddress.ip_network(network, strict=False)
+        self.__ports = tuple(ports)
+        self.__timeout = timeout
+        self.__max_workers = max_workers
+        self.__auth = auth
+
+
+    def __probe(self, host, port):
+        """Check a single address and port for an ESPKey.
+
+        Args:
+            host (str): IP address.
+            port (int): TCP port.
+
+        Returns:
+            dict: Discovered ESPKey, or None.
+        """
+
+        try:
+            with socket.create_connection((host, port), timeout=self.__timeout):
+                pass
+
+        except OSError:
+            return None
+
+        base_url = f"http://{host}" if port == 80 else f"http://{host}:{port}"
+
+        try:
+            r = requests.get(f"{base_url}/version", auth=self.__auth, timeout=self.__timeout)
+            version = r.json()
+
+        except (requests.RequestException, ValueError):
+            return None
+
+        # ESPKey firmware identifies itself with its log name and chip ID.
+        if not isinstance(version, dict) or 'ChipID' not in version or 'log_name' not in version:
+            return None
+
+        return {
+            "base_url": base_url,
+            "chip_id": str(version['ChipID']),
+            "version": version
+        }
+
+
+    def scan(self):
+        """Scan the network.
+
+        Returns:
+            list: Discovered ESPKeys with their "base_url", "chip_id" and "version", in address
+                  order.
+        """
+
+        hosts = list(self.__network.hosts()) or [self.__network.network_address]
+        probes = [(str(host), port) for host in hosts for port in self.__ports]
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.__max_workers, len(probes)))) \
+             as executor:
+            results = executor.map(lambda probe: self.__probe(*probe), probes)
+
+            return [result for result in results if result is not None]
+
+
+    @staticmethod
+    def merge(config, found, credentials=None):
+        """Merge discovered ESPKeys into a configuration. ESPKeys already in it are matched by
+           chip ID, and targets without a chip ID are matched by base URL. Matched targets
+           have their base URL and chip ID updated. New ESPKeys are added as espkey-<chip ID>.
+
+        Args:
+            config (dict): Configuration in the format Configurator reads.
+            found (list): Discovered ESPKeys from scan().
+            credentials (dict, optional): "web_user" and "web_pass" to give new ESPKeys.
+                                          Defaults to None.
+
+        Returns:
+            tuple: The merged configuration and lists of the target names "added" and "updated"
+                   in a dict.
+        """
+
+        merged = {target: dict(target_config) if isinstance(target_config, dict) else target_config
+                  for target, target_config in config.items()}
+        changes = {"added": [], "updated": []}
+
+        # The same ESPKey may be listed more than once, for example as "default".
+        by_chip_id = {}
+        by_base_url = {}
+
+        for target, target_config in merged.items():
+            if not isinstance(target_config, dict):
+                continue
+
+            if 'chip_id' in target_config:
+                by_chip_id.setdefault(str(target_config['chip_id']), []).append(target)
+
+            # A base URL only identifies an ESPKey until its chip ID is known. Addresses move,
+            # so another ESPKey may have taken it.
+            elif 'base_url' in target_config:
+                by_base_url.setdefault(target_config['base_url'].rstrip("/"), []).append(target)
+
+        # Chip IDs are matched first so an ESPKey that took another's old address isn't
+        # mistaken for it.
+        unmatched = []
+
+        for espkey in found:
+            if espkey['chip_id'] in by_chip_id:
+                Discovery.__update(merged, by_chip_id[espkey['chip_id']], espkey, changes)
+
+            else:
+                unmatched.append(espkey)
+
+        for espkey in unmatched:
+            targets = by_base_url.pop(espkey['base_url'], [])
+
+            if targets:
+                Discovery.__update(merged, targets, espkey, changes)
+
+            else:
+                target = f"espkey-{espkey['chip_id']}"
+                merged.update({target: dict(credentials or {}, base_url=espkey['base_url'],
+                                            chip_id=espkey['chip_id'])})
+                changes['added'].append(target)
+
+            by_chip_id.update({espkey['chip_id']: targets or [target]})
+
+        return merged, changes
+
+
+    @staticmethod
+    def __update(merged, targets, espkey, changes):
+        """Point targets at a discovered ESPKey.
+
+        Args:
+            merged (dict): Configuration being merged into.
+            targets (list): Target names for the ESPKey.
+            espkey (dict): Discovered ESPKey.
+            changes (dict): Lists of "added" and "updated" target names to record changes in.
+        """
+
+        for target in targets:
+            # Hand-written entries may have an int chip ID or a trailing slash.
+            if str(merged[target].get('base_url', "")).rstrip("/") != espkey['base_url'] or \
+               str(merged[target].get('chip_id')) != espkey['chip_id']:
+                merged[target].update({"base_url": espkey['base_url'],
+                                       "chip_id": espkey['chip_id']})
+
+                if target not in changes['updated']:
+                    changes['updated'].append(target)
+
+
+    @staticmethod
+    def write(merged, changes, config_file, sources=None):
+        """Save merged changes. Updated ESPKeys are changed in the file they're defined in, so
+           ESPKeys from included inventory files stay there, and new ESPKeys are added to the
+           configuration file. Each file is replaced atomically.
+
+        Args:
+            merged (dict): Configuration from merge().
+            changes (dict): Lists of "added" and "updated" target names from merge().
+            config_file (str): Configuration file new ESPKeys are added to.
+            sources (dict, optional): Target names mapped to the file they're defined in.
+                                      Defaults to None which puts every change in config_file.
+
+        Returns:
+            list: Files written.
+        """
+
+        config_file = os.path.abspath(config_file)
+        files = {}
+
+        for target in changes['added']:
+            files.setdefault(config_file, {}).update({target: merged[target]})
+
+        for target in changes['updated']:
+            file_name = (sources or {}).get(target) or config_file
+            files.setdefault(file_name, {}).update({target: {
+                "base_url": merged[target]['base_url'],
+                "chip_id": merged[target]['chip_id']
+            }})
+
+        for file_name, file_changes in files.items():
+            contents = {}
+
+            if os.path.exists(file_name):
+                with open(file_name, "r") as f:
+                    contents = json.loads(f.read())
+
+            for target, target_changes in file_changes.items():
+                contents.update({target: dict(contents.get(target, {}), **target_changes)})
+
+            tmp_file = f"{file_name}.tmp"
+
+            with open(tmp_file, "w") as f:
+                f.write(json.dumps(contents, indent=4))
+
+            os.replace(tmp_file, file_name)
+
+        return list(files)
@@ -1,9 +1,19 @@
-import datetime
+from array import array
 import json
+import mmap
+import os
 from pprint import pprint
 import re
+import time
 
+import requests
+
+from .dict_diff import dict_diff
 from .http_requests import HTTPRequests
+from .log_entry import LogEntry
+from .metrics import CACHE_LOOKUPS, CREDENTIALS, LOG_LINES, LOG_PARSE_LATENCY
+from .profiler import PROFILER
+from .response_cache import ResponseCache
 
 
 class ESPKey:
@@ -11,108 +21,78 @@ class ESPKey:
         self.__config = config
         self.__http = HTTPRequests(config)
 
-        self.__aux_entry_re = re.compile("^([0-9]+) (Aux changed to ([01]))$")
-        self.__data_entry_re = re.compile("^([0-9]+) ([0-9a-f]+):([0-9]+)$")
-        self.__log_entry_re = re.compile("^([0-9]+) (.+)$")
+        # Cache responses from endpoints that only change with firmware or configuration.
+        self.__cache = None
+
+        if config.get('cache'):
+            cache_config = config['cache']
+            self.__cache = ResponseCache(ttl=cache_config.get('ttl', 300),
+                cache_file=cache_config.get('file'))
+
+        # One pass over the raw log bytes. Groups: raw timestamp, data hex, data length, aux
+        # message, aux state, log message. Surrounding whitespace and CRs are left out.
+        self.__log_line_re = re.compile(rb"^[ \t]*([0-9]+) (?:([0-9a-f]+):([0-9]+)|" \
+            rb"(Aux changed to ([01]))|([^\r\n]+?))[ \t\r]*$", re.MULTILINE)
 
 
-    def __parse_log(self, log_request):
-        """Parse log_text as ESPKey logs.
+    def __parse_log(self, log_buffer, now_ts=None, req_dts=None):
+        """Parse ESPKey logs straight from the response body or a memory-mapped file. Lines are
+           matched in place and only the fields each entry needs are copied out and decoded.
 
         Args:
-            log_text (str): Log text.
+            log_buffer (bytes, mmap.mmap): Raw log data.
+            now_ts (int, optional): Timestamp from microncontroller Now header. Defaults to None
+                                    which leaves entries without timestamps.
+            req_dts (datetime.datetime, optional): Approximate time request to microcontroller
+                                                   was sent. Defaults to None.
 
         Returns:
-            list: List of dictionaries containing parsed log entries.
+            list: List of LogEntry objects containing parsed log entries.
         """
 
         parsed = []
+        time_raw = array("q")
+        parse_start = time.perf_counter()
+        device = self.__config.get('name', self.__config.get('base_url'))
 
-        # Crop carriage returns, split by linefeeds.
-        log_text = log_request["text"].replace("\r", "")
-        log_split = log_text.split("\n")
-
-        # Go through each line in our log data.
-        for line in log_split:
-            this_entry = {}
-            line_stripped = line.strip()
-
-            # Look for data or logs.
-            data_match = re.match(self.__data_entry_re, line_stripped)
-            aux_entry_match = re.match(self.__aux_entry_re, line_stripped)
-            log_match = re.match(self.__log_entry_re, line_stripped)
-
-            # Look for data.
-            if data_match:
-                data_groups = data_match.groups()
-
-                this_entry = {
-                    "time_raw": int(data_groups[0]),
-                    "data_hex": data_groups[1],
-                    "data_len": int(data_groups[2])
-                }
-
-                # HID data is 26 bits so make a guess.
-                if this_entry['data_len'] == 26:
-                    hid_data = self.__parse_hid_26(data_groups[1])
-
-                    # Did we get a possible HID hit?
-                    if len(hid_data) > 0:
-                        this_entry.update({
-                            "possible_hid_26": hid_data
-                        })
-
-                # Detect potential 4, 7, or 10 byte UID.
-                if this_entry['data_len'] in [32, 56, 80]:
-                    possible_uid = self.__parse_possible_uid(data_groups[1])
-
-                    if possible_uid:
-                        this_entry.update({
-                            "possible_uid": possible_uid
-                        })
+        with PROFILER.span("parse_log", device=device):
+            for line_match in self.__log_line_re.finditer(log_buffer):
+                raw_ts, data_hex, data_len, aux_msg, aux_status, log_msg = line_match.groups()
 
-                # Detect potential HID keypad
-                if int(this_entry['data_len'] % 2) == 0:
-                    possible_keypad = self.__parse_hid_keypad(data_groups[1])
+                # Look for data. Credential decoding is deferred until the entry is serialized.
+                if data_hex is not None:
+                    entry = LogEntry(int(raw_ts), data_hex=data_hex.decode("ascii"),
+                        data_len=int(data_len))
 
-                    if possible_keypad:
-                            this_entry.update({
-                                "possible_hid_keypad": possible_keypad
-                            })
+                # Look for aux line toggles.
+                elif aux_msg is not None:
+                    entry = LogEntry(int(raw_ts), log_msg=aux_msg.decode("ascii"),
+                        aux_status=aux_status == b"1")
 
-                # Add entry.
-                parsed.append(this_entry)
-
-            # Look for aux line toggles.
-            elif aux_entry_match:
-                log_groups = aux_entry_match.groups()
-
-                this_entry = {
-                    "aux_status": bool(int(log_groups[2])),
-                    "log_msg": log_groups[1],
-                    "time_raw": int(log_groups[0])
-                }
-
-                parsed.append(this_entry)
+                # Textual logs.
+                else:
+                    entry = LogEntry(int(raw_ts), log_msg=log_msg.decode("utf-8", "replace"))
 
-            # Look for textual logs.
-            elif log_match:
-                log_groups = log_match.groups()
+                parsed.append(entry)
+                time_raw.append(entry.time_raw)
 
-                this_entry = {
-                    "time_raw": int(log_groups[0]),
-                    "log_msg": log_groups[1]
-                }
+        # Record metrics once per log so the loop above stays tight.
+        LOG_LINES.inc(device, amount=len(parsed))
+        CREDENTIALS.inc(device, amount=sum(1 for entry in parsed if entry.data_hex is not None))
 
-                parsed.append(this_entry)
+        if now_ts is None:
+            LOG_PARSE_LATENCY.observe(time.perf_counter() - parse_start, device)
+            return parsed
 
         # Set timestamp data for time reconstruction.
-        now_ts = int(log_request['now_header'])
-        timestamps = self.__process_time_stamps(parsed, now_ts, log_request['req_dts'])
+        with PROFILER.span("timestamps", device=device):
+            boot_start, timestamps = self.__process_time_stamps(time_raw, now_ts, req_dts)
 
         # Add reconstructed times to parsed entries.
-        for idx in timestamps:
-            parsed[idx].update({"dts": timestamps[idx]})
+        for entry, dts_us in zip(parsed[boot_start:], timestamps):
+            entry.dts_us = dts_us
+
+        LOG_PARSE_LATENCY.observe(time.perf_counter() - parse_start, device)
 
         return parsed
 
@@ -136,254 +116,289 @@ class ESPKey:
         return parsed
 
 
-    def __parse_possible_uid(self, hex_raw):
-        """Parse possible 4, 7, or 10 byte UID.
+    @staticmethod
+    def __process_time_stamps(time_raw, now_ts, req_dts):
+        """Reconstruct approximate timestamps for a whole log at once. The ESPKey's millisecond
+           counter resets on reboot so only entries logged since the last boot can be anchored
+           to the request time. Earlier boot segments are left without timestamps.
 
         Args:
-            hex_raw (str): Hex data as string.
+            time_raw (array.array): Raw timestamps of every log entry in log order.
+            now_ts (int): Timestamp from microncontroller Now header.
+            req_dts (datetime.datetime): Approximate time request to microcontroller was sent.
 
         Returns:
-            dict, None: Dict containg possible decoded data or None if no match.
+            tuple(int, list): Index of the first entry in the current boot segment and the
+                approximate timestamps of the entries from there on as microseconds since the
+                Unix epoch.
         """
 
-        uid = ""
-        metadata = []
-        data = {}
-
-        raw_len = len(hex_raw)
-
-        for cursor in range(0, raw_len, 2):
-            this_byte = f"{hex_raw[cursor + 1]}{hex_raw[cursor]}"
+        entry_ct = len(time_raw)
 
-            # Byte order is reversed.
-            uid = f"{this_byte}{uid}"
+        # If the newest entry is ahead of the device clock the device rebooted after logging it.
+        if entry_ct == 0 or time_raw[-1] > now_ts:
+            return (entry_ct, [])
 
-        data.update({"uid": uid})
+        # Boot boundaries are wherever the counter goes backwards. Only the last one matters.
+        boot_start = 0
 
-        # Check for possible 4-byte random UID.
-        if raw_len == 8 and uid[0:2] == "08":
-                metadata.append("Possible random 4-byte UID used in Mifare DESFire EV2 or EV3.")
+        for idx, (previous, current) in enumerate(zip(time_raw, time_raw[1:]), 1):
+            if current < previous:
+                boot_start = idx
 
-        if len(metadata) > 0:
-            data.update({"metadata": metadata})
+        # Every entry in the segment is offset from the request by its distance from Now.
+        base_us = LogEntry.dts_to_us(req_dts) - (now_ts * 1000)
 
-        return data
+        return (boot_start, [base_us + (raw_ts * 1000) for raw_ts in time_raw[boot_start:]])
 
 
-    def __parse_hid_keypad(self, hex_raw):
-        """Look for possible HID keypad data.
+    def __cached_get(self, url):
+        """Get a slow-changing resource, using the response cache if it's enabled. Expired
+           entries are revalidated with a conditional request when the ESPKey sent an ETag or
+           Last-Modified header.
 
         Args:
-            hex_raw (str): String representing one or more nibbles in hex.
+            url (str): URL to request.
+
+        Raises:
+            RuntimeError: The ESPKey returned a non-200 HTTP status code.
 
         Returns:
-            str, None: Str for possible keypad entries or None for a failed decode.
+            str: Response body.
         """
 
-        hid_data = None
-        possible = True
+        headers = {}
+        entry = None
+        device = self.__config.get('name', self.__config.get('base_url'))
 
-        # HID characters - 1st nibble is the logical NOT of the second.
-        char_table = {
-            "e1": "1", "d2": "2", "c3": "3",
-            "b4": "4", "a5": "5", "96": "6",
-            "87": "7", "78": "8", "69": "9",
-            "5a": "*", "f0": "0", "4b": "#"
-        }
+        if self.__cache is not None:
+            entry = self.__cache.get(url)
 
-        nibbles_ct = len(hex_raw)
+            if entry is not None:
+                if self.__cache.is_fresh(entry):
+                    CACHE_LOOKUPS.inc(device, "fresh")
+                    return entry['text']
 
-        # Do we have an even number of nibbles up to 5 bytes?
-        if (nibbles_ct % 2) == 0 and nibbles_ct <= 10:
-            decoded = []
+                if 'etag' in entry:
+                    headers.update({"If-None-Match": entry['etag']})
 
-            # Iterate over bytes looking for hits on the character table.
-            for start_nbl in range(0, nibbles_ct, 2):
-                end_nbl = start_nbl + 1
-                this_byte = f"{hex_raw[start_nbl]}{hex_raw[end_nbl]}"
+                if 'last_modified' in entry:
+                    headers.update({"If-Modified-Since": entry['last_modified']})
 
-                if this_byte in char_table:
-                    decoded.append(char_table[this_byte])
+        request = self.__http.http_get(url, headers=headers, coalesce=True)
 
-                else:
-                    possible = False
-                    break
+        # Not modified since we cached it.
+        if request["status"] == 304 and entry is not None:
+            CACHE_LOOKUPS.inc(device, "revalidated")
+            self.__cache.touch(url)
+            return entry['text']
 
-        else:
-            possible = False
+        if request["status"] != 200:
+            raise RuntimeError(f"HTTP status: {request['status']}")
+
+        if self.__cache is not None:
+            CACHE_LOOKUPS.inc(device, "miss")
+            self.__cache.put(url, request['text'], request['headers'])
+
+        return request['text']
 
-        if possible:
-            hid_data = decoded
 
-        return hid_data
+    def invalidate_cache(self):
+        """Drop every cached response for this ESPKey.
+        """
+
+        if self.__cache is not None:
+            # Match the path separator so http://10.0.0.1 leaves http://10.0.0.10 alone.
+            self.__cache.invalidate(f"{self.__config['base_url'].rstrip('/')}/")
+
 
+    def dos_start(self):
+        """Not implemented.
+        """
+        pass
 
-    def __parse_hid_26(self, hex_raw):
-        """Parse data as 26-bit HID
+
+    def dos_stop(self):
+        """Not implemented.
+        """
+        pass
+
+
+    def delete_log(self, post_method=False):
+        """Delete logs from the ESPKey.
 
         Args:
-            hex_raw (str): 26-bit hex string
+            post_method (bool, optional): _description_. Defaults to False.
 
         Returns:
-            dict: Dictionary containing a facility code and card #.
+            bool: True if there was an HTTP 200 response.
         """
 
-        # Type convert the hex string to an int.
-        hex_int = int(hex_raw, base=16)
+        worked = False
+
+        if post_method:
+            log_file = ""
 
-        # 26-bit Weigand data structure for HID
-        # x = ignore, f=facility code bit, c = card number bit
-        #           xffffffffccccccccccccccccx
+            url = f"{self.__config['base_url']}/edit"
+            request = self.__http.http_form_post(url, "/log.txt", log_file)
 
-        fc_shift = 17
-        fc_mask = 0b01111111100000000000000000
-        cn_shift = 1
-        cn_mask = 0b00000000011111111111111110
+        else:
+            url = f"{self.__config['base_url']}/delete"
+            request = self.__http.http_get(url)
 
-        # Mask and shift FC and CN
-        hid_data = {
-            "fc": int((fc_mask & hex_int) >> fc_shift),
-            "cn": int((cn_mask & hex_int) >> cn_shift)
-        }
+        if request["status"] == 200:
+            worked = True
 
-        return hid_data
+        return worked
 
 
-    @staticmethod
-    def __process_time_stamps(entries, now_ts, req_dts):
-        """Reconstruct approximate timestamp fr
+    def get_config(self):
+
+        content = {}
+
+        url = f"{self.__config['base_url']}/config.json"
+
+        content = json.loads(self.__cached_get(url))
+
+        return content
+
+
+    def set_config(self, config, merge=False, verify=True, restart=False):
+        """Upload a new configuration if it differs from the current one.
 
         Args:
-            entries (list): List of parsed log entries as dicts.
-            now_ts (int): Timestamp from microncontroller Now header.
-            req_dts (datetime.datetime): Approximate time request to microcontroller was sent.
+            config (dict): Desired configuration.
+            merge (bool, optional): Only set the keys in config and keep the rest of the
+                                    current configuration. Defaults to False which replaces it.
+            verify (bool, optional): Read the configuration back after uploading it and check
+                                     it matches. Defaults to True.
+            restart (bool, optional): Restart the ESPKey after a change so it's applied.
+                                      Defaults to False.
+
+        Raises:
+            RuntimeError: The ESPKey returned a non-200 HTTP status code.
 
         Returns:
-            dict: A dictionary containing the entry index as a key and approximate datetime of
-                the log entry.
+            dict: "changed" flag, the "diff" between the current and desired configuration,
+                  and whether the change was "verified" and the ESPKey "restarted".
         """
 
-        entries_parsed = {}
-
-        past_latest_entry = False
-        last_dts = None
-        last_raw_ts = None
-        range_start_adj = len(entries) - 1
+        current = self.get_config()
+        desired = config
 
-        # Iterate in reverse.
-        for i in range(range_start_adj, 0, -1):
-            this_entry = entries[i]
+        if merge:
+            desired = dict(current, **config)
 
-            # Construct past point in time.
-            if past_latest_entry:
-                # Detect the unit rebooting and stop computing timestamps since the timing
-                # data is unrecoverable after a reboot.
-                if this_entry['time_raw'] > last_raw_ts:
-                    break
+        diff = dict_diff(current, desired)
+        result = {
+            "changed": False,
+            "diff": diff
+        }
 
-                # Compute delta T and datetime.
-                delta_t_ms = this_entry['time_raw'] - last_raw_ts
-                delta_t = datetime.timedelta(milliseconds=delta_t_ms)
-                this_dts = last_dts + delta_t
+        if not diff:
+            return result
 
-                # Prep data for next iteration, set current timestamp.
-                last_dts = this_dts
-                last_raw_ts = this_entry['time_raw']
-                entries_parsed.update({i: this_dts.isoformat()})
+        url = f"{self.__config['base_url']}/edit"
+        request = self.__http.http_form_post(url, "/config.json", json.dumps(desired))
 
-            # Build starting point using the timing of the request made and the reported
-            # microcontroller timestamp header.
-            else:
-                past_latest_entry = True
+        if request["status"] != 200:
+            raise RuntimeError(f"HTTP status: {request['status']}")
 
-                # Compute delta T and datetime.
-                delta_t_ms = this_entry['time_raw'] - now_ts
-                delta_t = datetime.timedelta(milliseconds=delta_t_ms)
-                this_dts = req_dts + delta_t
+        result.update({"changed": True})
 
-                # Prep data for next iteration, set current timestamp.
-                last_dts = this_dts
-                last_raw_ts = now_ts
-                entries_parsed.update({i: this_dts.isoformat()})
+        # The cached copy is stale now.
+        self.invalidate_cache()
 
-                # This is a very odd hack to prevent a bug that decodes the first three entries -
-                # two of them being incorrect. Typically the startup time ovseserved has been
-                # between 510 and 525 ms. I'm adding padding.
-                if this_entry['time_raw'] < 540:
-                    break
+        if verify:
+            result.update({"verified": dict_diff(self.get_config(), desired) == {}})
 
-                # Compute delta T and datetime.
-                delta_t_ms = this_entry['time_raw'] - last_raw_ts
-                delta_t = datetime.timedelta(milliseconds=delta_t_ms)
-                this_dts = last_dts + delta_t
+        if restart:
+            result.update({"restarted": self.restart()})
 
+        return result
 
 
-        return entries_parsed
+    def upload_file(self, remote_name, file_path, timeout=60):
+        """Upload a file, for example part of the web UI, to the ESPKey's filesystem. The file
+           is streamed from disk.
 
+        Args:
+            remote_name (str): Path on the ESPKey, for example "/index.htm".
+            file_path (str): Local file to upload.
+            timeout (int, float, optional): Seconds to wait for the ESPKey to write the file.
+                                            Defaults to 60.
 
-    def dos_start(self):
-        """Not implemented.
+        Returns:
+            bool: True if there was an HTTP 200 response.
         """
-        pass
 
+        url = f"{self.__config['base_url']}/edit"
+        request = self.__http.http_stream_post(url, "file", remote_name, file_path,
+            timeout=timeout)
 
-    def dos_stop(self):
-        """Not implemented.
-        """
-        pass
+        return request["status"] == 200
 
 
-    def delete_log(self, post_method=False):
-        """Delete logs from the ESPKey.
+    def upload_firmware(self, file_path, endpoint="/update", timeout=300):
+        """Upload a firmware image. The file is streamed from disk. The ESPKey normally
+           restarts by itself once the image is written.
 
         Args:
-            post_method (bool, optional): _description_. Defaults to False.
+            file_path (str): Local firmware image.
+            endpoint (str, optional): Firmware update endpoint. Defaults to "/update".
+            timeout (int, float, optional): Seconds to wait for the ESPKey to write the image.
+                                            Defaults to 300.
 
         Returns:
             bool: True if there was an HTTP 200 response.
         """
 
-        worked = False
+        url = f"{self.__config['base_url']}{endpoint}"
+        request = self.__http.http_stream_post(url, "firmware", os.path.basename(file_path),
+            file_path, timeout=timeout)
 
-        if post_method:
-            log_file = ""
-
-            url = f"{self.__config['base_url']}/edit"
-            request = self.__http.http_form_post(url, "/log.txt", log_file)
+        # Version and configuration are about to change.
+        self.invalidate_cache()
 
-        else:
-            url = f"{self.__config['base_url']}/delete"
-            request = self.__http.http_get(url)
+        return request["status"] == 200
 
-        if request["status"] == 200:
-            worked = True
 
-        return worked
+    def wait_for_version(self, timeout=120, interval=2):
+        """Wait for the ESPKey to come back after a restart.
 
+        Args:
+            timeout (int, float, optional): Seconds to keep trying. Defaults to 120.
+            interval (int, float, optional): Seconds between attempts. Defaults to 2.
 
-    def get_config(self):
+        Raises:
+            TimeoutError: The ESPKey didn't respond in time.
 
-        content = {}
+        Returns:
+            dict: ESPKey version.
+        """
 
-        url = f"{self.__config['base_url']}/config.json"
+        deadline = time.monotonic() + timeout
 
-        request = self.__http.http_get(url)
+        while True:
+            # Give it a moment to go down before the first check.
+            time.sleep(interval)
+            self.invalidate_cache()
 
-        if request["status"] != 200:
-            raise RuntimeError(f"HTTP status: {request['status']}")
+            try:
+                return self.get_version()
 
-        content = json.loads(request['text'])
+            except (OSError, RuntimeError, ValueError, requests.RequestException):
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"{self.__config['base_url']} didn't respond within " \
+                        f"{timeout} seconds.")
 
-        return content
 
- 
     def get_diagnostics(self):
         diagnostic_data = {}
 
         url = f"{self.__config['base_url']}/all"
 
-        request = self.__http.http_get(url)
+        request = self.__http.http_get(url, coalesce=True)
 
         if request["status"] != 200:
             raise RuntimeError(f"HTTP status: {request['status']}")
@@ -397,7 +412,7 @@ class ESPKey:
         return diagnostic_data
 
 
-    def get_log(self, file_name=None):
+    def get_log(self, file_name=None, compact=False):
         """Get log data from ESPKey via HTTP or from a log file if file_name is specified.
            NOTE: Parsing files does not decode raw timestamps. An HTTP header from the request
 
@@ -406,31 +421,50 @@ class ESPKey:
 
         Args:
             file_name (str, optional): Optional text log file. Defaults to None.
+            compact (bool, optional): Return LogEntry objects which use far less memory on large
+                                      logs and only build dicts when serialized. Defaults to
+                                      False.
 
         Raises:
             RuntimeError: The ESPKey returned a non-200 HTTP status code in HTTP mode.
 
         Returns:
-            list: A list of log entries as dcits.
+            list: A list of log entries as dcits, or LogEntry objects if compact is set.
         """
 
         content = []
 
-        # If we want to load from file...
+        # If we want to load from file map it rather than reading it in.
         if file_name:
-            with open(file_name, "r") as f:
-                content = self.__parse_log(f.read(-1))
+            with open(file_name, "rb") as f:
+                try:
+                    log_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+                # Empty files can't be mapped.
+                except ValueError:
+                    log_map = b""
+
+                try:
+                    content = self.__parse_log(log_map)
+
+                finally:
+                    if isinstance(log_map, mmap.mmap):
+                        log_map.close()
 
         # Else make an HTTP request.
         else:
             url = f"{self.__config['base_url']}/log.txt"
 
-            request = self.__http.http_get(url)
+            request = self.__http.http_get(url, raw=True, coalesce=True)
 
             if request["status"] != 200:
                 raise RuntimeError(f"HTTP status: {request['status']}")
 
-            content = self.__parse_log(request)
+            content = self.__parse_log(request['content'], int(request['now_header']),
+                request['req_dts'])
+
+        if not compact:
+            content = [entry.to_dict() for entry in content]
 
         return content
 
@@ -449,12 +483,7 @@ class ESPKey:
 
         url = f"{self.__config['base_url']}/version"
 
-        request = self.__http.http_get(url)
-
-        if request["status"] != 200:
-            raise RuntimeError(f"HTTP status: {request['status']}")
-
-        content = json.loads(request['text'])
+        content = json.loads(self.__cached_get(url))
 
         return content
 
@@ -475,6 +504,9 @@ class ESPKey:
         if request["status"] == 200:
             worked = True
 
+            # Configuration and version may change across a restart.
+            self.invalidate_cache()
+
         return worked
 
 
@@ -499,3 +531,89 @@ class ESPKey:
             worked = True
 
         return worked
+
+
+    def send_weigand_sequence(self, frames, rate=None, verify_log=False):
+        """Send a sequence of weigand frames over a kept-alive connection.
+
+        Args:
+            frames (iterable): Frames to send as (hex string, bit length) tuples.
+            rate (int, float, optional): Maximum frames per second. Defaults to None which sends
+                                         as fast as the ESPKey responds.
+            verify_log (bool, optional): Compare the ESPKey's log before and after sending to
+                                         confirm which frames were logged. Defaults to False.
+
+        Returns:
+            dict: Frame counts, failed frames, elapsed time and achieved frames per second.
+        """
+
+        failed = []
+        sent = []
+        log_before_ct = 0
+
+        if verify_log:
+            log_before_ct = len(self.get_log(compact=True))
+
+        interval = 0
+        if rate:
+            interval = 1 / rate
+
+        start = time.monotonic()
+
+        for frame_ct, (weigand_hex, bit_len) in enumerate(frames):
+            # Pace frames against the start time so request latency doesn't add up.
+            if interval:
+                wait = start + (frame_ct * interval) - time.monotonic()
+
+                if wait > 0:
+                    time.sleep(wait)
+
+            if self.send_weigand(weigand_hex, bit_len):
+                sent.append((weigand_hex, bit_len))
+
+            else:
+                failed.append(f"{weigand_hex}:{bit_len}")
+
+        elapsed = time.monotonic() - start
+        frame_total = len(sent) + len(failed)
+
+        frames_per_sec = 0.0
+        if elapsed > 0:
+            frames_per_sec = frame_total / elapsed
+
+        results = {
+            "frames": frame_total,
+            "sent": len(sent),
+            "failed": failed,
+            "elapsed_sec": round(elapsed, 3),
+            "frames_per_sec": round(frames_per_sec, 2)
+        }
+
+        if verify_log:
+            log_after = self.get_log(compact=True)
+
+            # If the log shrank it was cleared or rotated so every entry is new.
+            if len(log_after) >= log_before_ct:
+                new_entries = log_after[log_before_ct:]
+
+            else:
+                new_entries = log_after
+
+            logged = set()
+
+            for entry in new_entries:
+                if entry.data_hex is not None:
+                    logged.add((int(entry.data_hex, base=16), entry.data_len))
+
+            missing = []
+
+            for weigand_hex, bit_len in sent:
+                if (int(weigand_hex, base=16), bit_len) not in logged:
+                    missing.append(f"{weigand_hex}:{bit_len}")
+
+            results.update({
+                "log_matched": len(sent) - len(missing),
+                "log_missing": missing
+            })
+
+        return results
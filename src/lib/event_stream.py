@@ -0,0 +1,508 @@
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import errno
+import json
+import os
+import queue
+import socket
+import stat
+import sys
+import threading
+
+from .log_entry import LogEntry
+
+
+class StdoutSink:
+    def __init__(self):
+        """Write events to stdout as newline-delimited JSON.
+        """
+
+        self.__lock = threading.Lock()
+
+
+    def send(self, line):
+        """Send a serialized event.
+
+        Args:
+            line (bytes): JSON-encoded event terminated with a newline.
+        """
+
+        with self.__lock:
+            sys.stdout.write(line.decode())
+            sys.stdout.flush()
+
+
+    def close(self):
+        """Nothing to clean up.
+        """
+        pass
+
+
+class UnixSocketSink:
+    def __init__(self, path):
+        """Broadcast newline-delimited JSON events to every client connected to a Unix domain
+           socket.
+
+        Args:
+            path (str): Socket path. A stale socket at this path is replaced.
+        """
+
+        self.__path = path
+        self.__clients = []
+        self.__lock = threading.Lock()
+
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+
+        self.__server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__server.bind(path)
+        self.__server.listen()
+
+        self.__thread = threading.Thread(target=self.__accept, daemon=True)
+        self.__thread.start()
+
+
+    def __accept(self):
+        """Accept client connections until the sink is closed.
+        """
+
+        while True:
+            try:
+                client, _ = self.__server.accept()
+
+            except OSError:
+                break
+
+            # Don't let a stalled client hold up everyone else for long.
+            client.settimeout(1.0)
+
+            with self.__lock:
+                self.__clients.append(client)
+
+
+    def send(self, line):
+        """Send a serialized event to every connected client, dropping clients that fail.
+
+        Args:
+            line (bytes): JSON-encoded event terminated with a newline.
+        """
+
+        with self.__lock:
+            for client in list(self.__clients):
+                try:
+                    client.sendall(line)
+
+                except OSError:
+                    client.close()
+                    self.__clients.remove(client)
+
+
+    def close(self):
+        """Disconnect clients and remove the socket.
+        """
+
+        self.__server.close()
+
+        with self.__lock:
+            for client in self.__clients:
+                client.close()
+
+            self.__clients = []
+
+        if os.path.exists(self.__path):
+            os.unlink(self.__path)
+
+
+class NamedPipeSink:
+    def __init__(self, path):
+        """Write newline-delimited JSON events to a named pipe. Events are dropped while no
+           reader has the pipe open or when the reader falls behind so the automator never
+           blocks on it.
+
+        Args:
+            path (str): FIFO path. It's created if it doesn't exist.
+        """
+
+        self.__path = path
+        self.__fd = None
+        self.__lock = threading.Lock()
+
+        if not os.path.exists(path):
+            os.mkfifo(path)
+
+        elif not stat.S_ISFIFO(os.stat(path).st_mode):
+            raise ValueError(f"{path} exists and isn't a named pipe.")
+
+
+    def send(self, line):
+        """Send a serialized event if a reader is attached.
+
+        Args:
+            line (bytes): JSON-encoded event terminated with a newline.
+        """
+
+        with self.__lock:
+            if self.__fd is None:
+                try:
+                    self.__fd = os.open(self.__path, os.O_WRONLY | os.O_NONBLOCK)
+
+                except OSError as e:
+                    # No reader yet.
+                    if e.errno == errno.ENXIO:
+                        return
+
+                    raise
+
+            try:
+                os.write(self.__fd, line)
+
+            except BlockingIOError:
+                pass
+
+            except BrokenPipeError:
+                # The reader went away, reopen on the next event.
+                os.close(self.__fd)
+                self.__fd = None
+
+
+    def close(self):
+        """Close the pipe. The FIFO itself is left in place for the reader.
+        """
+
+        with self.__lock:
+            if self.__fd is not None:
+                os.close(self.__fd)
+                self.__fd = None
+
+
+class SSESink:
+    def __init__(self, host="127.0.0.1", port=8765):
+        """Serve events as Server-Sent Events from a local HTTP endpoint at /events.
+
+        Args:
+            host (str, optional): Address to listen on. Defaults to "127.0.0.1".
+            port (int, optional): Port to listen on. Defaults to 8765.
+        """
+
+        self.__clients = []
+        self.__lock = threading.Lock()
+        sink = self
+
+        class SSEHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+
+            def do_GET(self):
+                if self.path != "/events":
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+
+                client_queue = sink.register()
+
+                try:
+                    while True:
+                        try:
+                            line = client_queue.get(timeout=15)
+
+                        except queue.Empty:
+                            # Keep idle connections open through proxies.
+                            self.wfile.write(b": keepalive\n\n")
+                            self.wfile.flush()
+                            continue
+
+                        if line is None:
+                            break
+
+                        self.wfile.write(b"data: " + line.rstrip(b"\n") + b"\n\n")
+                        self.wfile.flush()
+
+                except OSError:
+                    pass
+
+                finally:
+                    sink.unregister(client_queue)
+
+        self.__server = ThreadingHTTPServer((host, port), SSEHandler)
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+
+
+    def register(self):
+        """Add a client.
+
+        Returns:
+            queue.Queue: Queue the client reads events from.
+        """
+
+        client_queue = queue.Queue(maxsize=1000)
+
+        with self.__lock:
+            self.__clients.append(client_queue)
+
+        return client_queue
+
+
+    def unregister(self, client_queue):
+        """Remove a client.
+
+        Args:
+            client_queue (queue.Queue): Queue returned by register().
+        """
+
+        with self.__lock:
+            if client_queue in self.__clients:
+                self.__clients.remove(client_queue)
+
+
+    def send(self, line):
+        """Queue a serialized event for every client. Slow clients miss events rather than
+           blocking the automator.
+
+        Args:
+            line (bytes): JSON-encoded event terminated with a newline.
+        """
+
+        with self.__lock:
+            for client_queue in self.__clients:
+                try:
+                    client_queue.put_nowait(line)
+
+                except queue.Full:
+                    pass
+
+
+    def close(self):
+        """Disconnect clients and stop the server.
+        """
+
+        with self.__lock:
+            for client_queue in self.__clients:
+                try:
+                    client_queue.put_nowait(None)
+
+                except queue.Full:
+                    pass
+
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+class QueueSink:
+    def __init__(self, event_queue):
+        """Hand events to another process which sends them on to the real sinks.
+
+        Args:
+            event_queue (queue.Queue): Queue shared with the process that owns the sinks.
+                                       Events are put on it as ("event", line) tuples.
+        """
+
+        self.__queue = event_queue
+
+
+    def send(self, line):
+        """Send a serialized event.
+
+        Args:
+            line (bytes): JSON-encoded event terminated with a newline.
+        """
+
+        self.__queue.put(("event", line))
+
+
+    def close(self):
+        """The queue belongs to the other process.
+        """
+        pass
+
+
+class EventStream:
+    def __init__(self, sinks=None):
+        """Push events such as newly parsed card reads to one or more sinks as they happen.
+
+        Args:
+            sinks (list, optional): Sink objects with send() and close() methods. Defaults to
+                                    None.
+        """
+
+        self.__sinks = sinks or []
+
+        # Length and first entry of each ESPKey's log when it was last published.
+        self.__published = {}
+        self.__published_lock = threading.Lock()
+
+
+    @staticmethod
+    def from_config(config):
+        """Create an event stream from recipe-style settings.
+
+        Args:
+            config (dict): Sink settings. Supported keys are "stdout" (bool), "unix_socket" (str
+                           path), "named_pipe" (str path) and "sse" (dict with optional "host"
+                           and "port").
+
+        Returns:
+            EventStream: Event stream with the configured sinks.
+        """
+
+        sinks = []
+
+        if config.get('stdout', False):
+            sinks.append(StdoutSink())
+
+        if 'unix_socket' in config:
+            sinks.append(UnixSocketSink(config['unix_socket']))
+
+        if 'named_pipe' in config:
+            sinks.append(NamedPipeSink(config['named_pipe']))
+
+        if 'sse' in config:
+            sse_config = config['sse']
+
+            if not isinstance(sse_config, dict):
+                sse_config = {}
+
+            sinks.append(SSESink(**sse_config))
+
+        return EventStream(sinks)
+
+
+    @staticmethod
+    def parse_spec(spec):
+        """Turn a CLI sink specification into recipe-style settings.
+
+        Args:
+            spec (str): stdout, unix:<path>, fifo:<path> or sse:<host>:<port>.
+
+        Raises:
+            ValueError: The specification is invalid.
+
+        Returns:
+            dict: Sink settings for from_config().
+        """
+
+        if spec == "stdout":
+            return {"stdout": True}
+
+        if spec.startswith("unix:") and len(spec) > 5:
+            return {"unix_socket": spec[5:]}
+
+        if spec.startswith("fifo:") and len(spec) > 5:
+            return {"named_pipe": spec[5:]}
+
+        if spec.startswith("sse:"):
+            parts = spec.split(":")
+
+            if len(parts) == 3 and parts[2].isdigit():
+                return {"sse": {"host": parts[1], "port": int(parts[2])}}
+
+        raise ValueError(f"Invalid event stream \"{spec}\". Use stdout, unix:<path>, " \
+            "fifo:<path> or sse:<host>:<port>.")
+
+
+    @property
+    def enabled(self):
+        """Are there any sinks to send events to?
+        """
+
+        return len(self.__sinks) > 0
+
+
+    def publish(self, event_type, device, payload):
+        """Send an event to every sink.
+
+        Args:
+            event_type (str): Event type, for example "data".
+            device (str): ESPKey name.
+            payload (dict): Event data.
+        """
+
+        if not self.__sinks:
+            return
+
+        event = {
+            "type": event_type,
+            "device": device,
+            "published": datetime.datetime.utcnow().isoformat(),
+            "entry": payload
+        }
+
+        line = (json.dumps(event, default=LogEntry.json_default) + "\n").encode()
+
+        self.send_line(line)
+
+
+    def send_line(self, line):
+        """Send an event that was already serialized, for example by another process.
+
+        Args:
+            line (bytes): JSON-encoded event terminated with a newline.
+        """
+
+        for sink in self.__sinks:
+            sink.send(line)
+
+
+    def publish_entries(self, device, entries):
+        """Send a "data" event for each card read among parsed log entries.
+
+        Args:
+            device (str): ESPKey name.
+            entries (list): Parsed log entries.
+        """
+
+        if not self.__sinks:
+            return
+
+        for entry in entries:
+            if 'data_hex' in entry:
+                self.publish("data", device, entry)
+
+
+    @staticmethod
+    def __entry_id(entry):
+        return (entry['time_raw'], entry.get('data_hex'), entry.get('log_msg'))
+
+
+    def publish_log(self, device, entries):
+        """Send "data" events for the card reads added to an ESPKey's log since it was last
+           published. The ESPKey only appends to its log, so if it still starts the same way
+           only entries past the previous length are new. A deleted or replaced log is new
+           throughout.
+
+        Args:
+            device (str): ESPKey name.
+            entries (list): The ESPKey's whole log, parsed.
+        """
+
+        if not self.__sinks:
+            return
+
+        with self.__published_lock:
+            previous = self.__published.get(device)
+            new_entries = entries
+
+            if previous is not None and entries and len(entries) >= previous[0] and \
+               self.__entry_id(entries[0]) == previous[1]:
+                new_entries = entries[previous[0]:]
+
+            self.__published.update({device: (len(entries),
+                                              self.__entry_id(entries[0]) if entries else None)})
+
+        self.publish_entries(device, new_entries)
+
+
+    def close(self):
+        """Close every sink.
+        """
+
+        for sink in self.__sinks:
+            sink.close()
+
+        self.__sinks = []
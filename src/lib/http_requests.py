@@ -1,30 +1,209 @@
 from datetime import datetime
+import hashlib
+import json
+import os
 from pprint import pprint
+import threading
+import time
+from urllib.parse import urlsplit
+import uuid
 
 import requests
 
+from .metrics import HTTP_COALESCED, HTTP_FAILURES, HTTP_LATENCY, HTTP_REQUESTS, \
+    HTTP_RESPONSE_BYTES
+from .profiler import PROFILER
+from .single_flight import SingleFlight
+
+
+# Shared by every ESPKey in the process so callers using separate instances are coalesced too.
+IN_FLIGHT = SingleFlight()
+
+# Seconds to wait for a connection and for a response when the configuration doesn't say.
+DEFAULT_TIMEOUT = (5, 30)
+
+
+class MultipartFileStream:
+    def __init__(self, field_name, file_name, file_path, chunk_size=16384):
+        """Multipart form body for a single file that's read from disk as it's sent. The total
+           length is worked out up front so the request has a Content-Length header instead of
+           using chunked encoding, which small HTTP servers often don't support.
+
+        Args:
+            field_name (str): Form field name.
+            file_name (str): File name to send in the form.
+            file_path (str): Local file to send.
+            chunk_size (int, optional): Bytes to read from disk at a time. Defaults to 16384.
+        """
+
+        self.__file_path = file_path
+        self.__chunk_size = chunk_size
+        self.boundary = uuid.uuid4().hex
+
+        self.__head = (f"--{self.boundary}\r\n"
+                       f"Content-Disposition: form-data; name=\"{field_name}\"; "
+                       f"filename=\"{file_name}\"\r\n"
+                       "Content-Type: application/octet-stream\r\n\r\n").encode()
+        self.__tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self.__length = len(self.__head) + os.path.getsize(file_path) + len(self.__tail)
+
+
+    @property
+    def content_type(self):
+        """Content-Type header value for the body.
+        """
+
+        return f"multipart/form-data; boundary={self.boundary}"
+
+
+    def __len__(self):
+        return self.__length
+
+
+    def __iter__(self):
+        yield self.__head
+
+        with open(self.__file_path, "rb") as f:
+            while True:
+                chunk = f.read(self.__chunk_size)
+
+                if not chunk:
+                    break
+
+                yield chunk
+
+        yield self.__tail
+
+
 class HTTPRequests:
     def __init__(self, config):
         """ESPKey HTTP request library
 
         Args:
-            config (dict): Configuration form the configurator.
+            config (dict): Configuration form the configurator. An optional "rate_limit" caps
+                           requests per second to the ESPKey, and an optional "timeout" sets the
+                           seconds to wait for it to connect and respond, as one number or a
+                           [connect, read] pair.
         """
         self.__config = config
 
+        # Keep connections to the ESPKey alive between requests.
+        self.__session = requests.Session()
+
+        # Label metrics with the ESPKey's name when we know it.
+        self.__device = config.get('name', config.get('base_url'))
+
+        # Optional cap on requests per second so a busy ESPKey isn't overwhelmed.
+        self.__min_interval = 0
+        self.__next_request = 0.0
+        self.__rate_lock = threading.Lock()
+
+        if config.get('rate_limit'):
+            self.__min_interval = 1 / config['rate_limit']
+
+        # An ESPKey that accepts a connection and never answers shouldn't hang its caller.
+        self.__timeout = config.get('timeout', DEFAULT_TIMEOUT)
+
+        if isinstance(self.__timeout, list):
+            self.__timeout = tuple(self.__timeout)
+
+
+    def __wait_for_rate_limit(self):
+        """Block until the next request is allowed under the rate limit.
+        """
+
+        if not self.__min_interval:
+            return
+
+        # Reserve a slot, then sleep outside the lock so other threads can queue up behind us.
+        with self.__rate_lock:
+            now = time.monotonic()
+            wait_sec = self.__next_request - now
+            self.__next_request = max(now, self.__next_request) + self.__min_interval
+
+        if wait_sec > 0:
+            time.sleep(wait_sec)
+
+
+    def __send(self, method, url, **request_kwargs):
+        """Send a request and record its metrics.
+
+        Args:
+            method (str): HTTP method.
+            url (str): URL to request against.
+            **request_kwargs: Keyword arguments for the session request.
+
+        Returns:
+            requests.Response: The response.
+        """
+
+        self.__wait_for_rate_limit()
+
+        request_kwargs.setdefault("timeout", self.__timeout)
+
+        endpoint = urlsplit(url).path or "/"
+        started = time.perf_counter()
+
+        try:
+            with PROFILER.span("http", device=self.__device, method=method, endpoint=endpoint):
+                r = self.__session.request(method, url, **request_kwargs)
+
+        except requests.RequestException:
+            HTTP_FAILURES.inc(self.__device, method, endpoint)
+            raise
+
+        finally:
+            HTTP_LATENCY.observe(time.perf_counter() - started, self.__device, method, endpoint)
+
+        HTTP_REQUESTS.inc(self.__device, method, endpoint, str(r.status_code))
+        HTTP_RESPONSE_BYTES.inc(self.__device, endpoint, amount=len(r.content))
+
+        if not (200 <= r.status_code < 300 or r.status_code == 304):
+            HTTP_FAILURES.inc(self.__device, method, endpoint)
+
+        return r
 
-    def http_get(self, url, auth=True):
+
+    def http_get(self, url, auth=True, headers=None, raw=False, coalesce=False):
         """Run an HTTP get request.
 
         Args:
             url (str): URL to request against.
             auth (bool, optional): Send basic creds with request. Defaults to True.
+            headers (dict, optional): Extra request headers. Defaults to None.
+            raw (bool, optional): Return the undecoded body as bytes under "content" instead of
+                                  decoding it to "text". Defaults to False.
+            coalesce (bool, optional): Share the response of an identical request that's already
+                                       in flight. Only use this for requests without side
+                                       effects. Defaults to False.
 
         Returns:
             bool: True for sccuess, False for failure.
         """
 
+        if coalesce:
+            # Callers with different credentials must never share a response.
+            credentials = None
+
+            if auth:
+                credentials = hashlib.sha256(json.dumps([self.__config.get('web_user'),
+                    self.__config.get('web_pass')]).encode()).hexdigest()
+
+            key = (url, credentials, raw, tuple(sorted((headers or {}).items())))
+
+            response, shared = IN_FLIGHT.do(key, lambda: self.http_get(url, auth=auth,
+                headers=headers, raw=raw))
+
+            if shared:
+                HTTP_COALESCED.inc(self.__device, urlsplit(url).path or "/")
+
+            return dict(response)
+
         request_kwargs = {}
+
+        if headers:
+            request_kwargs.update({"headers": headers})
+
         response = {
             "auth": False,
             "url": url
@@ -40,7 +219,7 @@ class HTTPRequests:
             })
 
         r_dts = datetime.utcnow()
-        r = requests.get(url, **request_kwargs)
+        r = self.__send("GET", url, **request_kwargs)
 
         # Get relative timestamp frmo uC
         if 'Now' in r.headers:
@@ -49,10 +228,15 @@ class HTTPRequests:
         response.update({
             "headers": r.headers,
             "req_dts": r_dts,
-            "status": r.status_code,
-            "text": r.text
+            "status": r.status_code
         })
 
+        if raw:
+            response.update({"content": r.content})
+
+        else:
+            response.update({"text": r.text})
+
         return response
 
         
@@ -88,7 +272,60 @@ class HTTPRequests:
             })
 
         r_dts = datetime.utcnow()
-        r = requests.post(url, **request_kwargs)
+        r = self.__send("POST", url, **request_kwargs)
+
+        response.update({
+            "headers": r.headers,
+            "req_unix_ts": r_dts,
+            "status": r.status_code,
+            "text": r.text
+        })
+
+        return response
+
+
+    def http_stream_post(self, url, field_name, file_name, file_path, auth=True, timeout=None):
+        """Post a file from disk as part of a form without loading it into memory.
+
+        Args:
+            url (str): URL to post to.
+            field_name (str): Form field name.
+            file_name (str): File name to send in the form.
+            file_path (str): Local file to send.
+            auth (bool, optional): Send basic creds with request. Defaults to True.
+            timeout (int, float, optional): Seconds to wait for the response. Defaults to None
+                                            which uses the configured timeout.
+
+        Returns:
+            dict: Response data with "status" and "text".
+        """
+
+        body = MultipartFileStream(field_name, file_name, file_path)
+
+        request_kwargs = {
+            "data": body,
+            "headers": {"Content-Type": body.content_type}
+        }
+
+        if timeout is not None:
+            request_kwargs.update({"timeout": timeout})
+
+        response = {
+            "auth": False,
+            "url": url
+        }
+
+        if auth:
+            response.update({
+                "auth": True,
+            })
+
+            request_kwargs.update({
+                "auth": (self.__config['web_user'], self.__config['web_pass'])
+            })
+
+        r_dts = datetime.utcnow()
+        r = self.__send("POST", url, **request_kwargs)
 
         response.update({
             "headers": r.headers,
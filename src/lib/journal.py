@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import threading
+
+from .log_entry import LogEntry
+
+
+class Journal:
+    def __init__(self, file_name, recipe_file, resume=False):
+        """Checkpoint journal for a recipe run. Each completed action and each task run whose
+           log was written is appended as a JSON line and synced to disk, so a run that crashes
+           or is interrupted can continue without repeating work.
+
+        Args:
+            file_name (str): Journal file name.
+            recipe_file (str): Recipe the journal belongs to.
+            resume (bool, optional): Continue an existing journal instead of starting a new one.
+                                     Defaults to False.
+
+        Raises:
+            ValueError: The journal belongs to a different recipe or version of it.
+        """
+
+        self.__file_name = file_name
+        self.__lock = threading.Lock()
+
+        with open(recipe_file, "rb") as f:
+            self.__recipe_hash = hashlib.sha256(f.read()).hexdigest()
+
+        # Task names mapped to completed runs, and completed actions in the current run of each
+        # task keyed by (task, iteration, action index) in repeat order.
+        self.__state = {"runs": {}, "actions": {}}
+
+        if resume and os.path.exists(file_name):
+            self.__load()
+            self.__f = open(file_name, "a")
+
+        else:
+            self.__f = open(file_name, "w")
+            self.__write({"type": "start", "recipe": recipe_file, "recipe_hash": self.__recipe_hash})
+
+
+    def __load(self):
+        """Read completed work from the journal. A partly written last line from a crash is
+           ignored.
+
+        Raises:
+            ValueError: The journal belongs to a different recipe or version of it.
+        """
+
+        with open(self.__file_name, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+
+                except ValueError:
+                    break
+
+                if record['type'] == "start":
+                    if record['recipe_hash'] != self.__recipe_hash:
+                        raise ValueError(f"Journal {self.__file_name} was written for a " \
+                            "different version of the recipe.")
+
+                elif record['type'] == "action":
+                    self.__state['actions'].setdefault((record['task'], record['iteration'],
+                        record['action']), []).append(record['data'])
+
+                elif record['type'] == "run":
+                    self.__state['runs'].update({record['task']: record['iteration'] + 1})
+
+
+    def __write(self, record):
+        line = json.dumps(record, default=LogEntry.json_default)
+
+        with self.__lock:
+            self.__f.write(line + "\n")
+            self.__f.flush()
+            os.fsync(self.__f.fileno())
+
+
+    @property
+    def state(self):
+        """Completed work from the journal being resumed, in a form that can be passed to other
+           processes.
+        """
+
+        return self.__state
+
+
+    def append(self, record):
+        """Record completed work.
+
+        Args:
+            record (dict): An "action" record with "task", "iteration", "action" index and
+                           "data", or a "run" record with "task", "iteration" and "file".
+        """
+
+        self.__write(record)
+
+
+    def close(self, remove=False):
+        """Close the journal.
+
+        Args:
+            remove (bool, optional): Delete the journal, for example once the recipe has
+                                     finished. Defaults to False.
+        """
+
+        with self.__lock:
+            self.__f.close()
+
+        if remove:
+            os.remove(self.__file_name)
@@ -0,0 +1,388 @@
+from collections.abc import Mapping
+import datetime
+
+
+# Reconstructed timestamps are stored as microseconds since this naive UTC epoch.
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Reconstructed timestamps of the same entry differ between pulls by the request latency.
+BOOT_TOLERANCE_MS = 2000
+
+
+class LogEntry(Mapping):
+    """Compact parsed ESPKey log entry. Fields are stored in slots and decoded credential data
+       and timestamps are only built when they're read, so large logs don't carry a dict and
+       several nested dicts per line. Entries behave like read-only dicts in the same shape
+       ESPKey.get_log() has always returned and can be serialized with LogEntry.json_default.
+    """
+
+    __slots__ = ("time_raw", "data_hex", "data_len", "log_msg", "aux_status", "dts_us")
+
+    # HID characters - 1st nibble is the logical NOT of the second.
+    __keypad_table = {
+        "e1": "1", "d2": "2", "c3": "3",
+        "b4": "4", "a5": "5", "96": "6",
+        "87": "7", "78": "8", "69": "9",
+        "5a": "*", "f0": "0", "4b": "#"
+    }
+
+    def __init__(self, time_raw, data_hex=None, data_len=None, log_msg=None, aux_status=None,
+                 dts_us=None):
+        """Parsed log entry.
+
+        Args:
+            time_raw (int): Raw millisecond timestamp from the ESPKey.
+            data_hex (str, optional): Weigand data as hex for data entries. Defaults to None.
+            data_len (int, optional): Weigand data length in bits for data entries. Defaults to
+                                      None.
+            log_msg (str, optional): Log message for textual and aux entries. Defaults to None.
+            aux_status (bool, optional): Aux line state for aux entries. Defaults to None.
+            dts_us (int, optional): Reconstructed timestamp as microseconds since the Unix epoch.
+                                    Defaults to None.
+        """
+
+        self.time_raw = time_raw
+        self.data_hex = data_hex
+        self.data_len = data_len
+        self.log_msg = log_msg
+        self.aux_status = aux_status
+        self.dts_us = dts_us
+
+
+    @staticmethod
+    def dts_to_us(dts):
+        """Convert a naive UTC datetime to microseconds since the Unix epoch.
+
+        Args:
+            dts (datetime.datetime): Timestamp.
+
+        Returns:
+            int: Microseconds since the Unix epoch.
+        """
+
+        return (dts - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+    @staticmethod
+    def boot_ids(entries, anchors):
+        """Identify the boot each entry was logged in. The millisecond counter restarts at every
+           reboot, so entries are only unique within a boot. Boots are identified by the time
+           they started, in milliseconds since the Unix epoch, so the same entry gets the same
+           ID in every pull. Boots that ended before the pull carry no timestamps and get the
+           latest known boot that fits before the one after them.
+
+        Args:
+            entries (list): Log entries of one ESPKey in log order.
+            anchors (list): Start times of the ESPKey's boots seen in earlier pulls. Boots seen
+                            for the first time are added.
+
+        Returns:
+            list: Boot ID of every entry. Boots that can't be placed in time are numbered from
+                  the start of the pull, as in logs without timestamps.
+        """
+
+        segments = []
+        last_time_raw = None
+
+        for entry in entries:
+            if last_time_raw is None or entry['time_raw'] < last_time_raw:
+                segments.append({"entries": [], "anchor": None})
+
+            last_time_raw = entry['time_raw']
+            segments[-1]['entries'].append(entry)
+
+            if segments[-1]['anchor'] is None:
+                dts_us = entry.dts_us if isinstance(entry, LogEntry) else None
+
+                if dts_us is None and entry.get('dts') is not None:
+                    dts_us = LogEntry.dts_to_us(datetime.datetime.fromisoformat(entry['dts']))
+
+                if dts_us is not None:
+                    segments[-1]['anchor'] = dts_us // 1000 - entry['time_raw']
+
+        # Boot IDs of the segments, newest first.
+        segment_ids = []
+        next_anchor = None
+
+        for idx in range(len(segments) - 1, -1, -1):
+            segment = segments[idx]
+            anchor = segment['anchor']
+
+            if anchor is not None:
+                known = [known for known in anchors if abs(known - anchor) <= BOOT_TOLERANCE_MS]
+
+                if known:
+                    anchor = known[0]
+
+                else:
+                    anchors.append(anchor)
+
+            elif next_anchor is not None:
+                duration = segment['entries'][-1]['time_raw']
+                earlier = [known for known in anchors
+                           if known + duration <= next_anchor + BOOT_TOLERANCE_MS and
+                           known < next_anchor]
+
+                if earlier:
+                    anchor = max(earlier)
+
+            next_anchor = anchor
+            segment_ids.append(idx if anchor is None else ("boot", anchor))
+
+        ids = []
+
+        for segment, segment_id in zip(segments, reversed(segment_ids)):
+            ids.extend([segment_id] * len(segment['entries']))
+
+        return ids
+
+
+    @staticmethod
+    def json_default(obj):
+        """json.dumps() default hook that serializes LogEntry objects.
+
+        Args:
+            obj (object): Object json can't serialize by itself.
+
+        Raises:
+            TypeError: The object isn't a LogEntry.
+
+        Returns:
+            dict: The entry as a dict.
+        """
+
+        if isinstance(obj, LogEntry):
+            return obj.to_dict()
+
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+    @staticmethod
+    def __decode_possible_uid(hex_raw):
+        """Parse possible 4, 7, or 10 byte UID.
+
+        Args:
+            hex_raw (str): Hex data as string.
+
+        Returns:
+            dict, None: Dict containg possible decoded data or None if no match.
+        """
+
+        uid = ""
+        metadata = []
+        data = {}
+
+        raw_len = len(hex_raw)
+
+        for cursor in range(0, raw_len, 2):
+            this_byte = f"{hex_raw[cursor + 1]}{hex_raw[cursor]}"
+
+            # Byte order is reversed.
+            uid = f"{this_byte}{uid}"
+
+        data.update({"uid": uid})
+
+        # Check for possible 4-byte random UID.
+        if raw_len == 8 and uid[0:2] == "08":
+                metadata.append("Possible random 4-byte UID used in Mifare DESFire EV2 or EV3.")
+
+        if len(metadata) > 0:
+            data.update({"metadata": metadata})
+
+        return data
+
+
+    @staticmethod
+    def __decode_hid_keypad(hex_raw):
+        """Look for possible HID keypad data.
+
+        Args:
+            hex_raw (str): String representing one or more nibbles in hex.
+
+        Returns:
+            str, None: Str for possible keypad entries or None for a failed decode.
+        """
+
+        hid_data = None
+        possible = True
+        char_table = LogEntry.__keypad_table
+
+        nibbles_ct = len(hex_raw)
+
+        # Do we have an even number of nibbles up to 5 bytes?
+        if (nibbles_ct % 2) == 0 and nibbles_ct <= 10:
+            decoded = []
+
+            # Iterate over bytes looking for hits on the character table.
+            for start_nbl in range(0, nibbles_ct, 2):
+                end_nbl = start_nbl + 1
+                this_byte = f"{hex_raw[start_nbl]}{hex_raw[end_nbl]}"
+
+                if this_byte in char_table:
+                    decoded.append(char_table[this_byte])
+
+                else:
+                    possible = False
+                    break
+
+        else:
+            possible = False
+
+        if possible:
+            hid_data = decoded
+
+        return hid_data
+
+
+    @staticmethod
+    def __decode_hid_26(hex_raw):
+        """Parse data as 26-bit HID
+
+        Args:
+            hex_raw (str): 26-bit hex string
+
+        Returns:
+            dict: Dictionary containing a facility code and card #.
+        """
+
+        # Type convert the hex string to an int.
+        hex_int = int(hex_raw, base=16)
+
+        # 26-bit Weigand data structure for HID
+        # x = ignore, f=facility code bit, c = card number bit
+        #           xffffffffccccccccccccccccx
+
+        fc_shift = 17
+        fc_mask = 0b01111111100000000000000000
+        cn_shift = 1
+        cn_mask = 0b00000000011111111111111110
+
+        # Mask and shift FC and CN
+        hid_data = {
+            "fc": int((fc_mask & hex_int) >> fc_shift),
+            "cn": int((cn_mask & hex_int) >> cn_shift)
+        }
+
+        return hid_data
+
+
+    @property
+    def dts(self):
+        """Reconstructed timestamp as an ISO-8601 string, or None if it couldn't be recovered.
+        """
+
+        if self.dts_us is None:
+            return None
+
+        return (EPOCH + datetime.timedelta(microseconds=self.dts_us)).isoformat()
+
+
+    def to_dict(self):
+        """Convert the entry to the dict shape ESPKey.get_log() has always returned.
+
+        Returns:
+            dict: Parsed log entry.
+        """
+
+        # Data entry.
+        if self.data_hex is not None:
+            entry = {
+                "time_raw": self.time_raw,
+                "data_hex": self.data_hex,
+                "data_len": self.data_len
+            }
+
+            # HID data is 26 bits so make a guess.
+            if self.data_len == 26:
+                hid_data = self.__decode_hid_26(self.data_hex)
+
+                # Did we get a possible HID hit?
+                if len(hid_data) > 0:
+                    entry.update({
+                        "possible_hid_26": hid_data
+                    })
+
+            # Detect potential 4, 7, or 10 byte UID.
+            if self.data_len in [32, 56, 80]:
+                possible_uid = self.__decode_possible_uid(self.data_hex)
+
+                if possible_uid:
+                    entry.update({
+                        "possible_uid": possible_uid
+                    })
+
+            # Detect potential HID keypad
+            if int(self.data_len % 2) == 0:
+                possible_keypad = self.__decode_hid_keypad(self.data_hex)
+
+                if possible_keypad:
+                    entry.update({
+                        "possible_hid_keypad": possible_keypad
+                    })
+
+        # Aux line toggle.
+        elif self.aux_status is not None:
+            entry = {
+                "aux_status": self.aux_status,
+                "log_msg": self.log_msg,
+                "time_raw": self.time_raw
+            }
+
+        # Textual log.
+        else:
+            entry = {
+                "time_raw": self.time_raw,
+                "log_msg": self.log_msg
+            }
+
+        if self.dts_us is not None:
+            entry.update({"dts": self.dts})
+
+        return entry
+
+
+    def __getitem__(self, key):
+        """Look up a field the same way as on the dict form of the entry.
+
+        Args:
+            key (str): Field name.
+
+        Raises:
+            KeyError: The entry doesn't have the field.
+
+        Returns:
+            object: Field value.
+        """
+
+        if key in ["time_raw", "data_hex", "data_len", "log_msg", "aux_status"]:
+            value = getattr(self, key)
+
+            if value is not None and not (key == "log_msg" and self.data_hex is not None):
+                return value
+
+        elif key == "dts":
+            if self.dts_us is not None:
+                return self.dts
+
+        elif key.startswith("possible_") and self.data_hex is not None:
+            return self.to_dict()[key]
+
+        raise KeyError(key)
+
+
+    def __iter__(self):
+        """Iterate over field names in the same order as the dict form of the entry.
+        """
+
+        return iter(self.to_dict())
+
+
+    def __len__(self):
+        """Number of fields in the dict form of the entry.
+        """
+
+        return len(self.to_dict())
+
+
+    def __repr__(self):
+        return f"LogEntry({self.to_dict()!r})"
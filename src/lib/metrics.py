@@ -0,0 +1,446 @@
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+
+# Request and parse latency buckets in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, labels):
+    """Format label values for the text exposition format.
+
+    Args:
+        labelnames (tuple): Label names.
+        labels (tuple): Label values in the same order.
+
+    Returns:
+        str: {name="value",...} or "" without labels.
+    """
+
+    if not labelnames:
+        return ""
+
+    pairs = []
+
+    for name, value in zip(labelnames, labels):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        """Monotonically increasing count, one per combination of label values.
+
+        Args:
+            name (str): Metric name.
+            help_text (str): Description.
+            labelnames (tuple, optional): Label names. Defaults to ().
+        """
+
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.__values = {}
+        self.__lock = threading.Lock()
+
+
+    def inc(self, *labels, amount=1):
+        """Increment the count.
+
+        Args:
+            *labels (str): Label values in the order of labelnames.
+            amount (int, float, optional): Amount to add. Defaults to 1.
+        """
+
+        with self.__lock:
+            self.__values[labels] = self.__values.get(labels, 0) + amount
+
+
+    def snapshot(self):
+        """Copy the current values.
+
+        Returns:
+            dict: Label value tuples mapped to counts.
+        """
+
+        with self.__lock:
+            return dict(self.__values)
+
+
+    def reset(self):
+        """Drop every value.
+        """
+
+        with self.__lock:
+            self.__values = {}
+
+
+    def merge(self, values):
+        """Add counts from a snapshot taken in another process.
+
+        Args:
+            values (dict): Snapshot from snapshot().
+        """
+
+        with self.__lock:
+            for labels, value in values.items():
+                self.__values[labels] = self.__values.get(labels, 0) + value
+
+
+    def render(self):
+        """Render the metric in the text exposition format.
+
+        Returns:
+            list: Lines.
+        """
+
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+
+        for labels, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+
+        return lines
+
+
+    def summary(self):
+        """Summarize the metric.
+
+        Returns:
+            dict: Formatted label sets mapped to counts.
+        """
+
+        return {_format_labels(self.labelnames, labels) or "total": value
+                for labels, value in sorted(self.snapshot().items())}
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Distribution of observed values in cumulative buckets, one per combination of label
+           values.
+
+        Args:
+            name (str): Metric name.
+            help_text (str): Description.
+            labelnames (tuple, optional): Label names. Defaults to ().
+            buckets (tuple, optional): Sorted bucket upper bounds. Defaults to DEFAULT_BUCKETS.
+        """
+
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.__values = {}
+        self.__lock = threading.Lock()
+
+
+    def observe(self, value, *labels):
+        """Record a value.
+
+        Args:
+            value (int, float): Observed value, for example a duration in seconds.
+            *labels (str): Label values in the order of labelnames.
+        """
+
+        bucket_idx = bisect_left(self.buckets, value)
+
+        with self.__lock:
+            record = self.__values.get(labels)
+
+            if record is None:
+                # Per-bucket counts (the last one is +Inf), sum and count.
+                record = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self.__values[labels] = record
+
+            record[0][bucket_idx] += 1
+            record[1] += value
+            record[2] += 1
+
+
+    def snapshot(self):
+        """Copy the current values.
+
+        Returns:
+            dict: Label value tuples mapped to [bucket counts, sum, count].
+        """
+
+        with self.__lock:
+            return {labels: [list(record[0]), record[1], record[2]]
+                    for labels, record in self.__values.items()}
+
+
+    def reset(self):
+        """Drop every observation.
+        """
+
+        with self.__lock:
+            self.__values = {}
+
+
+    def merge(self, values):
+        """Add observations from a snapshot taken in another process.
+
+        Args:
+            values (dict): Snapshot from snapshot().
+        """
+
+        with self.__lock:
+            for labels, (bucket_cts, value_sum, value_ct) in values.items():
+                record = self.__values.setdefault(labels,
+                    [[0] * (len(self.buckets) + 1), 0.0, 0])
+
+                for bucket_idx, bucket_ct in enumerate(bucket_cts):
+                    record[0][bucket_idx] += bucket_ct
+
+                record[1] += value_sum
+                record[2] += value_ct
+
+
+    def render(self):
+        """Render the metric in the text exposition format.
+
+        Returns:
+            list: Lines.
+        """
+
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+
+        for labels, (bucket_cts, value_sum, value_ct) in sorted(self.snapshot().items()):
+            cumulative = 0
+
+            for bound, bucket_ct in zip(self.buckets + ("+Inf",), bucket_cts):
+                cumulative += bucket_ct
+                bucket_labels = _format_labels(self.labelnames + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {value_sum}")
+            lines.append(f"{self.name}_count{label_str} {value_ct}")
+
+        return lines
+
+
+    def summary(self):
+        """Summarize the metric. Percentiles are the upper bound of the bucket they fall in.
+
+        Returns:
+            dict: Formatted label sets mapped to count, sum, mean, p50 and p95.
+        """
+
+        summary = {}
+
+        for labels, (bucket_cts, value_sum, value_ct) in sorted(self.snapshot().items()):
+            record = {
+                "count": value_ct,
+                "sum": round(value_sum, 6),
+                "mean": round(value_sum / value_ct, 6) if value_ct else None
+            }
+
+            for pct_name, pct in [("p50", 0.5), ("p95", 0.95)]:
+                cumulative = 0
+
+                for bound, bucket_ct in zip(self.buckets + ("+Inf",), bucket_cts):
+                    cumulative += bucket_ct
+
+                    if cumulative >= pct * value_ct:
+                        record.update({pct_name: bound})
+                        break
+
+            summary.update({_format_labels(self.labelnames, labels) or "total": record})
+
+        return summary
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """Collection of metrics that can be rendered for scraping or summarized.
+        """
+
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+        self.__server = None
+
+
+    def __get_or_create(self, metric_class, name, *args, **kwargs):
+        with self.__lock:
+            if name not in self.__metrics:
+                self.__metrics[name] = metric_class(name, *args, **kwargs)
+
+            return self.__metrics[name]
+
+
+    def counter(self, name, help_text, labelnames=()):
+        """Get a counter, creating it the first time.
+
+        Args:
+            name (str): Metric name.
+            help_text (str): Description.
+            labelnames (tuple, optional): Label names. Defaults to ().
+
+        Returns:
+            Counter: The counter.
+        """
+
+        return self.__get_or_create(Counter, name, help_text, labelnames)
+
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Get a histogram, creating it the first time.
+
+        Args:
+            name (str): Metric name.
+            help_text (str): Description.
+            labelnames (tuple, optional): Label names. Defaults to ().
+            buckets (tuple, optional): Sorted bucket upper bounds. Defaults to DEFAULT_BUCKETS.
+
+        Returns:
+            Histogram: The histogram.
+        """
+
+        return self.__get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+
+    def snapshot(self):
+        """Copy every metric's values, for example to send them from a worker process.
+
+        Returns:
+            dict: Metric names mapped to values.
+        """
+
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+    def reset(self):
+        """Drop every metric's values, for example in a forked worker process that inherited
+           its parent's.
+        """
+
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+
+        for metric in metrics:
+            metric.reset()
+
+
+    def merge(self, snapshot):
+        """Add values from a snapshot taken in another process. Metrics this registry doesn't
+           have are ignored.
+
+        Args:
+            snapshot (dict): Snapshot from snapshot().
+        """
+
+        with self.__lock:
+            metrics = dict(self.__metrics)
+
+        for name, values in snapshot.items():
+            if name in metrics:
+                metrics[name].merge(values)
+
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: Exposition text.
+        """
+
+        with self.__lock:
+            metrics = [self.__metrics[name] for name in sorted(self.__metrics)]
+
+        lines = []
+
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+
+    def summary(self):
+        """Summarize every metric that has values.
+
+        Returns:
+            dict: Metric names mapped to per-label summaries.
+        """
+
+        with self.__lock:
+            metrics = [self.__metrics[name] for name in sorted(self.__metrics)]
+
+        return {metric.name: metric.summary() for metric in metrics if metric.snapshot()}
+
+
+    def serve(self, host="127.0.0.1", port=9464):
+        """Serve the metrics for scraping from http://<host>:<port>/metrics in a background
+           thread.
+
+        Args:
+            host (str, optional): Address to listen on. Defaults to "127.0.0.1".
+            port (int, optional): Port to listen on. Defaults to 9464.
+        """
+
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = registry.render().encode()
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.__server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.__server.daemon_threads = True
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+
+
+    def stop(self):
+        """Stop serving metrics.
+        """
+
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+
+
+# Registry the automator's components record to.
+METRICS = MetricsRegistry()
+
+HTTP_REQUESTS = METRICS.counter("espkey_http_requests_total",
+    "HTTP requests sent to ESPKeys.", ("device", "method", "endpoint", "status"))
+HTTP_FAILURES = METRICS.counter("espkey_http_request_failures_total",
+    "HTTP requests to ESPKeys that raised an error or didn't return 2xx or 304.",
+    ("device", "method", "endpoint"))
+HTTP_RESPONSE_BYTES = METRICS.counter("espkey_http_response_bytes_total",
+    "Response body bytes received from ESPKeys.", ("device", "endpoint"))
+HTTP_LATENCY = METRICS.histogram("espkey_http_request_seconds",
+    "HTTP request latency to ESPKeys.", ("device", "method", "endpoint"))
+HTTP_COALESCED = METRICS.counter("espkey_http_coalesced_total",
+    "GET requests answered by sharing a request already in flight to the same URL.",
+    ("device", "endpoint"))
+CACHE_LOOKUPS = METRICS.counter("espkey_cache_lookups_total",
+    "Cached response lookups by outcome: fresh, revalidated or miss.", ("device", "outcome"))
+LOG_PARSE_LATENCY = METRICS.histogram("espkey_log_parse_seconds", "Time to parse a log.",
+    ("device",), buckets=(0.0005, 0.001, 0.0025) + DEFAULT_BUCKETS)
+LOG_LINES = METRICS.counter("espkey_log_lines_parsed_total", "Log lines parsed.", ("device",))
+CREDENTIALS = METRICS.counter("espkey_credentials_decoded_total",
+    "Credential reads parsed from logs.", ("device",))
+OPERATIONS = METRICS.counter("espkey_operations_total",
+    "Recipe operations run by outcome: ok or error.", ("device", "operation", "outcome"))
+OPERATION_LATENCY = METRICS.histogram("espkey_operation_seconds",
+    "Recipe operation latency.", ("device", "operation"))
@@ -0,0 +1,458 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+import datetime
+import json
+import threading
+import time
+
+
+class DeviceTrend:
+    def __init__(self, window=300, downsample_sec=60, leak_bytes_per_min=256, min_heap=8192,
+                 voltage_drop=0.1, min_samples=10, min_span_sec=60):
+        """Rolling diagnostics for one ESPKey. Samples are kept in a fixed-size ring buffer and
+           every statistic is updated as samples arrive and leave it, so each sample costs the
+           same however long the monitor runs.
+
+        Args:
+            window (int, optional): Samples kept in the ring buffer. Defaults to 300.
+            downsample_sec (int, float, optional): Seconds of samples summarized in each
+                                                   history record. Defaults to 60.
+            leak_bytes_per_min (int, float, optional): Heap decline over the window that counts
+                                                       as a leak. Defaults to 256.
+            min_heap (int, optional): Free heap in bytes below which to alert. Defaults to 8192.
+            voltage_drop (float, optional): Fraction the analog reading can fall below its
+                                            moving baseline before alerting. Defaults to 0.1.
+            min_samples (int, optional): Samples needed before leak and voltage alerts are
+                                         raised. Defaults to 10.
+            min_span_sec (int, float, optional): Seconds the ring buffer must cover before the
+                                                 heap trend is trusted. Defaults to 60.
+        """
+
+        self.__samples = deque(maxlen=window)
+        self.__downsample_sec = downsample_sec
+        self.__leak_bytes_per_sec = leak_bytes_per_min / 60
+        self.__min_heap = min_heap
+        self.__voltage_drop = voltage_drop
+        self.__min_samples = min_samples
+        self.__min_span_sec = min_span_sec
+
+        # Running sums for a least-squares fit of heap against time over the ring buffer.
+        # Times are relative to the first sample to keep the sums well conditioned.
+        self.__origin = None
+        self.__sum_t = 0.0
+        self.__sum_h = 0.0
+        self.__sum_tt = 0.0
+        self.__sum_th = 0.0
+
+        # Slow moving average of the analog reading.
+        self.__analog_baseline = None
+        self.__analog_alpha = 0.05
+        self.__analog_ct = 0
+
+        self.__last_gpio = None
+        self.__active = set()
+        self.__bucket = None
+
+
+    def __add_fit(self, t, heap, sign):
+        """Add a sample to, or remove it from, the running heap fit.
+
+        Args:
+            t (float): Seconds since the first sample.
+            heap (int): Free heap in bytes.
+            sign (int): 1 to add the sample, -1 to remove it.
+        """
+
+        self.__sum_t += sign * t
+        self.__sum_h += sign * heap
+        self.__sum_tt += sign * t * t
+        self.__sum_th += sign * t * heap
+
+
+    @property
+    def heap_slope(self):
+        """Heap trend in bytes per second over the ring buffer, or None without enough
+           samples.
+        """
+
+        sample_ct = len(self.__samples)
+
+        if sample_ct < 2:
+            return None
+
+        denominator = (sample_ct * self.__sum_tt) - (self.__sum_t ** 2)
+
+        if denominator <= 0:
+            return None
+
+        return ((sample_ct * self.__sum_th) - (self.__sum_t * self.__sum_h)) / denominator
+
+
+    def __raise(self, alert_type, alerts, details):
+        """Raise an alert once until its condition clears.
+
+        Args:
+            alert_type (str): Alert name.
+            alerts (list): Alerts for the current sample to add to.
+            details (dict): Readings that triggered the alert.
+        """
+
+        if alert_type not in self.__active:
+            self.__active.add(alert_type)
+            alerts.append(dict({"alert": alert_type}, **details))
+
+
+    def __clear(self, alert_type, alerts, details):
+        """Clear an active alert.
+
+        Args:
+            alert_type (str): Alert name.
+            alerts (list): Alerts for the current sample to add to.
+            details (dict): Readings that cleared the alert.
+        """
+
+        if alert_type in self.__active:
+            self.__active.remove(alert_type)
+            alerts.append(dict({"alert": alert_type, "cleared": True}, **details))
+
+
+    def __downsample(self, ts, heap, analog, gpio):
+        """Add a sample to the current history bucket.
+
+        Args:
+            ts (float): Unix time the sample was taken.
+            heap (int): Free heap in bytes.
+            analog (int): Analog reading.
+            gpio (dict): Parsed GPIO state.
+
+        Returns:
+            dict, None: The previous bucket's history record if this sample started a new one.
+        """
+
+        bucket_start = ts - (ts % self.__downsample_sec)
+        record = None
+
+        if self.__bucket is not None and self.__bucket['start'] != bucket_start:
+            record = self.flush()
+
+        if self.__bucket is None:
+            self.__bucket = {
+                "start": bucket_start,
+                "samples": 0,
+                "heap": [heap, heap, 0],
+                "analog": [analog, analog, 0]
+            }
+
+        bucket = self.__bucket
+        bucket['samples'] += 1
+        bucket['gpio'] = gpio
+
+        for key, value in [("heap", heap), ("analog", analog)]:
+            stats = bucket[key]
+            stats[0] = min(stats[0], value)
+            stats[1] = max(stats[1], value)
+            stats[2] += value
+
+        return record
+
+
+    def flush(self):
+        """Close the current history bucket.
+
+        Returns:
+            dict, None: History record with min, max and mean heap and analog readings and the
+                        last GPIO state, or None if there were no samples.
+        """
+
+        bucket = self.__bucket
+        self.__bucket = None
+
+        if bucket is None:
+            return None
+
+        record = {
+            "start": datetime.datetime.utcfromtimestamp(bucket['start']).isoformat(),
+            "samples": bucket['samples'],
+            "gpio": bucket['gpio']
+        }
+
+        for key in ["heap", "analog"]:
+            low, high, total = bucket[key]
+            record.update({key: {"min": low, "max": high,
+                                 "mean": round(total / bucket['samples'], 1)}})
+
+        return record
+
+
+    def add(self, ts, diagnostics):
+        """Add a diagnostics sample.
+
+        Args:
+            ts (float): Unix time the sample was taken.
+            diagnostics (dict): Diagnostics as returned by ESPKey.get_diagnostics().
+
+        Returns:
+            tuple(list, dict): Alerts raised or cleared by this sample and a history record if
+                the sample closed a history bucket, otherwise None.
+        """
+
+        heap = diagnostics['heap']
+        analog = diagnostics['analog']
+        gpio = diagnostics['parsed']
+        alerts = []
+
+        # Update the heap fit, dropping the sample that falls out of the ring buffer.
+        if self.__origin is None:
+            self.__origin = ts
+
+        if len(self.__samples) == self.__samples.maxlen:
+            old_t, old_heap = self.__samples[0]
+            self.__add_fit(old_t, old_heap, -1)
+
+        t = ts - self.__origin
+        self.__samples.append((t, heap))
+        self.__add_fit(t, heap, 1)
+
+        # Heap exhaustion.
+        if heap < self.__min_heap:
+            self.__raise("heap_low", alerts, {"heap": heap})
+
+        else:
+            self.__clear("heap_low", alerts, {"heap": heap})
+
+        slope = self.heap_slope
+
+        span_sec = self.__samples[-1][0] - self.__samples[0][0]
+
+        if slope is not None and len(self.__samples) >= self.__min_samples and \
+           span_sec >= self.__min_span_sec:
+            if slope < -self.__leak_bytes_per_sec:
+                self.__raise("heap_leak", alerts, {
+                    "heap": heap,
+                    "bytes_per_min": round(slope * 60, 1),
+                    "exhaustion_sec": round(heap / -slope, 1)
+                })
+
+            elif slope >= 0:
+                self.__clear("heap_leak", alerts, {"heap": heap})
+
+        # Supply voltage drops against a slow moving baseline.
+        self.__analog_ct += 1
+
+        if self.__analog_baseline is None:
+            self.__analog_baseline = float(analog)
+
+        if self.__analog_ct >= self.__min_samples and \
+           analog < self.__analog_baseline * (1 - self.__voltage_drop):
+            self.__raise("voltage_drop", alerts, {"analog": analog,
+                         "baseline": round(self.__analog_baseline, 1)})
+
+        # Don't let a sustained drop drag the baseline down with it.
+        else:
+            if analog >= self.__analog_baseline * (1 - (self.__voltage_drop / 2)):
+                self.__clear("voltage_drop", alerts, {"analog": analog,
+                             "baseline": round(self.__analog_baseline, 1)})
+
+            self.__analog_baseline += self.__analog_alpha * (analog - self.__analog_baseline)
+
+        # Line state changes.
+        if self.__last_gpio is not None and gpio != self.__last_gpio:
+            alerts.append({
+                "alert": "gpio_change",
+                "changed": {pin: state for pin, state in gpio.items()
+                            if self.__last_gpio.get(pin) != state}
+            })
+
+        self.__last_gpio = gpio
+
+        return (alerts, self.__downsample(ts, heap, analog, gpio))
+
+
+    def status(self):
+        """Current state of the device.
+
+        Returns:
+            dict: Sample count, latest heap, heap trend, analog baseline and active alerts.
+        """
+
+        slope = self.heap_slope
+
+        return {
+            "samples": len(self.__samples),
+            "heap": self.__samples[-1][1] if self.__samples else None,
+            "heap_bytes_per_min": None if slope is None else round(slope * 60, 1),
+            "analog_baseline": None if self.__analog_baseline is None else
+                               round(self.__analog_baseline, 1),
+            "gpio": self.__last_gpio,
+            "active_alerts": sorted(self.__active)
+        }
+
+
+class Monitor:
+    def __init__(self, espkeys, interval=1.0, history_file=None, event_stream=None,
+                 trend_config=None):
+        """Poll diagnostics from a fleet of ESPKeys, watch the trends and alert on heap leaks,
+           low heap, voltage drops, line state changes and unreachable devices. Each ESPKey
+           keeps its HTTP connection open between polls.
+
+        Args:
+            espkeys (dict): ESPKey name mapped to ESPKey object.
+            interval (int, float, optional): Seconds between polls. Defaults to 1.0.
+            history_file (str, optional): JSONL file for downsampled history and alerts.
+                                          Defaults to None.
+            event_stream (EventStream, optional): Event stream to publish alerts to as "alert"
+                                                  events. Defaults to None.
+            trend_config (dict, optional): DeviceTrend keyword arguments. Defaults to None.
+        """
+
+        self.__espkeys = espkeys
+        self.__interval = interval
+        self.__history_file = history_file
+        self.__event_stream = event_stream
+        self.__trends = {name: DeviceTrend(**(trend_config or {})) for name in espkeys}
+        self.__stop_event = threading.Event()
+        self.__history_lock = threading.Lock()
+        self.__unreachable = set()
+
+
+    def __record(self, device, record_type, record):
+        """Append a record to the history file.
+
+        Args:
+            device (str): ESPKey name.
+            record_type (str): "history" or "alert".
+            record (dict): Record data.
+        """
+
+        if self.__history_file is None:
+            return
+
+        line = json.dumps(dict({"type": record_type, "device": device}, **record))
+
+        with self.__history_lock:
+            with open(self.__history_file, "a") as f:
+                f.write(line + "\n")
+
+
+    def __alert(self, device, alert):
+        """Publish and record an alert.
+
+        Args:
+            device (str): ESPKey name.
+            alert (dict): Alert data.
+        """
+
+        alert = dict({"time": datetime.datetime.utcnow().isoformat()}, **alert)
+
+        if self.__event_stream is not None:
+            self.__event_stream.publish("alert", device, alert)
+
+        self.__record(device, "alert", alert)
+
+
+    def __poll(self, device):
+        """Poll one ESPKey and feed its trend.
+
+        Args:
+            device (str): ESPKey name.
+        """
+
+        ts = time.time()
+
+        try:
+            diagnostics = self.__espkeys[device].get_diagnostics()
+
+        except Exception as e:
+            if device not in self.__unreachable:
+                self.__unreachable.add(device)
+                self.__alert(device, {"alert": "unreachable", "error": str(e)})
+
+            return
+
+        if device in self.__unreachable:
+            self.__unreachable.remove(device)
+            self.__alert(device, {"alert": "unreachable", "cleared": True})
+
+        alerts, history = self.__trends[device].add(ts, diagnostics)
+
+        for alert in alerts:
+            self.__alert(device, alert)
+
+        if history is not None:
+            self.__record(device, "history", history)
+
+
+    def run(self, duration=None):
+        """Poll until stop() is called or the duration passes.
+
+        Args:
+            duration (int, float, optional): Seconds to run. Defaults to None which runs until
+                                             stop() is called or the user hits Ctrl-C.
+
+        Returns:
+            dict: ESPKey name mapped to final status.
+        """
+
+        deadline = None if duration is None else time.monotonic() + duration
+
+        # Polls that haven't finished, by ESPKey.
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=min(32, max(1, len(self.__espkeys)))) as executor:
+            try:
+                while not self.__stop_event.is_set():
+                    cycle_start = time.monotonic()
+
+                    # An ESPKey that's still answering its last poll isn't polled again.
+                    for device in self.__espkeys:
+                        if device not in in_flight:
+                            in_flight.update({device: executor.submit(self.__poll, device)})
+
+                    # Don't let one slow ESPKey hold up the next cycle for the rest.
+                    wait(in_flight.values(), timeout=self.__interval)
+
+                    for device, future in list(in_flight.items()):
+                        if future.done():
+                            del in_flight[device]
+                            future.result()
+
+                    if deadline is not None and time.monotonic() >= deadline:
+                        break
+
+                    self.__stop_event.wait(max(0, self.__interval -
+                                               (time.monotonic() - cycle_start)))
+
+            # Ctrl-C is the normal way to stop an open-ended run.
+            except KeyboardInterrupt:
+                pass
+
+        for device, trend in self.__trends.items():
+            history = trend.flush()
+
+            if history is not None:
+                self.__record(device, "history", history)
+
+        return self.status()
+
+
+    def stop(self):
+        """Stop polling after the current cycle.
+        """
+
+        self.__stop_event.set()
+
+
+    def status(self):
+        """Current state of every device.
+
+        Returns:
+            dict: ESPKey name mapped to status.
+        """
+
+        status = {}
+
+        for device, trend in self.__trends.items():
+            status.update({device: dict(trend.status(),
+                                        reachable=device not in self.__unreachable)})
+
+        return status
@@ -0,0 +1,173 @@
+import json
+import os
+import queue
+import sys
+import threading
+
+from .log_entry import LogEntry
+from .profiler import PROFILER
+
+
+class OutputWriter:
+    def __init__(self, queue_size=64, fsync=True, fsync_batch=16):
+        """Background stage that serializes and writes task logs so the threads running tasks
+           can go on to their next requests. The queue is bounded, so if the disk can't keep
+           up tasks wait for room instead of holding every log in memory. Files are synced to
+           disk in batches, or as soon as there is nothing else waiting to be written.
+
+        Args:
+            queue_size (int, optional): Logs that can wait to be written. Defaults to 64.
+            fsync (bool, optional): Sync files to disk. Defaults to True.
+            fsync_batch (int, optional): Files to write before syncing them. Defaults to 16.
+        """
+
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__fsync = fsync
+        self.__fsync_batch = fsync_batch
+        self.__error = None
+
+        # Written files that haven't been synced, and callbacks waiting on them.
+        self.__unsynced = []
+        self.__callbacks = []
+
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+
+    def __write(self, file_name, data, dumps_kwargs):
+        """Serialize and write a log.
+
+        Args:
+            file_name (str): Log file name.
+            data (dict, str): Log data, or an already serialized log.
+            dumps_kwargs (dict): Keyword arguments for json.dumps().
+        """
+
+        if not isinstance(data, str):
+            with PROFILER.span("serialize", file=file_name):
+                data = json.dumps(data, default=LogEntry.json_default, **dumps_kwargs)
+
+        with PROFILER.span("write", file=file_name):
+            f = open(file_name, "w")
+
+            try:
+                f.write(data)
+                f.flush()
+
+            except BaseException:
+                f.close()
+                raise
+
+        self.__unsynced.append((file_name, f))
+
+
+    def __sync(self):
+        """Sync written files to disk, then run the callbacks waiting on them.
+        """
+
+        with PROFILER.span("fsync", files=len(self.__unsynced)):
+            for file_name, f in self.__unsynced:
+                try:
+                    if self.__fsync:
+                        os.fsync(f.fileno())
+
+                finally:
+                    f.close()
+
+                print(f"Wrote log: {file_name}", file=sys.stderr)
+
+        self.__unsynced = []
+
+        for callback in self.__callbacks:
+            callback()
+
+        self.__callbacks = []
+
+
+    def __run(self):
+        """Write logs from the queue until a None is received.
+        """
+
+        while True:
+            item = self.__queue.get()
+
+            try:
+                if item is None:
+                    self.__sync()
+                    break
+
+                if self.__error is None:
+                    if item[0] == "write":
+                        self.__write(*item[1:])
+
+                    else:
+                        self.__callbacks.append(item[1])
+
+                    if len(self.__unsynced) >= self.__fsync_batch or self.__queue.empty():
+                        self.__sync()
+
+            except Exception as e:
+                # Keep draining so nothing blocks on a full queue, the error is raised to the
+                # caller on the next submit or on close.
+                self.__error = e
+
+                for _, f in self.__unsynced:
+                    f.close()
+
+                self.__unsynced = []
+                self.__callbacks = []
+
+            finally:
+                self.__queue.task_done()
+
+
+    def __raise_error(self):
+        if self.__error is not None:
+            raise self.__error
+
+
+    def submit(self, file_name, data, dumps_kwargs=None, callback=None):
+        """Queue a log to be written. Blocks while the queue is full.
+
+        Args:
+            file_name (str): Log file name.
+            data (dict, str): Log data to serialize, or an already serialized log.
+            dumps_kwargs (dict, optional): Keyword arguments for json.dumps(). Defaults to None.
+            callback (callable, optional): Called from the writer once the file is on disk.
+                                           Defaults to None.
+
+        Raises:
+            Exception: An earlier write failed.
+        """
+
+        self.__raise_error()
+        self.__queue.put(("write", file_name, data, dumps_kwargs or {}))
+
+        if callback is not None:
+            self.__queue.put(("call", callback))
+
+
+    def call(self, callback):
+        """Queue a callback to run once every log queued before it is on disk.
+
+        Args:
+            callback (callable): Function to call from the writer.
+
+        Raises:
+            Exception: An earlier write failed.
+        """
+
+        self.__raise_error()
+        self.__queue.put(("call", callback))
+
+
+    def close(self):
+        """Write and sync everything that's queued, then stop the writer.
+
+        Raises:
+            Exception: A write failed.
+        """
+
+        self.__queue.put(None)
+        self.__thread.join()
+        self.__raise_error()
@@ -0,0 +1,196 @@
+from contextlib import contextmanager, nullcontext
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+class Profiler:
+    def __init__(self):
+        """Record timed spans around the phases of a run, such as HTTP requests, log parsing
+           and serialization. Spans are written as a Chrome trace which Perfetto, speedscope
+           and chrome://tracing display as a flame graph. Recording is off until enable() is
+           called and a disabled profiler costs one attribute check per span.
+        """
+
+        self.enabled = False
+        self.__events = []
+        self.__lock = threading.Lock()
+
+
+    def enable(self):
+        """Start recording spans.
+        """
+
+        self.enabled = True
+
+
+    def reset(self):
+        """Drop recorded spans, for example in a forked worker process that inherited its
+           parent's.
+        """
+
+        with self.__lock:
+            self.__events = []
+
+
+    def span(self, name, category="phase", **args):
+        """Time a block of code.
+
+        Args:
+            name (str): Phase name, for example "parse_log".
+            category (str, optional): Trace category. Defaults to "phase".
+            **args: Extra details to attach to the span, for example the ESPKey name.
+
+        Returns:
+            contextmanager: Context manager that records the span when it exits.
+        """
+
+        if not self.enabled:
+            return nullcontext()
+
+        return self.__span(name, category, args)
+
+
+    @contextmanager
+    def __span(self, name, category, args):
+        # Wall clock start so spans from different processes line up, monotonic duration.
+        start_us = time.time_ns() // 1000
+        started = time.perf_counter_ns()
+
+        try:
+            yield
+
+        finally:
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start_us,
+                "dur": (time.perf_counter_ns() - started) / 1000,
+                "pid": os.getpid(),
+                "tid": threading.get_native_id()
+            }
+
+            if args:
+                event.update({"args": args})
+
+            with self.__lock:
+                self.__events.append(event)
+
+
+    def events(self):
+        """Copy the recorded spans.
+
+        Returns:
+            list: Chrome trace "complete" events.
+        """
+
+        with self.__lock:
+            return list(self.__events)
+
+
+    def merge(self, events):
+        """Add spans recorded in another process.
+
+        Args:
+            events (list): Events from events().
+        """
+
+        with self.__lock:
+            self.__events.extend(events)
+
+
+    def breakdown(self):
+        """Total time spent in each phase. Phases nest, for example "http" inside "get_log",
+           so totals don't add up to the wall time.
+
+        Returns:
+            dict: Wall time in ms and phase names mapped to count, total, mean and max in ms,
+                  slowest total first.
+        """
+
+        events = self.events()
+        phases = {}
+
+        for event in events:
+            phase = phases.setdefault(event['name'], {"count": 0, "total_ms": 0.0,
+                                                      "max_ms": 0.0})
+            phase['count'] += 1
+            phase['total_ms'] += event['dur'] / 1000
+            phase['max_ms'] = max(phase['max_ms'], event['dur'] / 1000)
+
+        for phase in phases.values():
+            phase.update({"mean_ms": phase['total_ms'] / phase['count']})
+
+            for key in ["total_ms", "max_ms", "mean_ms"]:
+                phase[key] = round(phase[key], 3)
+
+        wall_ms = 0.0
+
+        if events:
+            wall_ms = (max(event['ts'] + event['dur'] for event in events) -
+                       min(event['ts'] for event in events)) / 1000
+
+        return {
+            "wall_ms": round(wall_ms, 3),
+            "phases": dict(sorted(phases.items(), key=lambda item: -item[1]['total_ms']))
+        }
+
+
+    def write_report(self, base_name, cprofile=None, memory=False):
+        """Write the trace and the per-phase breakdown, plus cProfile statistics and the top
+           memory allocations if they were collected.
+
+        Args:
+            base_name (str): File name prefix, for example "20240201-120000_profile".
+            cprofile (cProfile.Profile, optional): Stopped profiler to save. Defaults to None.
+            memory (bool, optional): Add a tracemalloc summary to the breakdown. tracemalloc
+                                     must be tracing. Defaults to False.
+
+        Returns:
+            list: Names of the files written.
+        """
+
+        file_names = []
+        trace_file = f"{base_name}_trace.json"
+
+        with open(trace_file, "w") as f:
+            f.write(json.dumps({"traceEvents": self.events(), "displayTimeUnit": "ms"}))
+
+        file_names.append(trace_file)
+
+        report = self.breakdown()
+
+        if cprofile is not None:
+            stats_file = f"{base_name}.pstats"
+            cprofile.dump_stats(stats_file)
+            file_names.append(stats_file)
+            report.update({"cprofile": stats_file})
+
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            top_stats = tracemalloc.take_snapshot().statistics("lineno")[:20]
+
+            report.update({
+                "memory": {
+                    "current_bytes": current,
+                    "peak_bytes": peak,
+                    "top": [{"location": str(stat.traceback), "bytes": stat.size,
+                             "count": stat.count} for stat in top_stats]
+                }
+            })
+
+        report_file = f"{base_name}.json"
+
+        with open(report_file, "w") as f:
+            f.write(json.dumps(report, indent=4))
+
+        file_names.append(report_file)
+
+        return file_names
+
+
+# Profiler the automator's components record to.
+PROFILER = Profiler()
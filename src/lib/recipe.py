@@ -1,24 +1,57 @@
+from concurrent.futures import as_completed, FIRST_COMPLETED, ProcessPoolExecutor, \
+    ThreadPoolExecutor, wait
 import datetime
+from functools import partial
 import json
+import multiprocessing
 from pprint import pprint
 import re
+import sys
+import threading
 import time
+import zlib
 
+from .correlator import Correlator
 from .espkey import ESPKey
+from .event_stream import EventStream, QueueSink
+from .journal import Journal
+from .log_entry import LogEntry
+from .metrics import METRICS, OPERATION_LATENCY, OPERATIONS
+from .output_writer import OutputWriter
+from .profiler import PROFILER
+from .scheduler import Schedule
+from .snapshot import SnapshotState
+from .weigand import WeigandEncoder
+
+
+# Operations that change the ESPKey. Their results are journaled as soon as they complete so a
+# resumed run never sends them twice. Other operations are run again on resume.
+STATE_CHANGING_OPERATIONS = ["delete_log", "restart", "send_weigand", "send_weigand_sequence",
+                             "set_config"]
 
 
 class InvlalidRecipe(ValueError):
     pass
 
 class Recipe:
-    def __init__(self, recipe_file):
+    def __init__(self, recipe_file, events=None, processes=None, resume=False):
         """Automator recipe
 
         Args:
             recipe_file (str): File to load recpie from.
+            events (dict, optional): Event stream sinks to use in addition to any in the
+                                     recipe's "events" key. Defaults to None.
+            processes (int, optional): Split the ESPKeys across this many processes. Overrides
+                                       the recipe's "processes" key. Defaults to None.
+            resume (bool, optional): Skip the task runs and actions an interrupted run of the
+                                     recipe completed. Defaults to False.
         """
 
         self.__file_name = recipe_file
+        self.__extra_events = events or {}
+
+        # Set when running as one shard of a sharded run.
+        self.__shard_queue = None
 
         # Load configuration from file.
         self.__recipe = self.__load_json(recipe_file) 
@@ -30,6 +63,50 @@ class Recipe:
         self.__espkeys = {}
         self.__hydrate_espkeys()
 
+        # Serialize access to each ESPKey when tasks run concurrently.
+        self.__espkey_locks = {espkey: threading.Lock() for espkey in self.__espkeys}
+
+        # Interrupts scheduled runs and delays.
+        self.__stop_event = threading.Event()
+
+        # Deduplicate and correlate log entries across pulls and devices.
+        self.__correlator = None
+        correlate = self.__recipe.get('correlate', False)
+
+        if correlate:
+            correlator_kwargs = {}
+
+            if isinstance(correlate, dict):
+                correlator_kwargs.update(correlate)
+
+            self.__correlator = Correlator(**correlator_kwargs)
+
+        # Only record what changed since the previous run.
+        self.__snapshots = None
+        diff = self.__recipe.get('diff', False)
+
+        if diff:
+            state_file = f"{recipe_file}.state"
+
+            if isinstance(diff, dict):
+                state_file = diff.get('state_file', state_file)
+
+            self.__snapshots = SnapshotState(state_file)
+
+        # Push new card reads as they're parsed. Sinks are opened when the recipe runs.
+        self.__event_stream = EventStream()
+
+        # Serializes and writes task logs in the background while the recipe runs.
+        self.__writer = None
+
+        # Number of processes to split the ESPKeys across.
+        self.__processes = processes or self.__recipe.get('processes', 1)
+
+        # Checkpoint completed work so an interrupted run can be resumed.
+        self.__resume = resume
+        self.__journal = None
+        self.__journal_state = {"runs": {}, "actions": {}}
+
 
     def __validate_send_weigand(self, config):
         """Validate specified weigand data.
@@ -48,13 +125,22 @@ class Recipe:
            valid = False
            errors.append("*: The send_weigand key can't be empty.")
 
+        elif "format" in config:
+            try:
+                self.__weigand_frames(config)
+
+            except (KeyError, TypeError, ValueError) as e:
+                valid = False
+                errors.append(f"format: Unable to encode weigand data: {e}")
+
         else:
             if "data" not in config:
                 valid = False
-                errors.append("data: A data string must be specified.")
+                errors.append("data: A data string or a format must be specified.")
 
             else:
-                if not re.match(r"^([0-9a-fA-f]+)\:([0-9]+)$", config['data']):
+                if not isinstance(config['data'], str) or \
+                    not re.match(r"^([0-9a-fA-f]+)\:([0-9]+)$", config['data']):
                     valid = False
                     errors.append("data: Invalid data format. It should ben in the format " \
                         "00aabbcc:26  where 00aabbcc is the hex representation of the weigand " \
@@ -63,6 +149,139 @@ class Recipe:
         return (valid, errors)
 
 
+    @staticmethod
+    def __weigand_frames(config):
+        """Build the frames described by a send_weigand action.
+
+        Args:
+            config (dict): send_weigand object.
+
+        Raises:
+            KeyError: A required key for the format is missing.
+            ValueError: The data can't be encoded.
+
+        Returns:
+            list: Frames as (hex string, bit length) tuples.
+        """
+
+        if "format" not in config:
+            weigand_parts = config['data'].split(":")
+
+            return [(weigand_parts[0], int(weigand_parts[1]))]
+
+        if not isinstance(config['format'], str):
+            raise ValueError("format must be a format name string.")
+
+        if config['format'] == "keypad":
+            return WeigandEncoder.encode_keypad(str(config['pin']),
+                burst=bool(config.get('burst', False)))
+
+        if any(not isinstance(config[key], int) or isinstance(config[key], bool)
+               for key in ["fc", "cn"]):
+            raise ValueError("fc and cn must be ints.")
+
+        return [WeigandEncoder.encode(config['format'], config['fc'], config['cn'])]
+
+
+    @staticmethod
+    def __validate_send_weigand_sequence(config):
+        """Validate a weigand frame sequence.
+
+        Args:
+            config (dict): send_weigand_sequence object.
+
+        Returns:
+            tuple(bool, list): Flag indicating valid data is valid and a list of errors.
+        """
+
+        errors = []
+        valid = True
+
+        if "frames" in config:
+            if not isinstance(config['frames'], list) or len(config['frames']) == 0:
+                valid = False
+                errors.append("frames: Must be a non-empty list of weigand data strings.")
+
+            else:
+                for frame in config['frames']:
+                    if not isinstance(frame, str) or \
+                        not re.match(r"^([0-9a-fA-F]+)\:([0-9]+)$", frame):
+                        valid = False
+                        errors.append(f"frames: Invalid data format \"{frame}\". It should be " \
+                            "in the format 00aabbcc:26.")
+
+        elif "format" in config:
+            if not isinstance(config['format'], str):
+                valid = False
+                errors.append("format: Must be a format name string.")
+
+            for key in ["fc", "cn_start", "cn_end"]:
+                if not isinstance(config.get(key), int) or isinstance(config.get(key), bool):
+                    valid = False
+                    errors.append(f"{key}: An int is required.")
+
+            if valid:
+                if config['cn_start'] > config['cn_end']:
+                    valid = False
+                    errors.append("cn_start: Must be less than or equal to cn_end.")
+
+                else:
+                    try:
+                        WeigandEncoder.encode(config['format'], config['fc'], config['cn_start'])
+                        WeigandEncoder.encode(config['format'], config['fc'], config['cn_end'])
+
+                    except ValueError as e:
+                        valid = False
+                        errors.append(f"format: {e}")
+
+        else:
+            valid = False
+            errors.append("*: Either \"frames\" or a \"format\" with \"fc\", \"cn_start\" " \
+                "and \"cn_end\" must be specified.")
+
+        if 'rate' in config:
+            if not isinstance(config['rate'], (int, float)) or isinstance(config['rate'], bool) or \
+                config['rate'] <= 0:
+                valid = False
+                errors.append("rate: Must be an int or float greater than 0.")
+
+        return (valid, errors)
+
+
+    @staticmethod
+    def __validate_set_config(config):
+        """Validate a configuration push.
+
+        Args:
+            config (dict): set_config object.
+
+        Returns:
+            tuple(bool, list): Flag indicating the action is valid and a list of errors.
+        """
+
+        errors = []
+        valid = True
+
+        if ("config" in config) == ("file" in config):
+            valid = False
+            errors.append("*: Exactly one of \"config\" or \"file\" must be specified.")
+
+        elif "config" in config and not isinstance(config['config'], dict):
+            valid = False
+            errors.append("config: Must be a dict.")
+
+        elif "file" in config and not isinstance(config['file'], str):
+            valid = False
+            errors.append("file: Must be a file name.")
+
+        for key in ["merge", "restart", "verify"]:
+            if key in config and not isinstance(config[key], bool):
+                valid = False
+                errors.append(f"{key}: Must be a bool.")
+
+        return (valid, errors)
+
+
     @staticmethod
     def __validate_espkeys(config):
         """ Validate espkey specifiers.
@@ -89,6 +308,244 @@ class Recipe:
                     errors.append(f"{espkey}: A base_url must be specified with " \
                         "an optional \"web_user\" and \"web_password\".")
 
+                rate_limit = config[espkey].get('rate_limit')
+
+                if rate_limit is not None and (not isinstance(rate_limit, (int, float)) or
+                                               isinstance(rate_limit, bool) or rate_limit <= 0):
+                    valid = False
+                    errors.append(f"{espkey}: rate_limit must be an int or float greater " \
+                        "than 0.")
+
+                timeout = config[espkey].get('timeout')
+                timeouts = timeout if isinstance(timeout, list) and len(timeout) == 2 else \
+                           [timeout]
+
+                if timeout is not None and not all(isinstance(value, (int, float)) and
+                                                   not isinstance(value, bool) and value > 0
+                                                   for value in timeouts):
+                    valid = False
+                    errors.append(f"{espkey}: timeout must be an int or float greater than 0 " \
+                        "or a [connect, read] list of them.")
+
+        return (valid, errors)
+
+
+    @staticmethod
+    def __validate_cache(config):
+        """Validate response cache settings.
+
+        Args:
+            config (dict): Cache settings with optional "ttl" and "file".
+
+        Returns:
+            tuple(bool, list): Flag indicating the settings are valid and a list of errors.
+        """
+
+        errors = []
+        valid = True
+
+        if not isinstance(config, dict):
+            return (False, ["*: Must be a dict with optional \"ttl\" and \"file\"."])
+
+        if 'ttl' in config:
+            if not isinstance(config['ttl'], (int, float)) or config['ttl'] < 0:
+                valid = False
+                errors.append("ttl: Must be an int or float of 0 or more.")
+
+        if 'file' in config and not isinstance(config['file'], str):
+            valid = False
+            errors.append("file: Must be a path.")
+
+        return (valid, errors)
+
+
+    @staticmethod
+    def __validate_concurrent(config):
+        """Validate the concurrent execution flag.
+
+        Args:
+            config (bool): Concurrent flag.
+
+        Returns:
+            tuple(bool, list): Flag indicating the setting is valid and a list of errors.
+        """
+
+        errors = []
+        valid = True
+
+        if not isinstance(config, bool):
+            valid = False
+            errors.append("*: Must be true or false.")
+
+        return (valid, errors)
+
+
+    @staticmethod
+    def __validate_correlate(config):
+        """Validate correlation settings.
+
+        Args:
+            config (bool, dict): true/false or a dict with optional "max_entries" and
+                                 "window_sec".
+
+        Returns:
+            tuple(bool, list): Flag indicating the settings are valid and a list of errors.
+        """
+
+        errors = []
+        valid = True
+
+        if isinstance(config, dict):
+            for key in config:
+                if key not in ["max_entries", "window_sec"]:
+                    valid = False
+                    errors.append(f"{key}: Unsupported setting. Use max_entries or window_sec.")
+
+            if 'max_entries' in config:
+                if not isinstance(config['max_entries'], int) or \
+                    isinstance(config['max_entries'], bool) or config['max_entries'] < 1:
+                    valid = False
+                    errors.append("max_entries: Must be an int greater than 0.")
+
+            if 'window_sec' in config:
+                if not isinstance(config['window_sec'], (int, float)) or \
+                    config['window_sec'] <= 0:
+                    valid = False
+                    errors.append("window_sec: Must be an int or float greater than 0.")
+
+        elif not isinstance(config, bool):
+            valid = False
+            errors.append("*: Must be true, false or a dict of correlation settings.")
+
+        return (valid, errors)
+
+
+    @staticmethod
+    def __validate_diff(config):
+        """Validate snapshot diff settings.
+
+        Args:
+            config (bool, dict): true/false or a dict with an optional "state_file".
+
+        Returns:
+            tuple(bool, list): Flag indicating the settings are valid and a list of errors.
+        """
+
+        errors = []
+        valid = True
+
+        if isinstance(config, dict):
+            if 'state_file' in config and not isinstance(config['state_file'], str):
+                valid = False
+                errors.append("state_file: Must be a path.")
+
+        elif not isinstance(config, bool):
+            valid = False
+            errors.append("*: Must be true, false or a dict with an optional \"state_file\".")
+
+        return (valid, errors)
+
+
+    @staticmethod
+    def __validate_events(config):
+        """Validate event stream sinks.
+
+        Args:
+            config (dict): Event sink settings.
+
+        Returns:
+            tuple(bool, list): Flag indicating the settings are valid and a list of errors.
+        """
+
+        errors = []
+        valid = True
+
+        if not isinstance(config, dict):
+            return (False, ["*: Must be a dict of event sinks."])
+
+        for key in config:
+            if key not in ["stdout", "unix_socket", "named_pipe", "sse"]:
+                valid = False
+                errors.append(f"{key}: Unsupported event sink. Use stdout, unix_socket, " \
+                    "named_pipe or sse.")
+
+        if 'stdout' in config and not isinstance(config['stdout'], bool):
+            valid = False
+            errors.append("stdout: Must be true or false.")
+
+        for key in ["unix_socket", "named_pipe"]:
+            if key in config and not isinstance(config[key], str):
+                valid = False
+                errors.append(f"{key}: Must be a path.")
+
+        if 'sse' in config:
+            if not isinstance(config['sse'], dict):
+                valid = False
+                errors.append("sse: Must be a dict with optional \"host\" and \"port\".")
+
+            elif 'port' in config['sse'] and not isinstance(config['sse']['port'], int):
+                valid = False
+                errors.append("sse.port: Must be an int.")
+
+        return (valid, errors)
+
+
+    @staticmethod
+    def __validate_processes(config):
+        """Validate the number of processes to shard ESPKeys across.
+
+        Args:
+            config (int): Number of processes.
+
+        Returns:
+            tuple(bool, list): Flag indicating the setting is valid and a list of errors.
+        """
+
+        errors = []
+        valid = True
+
+        if not isinstance(config, int) or isinstance(config, bool) or config < 1:
+            valid = False
+            errors.append("*: Must be an int greater than 0.")
+
+        return (valid, errors)
+
+
+    @staticmethod
+    def __validate_writer(config):
+        """Validate output writer settings.
+
+        Args:
+            config (dict): Writer settings with optional "queue_size", "fsync" and
+                           "fsync_batch".
+
+        Returns:
+            tuple(bool, list): Flag indicating the settings are valid and a list of errors.
+        """
+
+        errors = []
+        valid = True
+
+        if not isinstance(config, dict):
+            return (False, ["*: Must be a dict with optional \"queue_size\", \"fsync\" and " \
+                "\"fsync_batch\"."])
+
+        for key in config:
+            if key not in ["queue_size", "fsync", "fsync_batch"]:
+                valid = False
+                errors.append(f"{key}: Unsupported setting. Use queue_size, fsync or " \
+                    "fsync_batch.")
+
+        for key in ["queue_size", "fsync_batch"]:
+            if key in config and (not isinstance(config[key], int) or
+                                  isinstance(config[key], bool) or config[key] < 1):
+                valid = False
+                errors.append(f"{key}: Must be an int greater than 0.")
+
+        if 'fsync' in config and not isinstance(config['fsync'], bool):
+            valid = False
+            errors.append("fsync: Must be true or false.")
+
         return (valid, errors)
 
 
@@ -119,6 +576,13 @@ class Recipe:
                 errors.append(f"{task}: Must contain an \"actions[]\".") 
                 has_actions = False
 
+            schedule_validator = Schedule.validate(this_task)
+
+            if schedule_validator[0] is False:
+                valid = False
+                for error in schedule_validator[1]:
+                    errors.append(f"{task}: {error}")
+
             if has_actions:
                 action_ct = 0
 
@@ -136,24 +600,128 @@ class Recipe:
                                 for error in send_weigand_validator[1]:
                                     errors.append(f"{task}.actions.{action_ct}: {error}") 
 
+                        elif action["operation"] == "send_weigand_sequence":
+                            sequence_validator = self.__validate_send_weigand_sequence(action)
+
+                            if sequence_validator[0] is False:
+                                valid = False
+                                for error in sequence_validator[1]:
+                                    errors.append(f"{task}.actions.{action_ct}: {error}")
+
+                        elif action["operation"] == "set_config":
+                            set_config_validator = self.__validate_set_config(action)
+
+                            if set_config_validator[0] is False:
+                                valid = False
+                                for error in set_config_validator[1]:
+                                    errors.append(f"{task}.actions.{action_ct}: {error}")
+
                         elif action["operation"] == "delay":
                             if 'sec' in action:
-                                if (action['sec']):
-                                    if not (isinstance(action['sec'], int) or
-                                            isinstance(action['sec'], float)):
-                                        valid = False
-                                        errors.append(f"{task}.actions.{action_ct}: " \
-                                            "'sec' must be an int or float. ")
+                                if not isinstance(action['sec'], (int, float)) or \
+                                    isinstance(action['sec'], bool) or action['sec'] < 0:
+                                    valid = False
+                                    errors.append(f"{task}.actions.{action_ct}: " \
+                                        "'sec' must be an int or float of at least 0.")
                             else:
                                 valid = False
                                 errors.append(f"{task}.actions.{action_ct}: " \
                                     "'sec' is required.") 
 
+                        schedule_validator = Schedule.validate(action)
+
+                        if schedule_validator[0] is False:
+                            valid = False
+                            for error in schedule_validator[1]:
+                                errors.append(f"{task}.actions.{action_ct}: {error}")
+
                     action_ct += 1
 
+            if 'depends_on' in this_task:
+                dependencies = self.__dependencies(this_task)
+
+                if not isinstance(dependencies, list) or \
+                    not all(isinstance(dependency, str) for dependency in dependencies):
+                    valid = False
+                    errors.append(f"{task}: 'depends_on' must be a task name or a list of them.")
+
+                else:
+                    for dependency in dependencies:
+                        if dependency not in config:
+                            valid = False
+                            errors.append(f"{task}: 'depends_on' task \"{dependency}\" doesn't " \
+                                "exist.")
+
+        # Only look for cycles once every dependency is known to exist.
+        if valid:
+            cycle = self.__find_cycle(config)
+
+            if cycle is not None:
+                valid = False
+                errors.append(f"{cycle[0]}: 'depends_on' forms a cycle: {' -> '.join(cycle)}.")
+
         return (valid, errors)
 
 
+    @staticmethod
+    def __dependencies(this_task):
+        """Tasks a task depends on.
+
+        Args:
+            this_task (dict): Task configuration.
+
+        Returns:
+            list: Task names.
+        """
+
+        dependencies = this_task.get('depends_on', [])
+
+        if isinstance(dependencies, str):
+            return [dependencies]
+
+        return dependencies
+
+
+    def __find_cycle(self, tasks):
+        """Look for a dependency cycle between tasks.
+
+        Args:
+            tasks (dict): Tasks configuration segment.
+
+        Returns:
+            list, None: Task names around the cycle, starting and ending with the same task, or
+                        None if there isn't one.
+        """
+
+        # Depth-first search, tasks on the current path are "visiting".
+        states = {}
+
+        for start in tasks:
+            if start in states:
+                continue
+
+            path = [start]
+            stack = [iter(self.__dependencies(tasks[start]))]
+            states.update({start: "visiting"})
+
+            while stack:
+                dependency = next(stack[-1], None)
+
+                if dependency is None:
+                    states.update({path.pop(): "done"})
+                    stack.pop()
+
+                elif states.get(dependency) == "visiting":
+                    return path[path.index(dependency):] + [dependency]
+
+                elif dependency not in states:
+                    states.update({dependency: "visiting"})
+                    path.append(dependency)
+                    stack.append(iter(self.__dependencies(tasks[dependency])))
+
+        return None
+
+
     def __validate_recipe(self):
         """Validate the specified recpie
 
@@ -180,6 +748,17 @@ class Recipe:
             "tasks": self.__validate_tasks
         }
 
+        # Optional top level config keys
+        optional_top_level_key_validators = {
+            "cache": self.__validate_cache,
+            "concurrent": self.__validate_concurrent,
+            "correlate": self.__validate_correlate,
+            "diff": self.__validate_diff,
+            "events": self.__validate_events,
+            "processes": self.__validate_processes,
+            "writer": self.__validate_writer
+        }
+
         # Validate options
         for top_level_key in required_top_level_keys:
             if top_level_key not in self.__recipe:
@@ -194,6 +773,15 @@ class Recipe:
                     valid = False
                     error_descriptors.append(f" - {top_level_key}.{results[1]}")
 
+        for top_level_key in optional_top_level_key_validators:
+            if top_level_key in self.__recipe:
+                results = optional_top_level_key_validators[top_level_key](
+                    self.__recipe[top_level_key])
+
+                if results[0] is False:
+                    valid = False
+                    error_descriptors.append(f" - {top_level_key}.{results[1]}")
+
         # If the configuration was invalidated at any point...
         if valid is False:
             description_text = f"Recipe \"{self.__file_name}\" contains the following errors:\n"
@@ -212,7 +800,7 @@ class Recipe:
 
         for espkey in self.__recipe['espkeys']:
             this_ek_config = self.__recipe['espkeys'][espkey]
-            ek_config = {"base_url": this_ek_config['base_url']}
+            ek_config = {"base_url": this_ek_config['base_url'], "name": espkey}
 
             # If we have creds use them.
             if 'web_user' in this_ek_config and \
@@ -223,6 +811,16 @@ class Recipe:
                     'web_pass': this_ek_config['web_pass']
                 })
 
+            if 'rate_limit' in this_ek_config:
+                ek_config.update({'rate_limit': this_ek_config['rate_limit']})
+
+            if 'timeout' in this_ek_config:
+                ek_config.update({'timeout': this_ek_config['timeout']})
+
+            # Share response cache settings with every ESPKey.
+            if 'cache' in self.__recipe:
+                ek_config.update({'cache': self.__recipe['cache']})
+
             self.__espkeys.update({espkey: ESPKey(ek_config)})
 
 
@@ -244,17 +842,196 @@ class Recipe:
         return recipe
 
 
-    def run(self):
-        """Execute the recipe.
+    def __run_action(self, target_name, action):
+        """Run a single action against an ESPKey.
+
+        Args:
+            target_name (str): Name of the target ESPKey.
+            action (dict): Action configuration.
+
+        Returns:
+            dict: Action log data.
         """
 
-        for task in self.__recipe['tasks']:
+        target = self.__espkeys[target_name]
+        now = datetime.datetime.utcnow()
+
+        action_data = {
+            "action": action['operation'],
+            "run": now.isoformat()
+        }
+
+        # Delay without holding the ESPKey so other tasks can use it.
+        if action['operation'] == "delay":
+            self.__stop_event.wait(action['sec'])
+            action_data.update({"delay": action['sec']})
+
+            return action_data
+
+        started = time.perf_counter()
+        outcome = "error"
+
+        try:
+            with PROFILER.span(action['operation'], category="operation", device=target_name):
+                with self.__espkey_locks[target_name]:
+                    self.__run_operation(target_name, target, action, action_data)
+
+            outcome = "ok"
+
+        finally:
+            OPERATIONS.inc(target_name, action['operation'], outcome)
+            OPERATION_LATENCY.observe(time.perf_counter() - started, target_name,
+                action['operation'])
+
+        return action_data
+
+
+    def __run_operation(self, target_name, target, action, action_data):
+        """Run an ESPKey operation and add its result to the action log data.
+
+        Args:
+            target_name (str): Name of the target ESPKey.
+            target (ESPKey): Target ESPKey.
+            action (dict): Action configuration.
+            action_data (dict): Action log data.
+        """
+
+        # Get log data
+        if action['operation'] == "get_log":
+            log_entries = target.get_log(compact=True)
+
+            # Stream consumers only get reads they haven't been sent, whatever is logged.
+            self.__event_stream.publish_log(target_name, log_entries)
+
+            # Only keep entries added since the previous run.
+            if self.__snapshots is not None:
+                log_entries, snapshot = self.__snapshots.diff_log(target_name, log_entries)
+                action_data.update({"snapshot": snapshot})
+
+            # Only pass on entries we haven't seen before.
+            if self.__correlator is not None:
+                log_entries = self.__correlator.observe(target_name, log_entries)
+
+            action_data.update({
+                "result": log_entries
+            })
+
+        # Delete logs
+        elif action['operation'] == "delete_log":
+            with_post = False
+
+            if 'with_post' in action:
+                with_post = bool(action['with_post'])
+
+            kwargs_delete = {"post_method": with_post}
+
+            action_data.update({
+                "result": target.delete_log(**kwargs_delete)
+            })
+
+        # Get diagnostics
+        elif action['operation'] == "get_diagnostics":
+            action_data.update({
+                "result": target.get_diagnostics()
+            })
+
+        # Get config
+        elif action['operation'] == "get_config":
+            action_data.update({
+                "result": target.get_config()
+            })
+
+        # Get version
+        elif action['operation'] == "get_version":
+            action_data.update({
+                "result": target.get_version()
+            })
+
+        # Restart
+        elif action['operation'] == "restart":
+            action_data.update({
+                "result": target.restart()
+            })
+
+        # Send weigand
+        elif action['operation'] == "send_weigand":
+            frames = self.__weigand_frames(action)
+
+            if len(frames) == 1:
+                result = target.send_weigand(*frames[0])
+
+            # Keypad entries send one frame per key.
+            else:
+                result = len(target.send_weigand_sequence(frames)['failed']) == 0
+
+            action_data.update({
+                "result": result
+            })
+
+        # Send a sequence of weigand frames
+        elif action['operation'] == "send_weigand_sequence":
+            if 'frames' in action:
+                frames = []
+
+                for frame in action['frames']:
+                    weigand_parts = frame.split(":")
+                    frames.append((weigand_parts[0], int(weigand_parts[1])))
+
+            else:
+                frames = WeigandEncoder.encode_batch(action['format'], action['fc'],
+                    range(action['cn_start'], action['cn_end'] + 1))
+
+            action_data.update({
+                "result": target.send_weigand_sequence(frames, rate=action.get('rate'),
+                    verify_log=bool(action.get('verify_log', False)))
+            })
+
+        # Push a configuration
+        elif action['operation'] == "set_config":
+            desired = action.get('config')
+
+            if desired is None:
+                desired = self.__load_json(action['file'])
+
+            action_data.update({
+                "result": target.set_config(desired, merge=action.get('merge', False),
+                    verify=action.get('verify', True), restart=action.get('restart', False))
+            })
+
+        # Only keep what changed since the previous run.
+        if self.__snapshots is not None and \
+            action['operation'] in ["get_config", "get_diagnostics", "get_version"]:
+            result, snapshot = self.__snapshots.diff_value(target_name, action['operation'],
+                action_data['result'])
+            action_data.update({"result": result, "snapshot": snapshot})
+
+
+    def __run_task(self, task):
+        """Run a task, repeating it as scheduled and writing a log for each run.
+
+        Args:
+            task (str): Task name.
+        """
+
+        this_task = self.__recipe['tasks'][task]
+        target_name = this_task['target']
+        scheduled = Schedule.is_scheduled(this_task)
+
+        # Pick up after the runs an interrupted run of the recipe completed.
+        runs_done = self.__journal_state['runs'].get(task, 0)
+
+        for iteration in Schedule(this_task, self.__stop_event, start=runs_done):
             run_start = datetime.datetime.utcnow()
-            this_task = self.__recipe['tasks'][task]
-            target_name = this_task['target']
-            target = self.__espkeys[target_name]
+            pretty_json = True
+            json_dumps_kwargs = {}
+
+            file_name = f"{run_start.strftime('%Y%m%d-%H%M%S')}_{target_name}_{task}"
 
-            file_name = f"{run_start.strftime("%Y%m%d-%H%M%S")}_{target_name}_{task}.json"
+            # Scheduled runs can land in the same second so number them.
+            if scheduled:
+                file_name += f"_{iteration}"
+
+            file_name += ".json"
 
             log_data = {
                 "actions": [],
@@ -264,95 +1041,404 @@ class Recipe:
                 }
             }
 
+            if scheduled:
+                log_data['metadata'].update({"iteration": iteration})
+
+            # Journal records of read-only actions that haven't been needed yet.
+            pending = []
+
             # Loop through actions.
-            for action in this_task['actions']:
-                pretty_json = True
-                now = datetime.datetime.utcnow()
-                json_dumps_kwargs = {}
-
-                action_data = {
-                    "action": action['operation'],
-                    "run": now.isoformat()
-                }
+            for action_idx, action in enumerate(this_task['actions']):
+                # Reuse the results of actions an interrupted run already completed.
+                done = self.__journal_state['actions'].get((task, iteration, action_idx), [])
+
+                if done:
+                    log_data['actions'].extend(done)
+                    log_data['metadata'].update({"resumed": True})
+
+                changes_state = action['operation'] in STATE_CHANGING_OPERATIONS
+
+                for _ in Schedule(action, self.__stop_event, start=len(done)):
+                    # Read-only results would differ if run again after the ESPKey changes, for
+                    # example a log pulled before delete_log, so journal them first. Otherwise
+                    # they're left out of the journal and run again on resume.
+                    if changes_state:
+                        for record in pending:
+                            self.__checkpoint(record)
 
-                # Get log data
-                if action['operation'] == "get_log":
-                    action_data.update({
-                        "result": target.get_log()
-                    })
-
-                # Delete logs
-                elif action['operation'] == "delete_log":
-                    with_post = False
-
-                    if 'with_post' in action:
-                        with_post = bool(action['with_post'])
-                    
-                    kwargs_delete = {"post_method": with_post}
-
-                    action_data.update({
-                        "result": target.delete_log(**kwargs_delete)
-                    })
-
-                # Get diagnostics
-                elif action['operation'] == "get_diagnostics":
-                    action_data.update({
-                        "result": target.get_diagnostics()
-                    })
-
-                # Get config
-                elif action['operation'] == "get_config":
-                    action_data.update({
-                        "result": target.get_config()
-                    })
-
-                # Get config
-                elif action['operation'] == "get_config":
-                    action_data.update({
-                        "result": target.get_config()
-                    })
-
-                # Get version
-                elif action['operation'] == "get_version":
-                    action_data.update({
-                        "result": target.get_version()
-                    })
-
-                # Restart
-                elif action['operation'] == "restart":
-                    action_data.update({
-                        "result": target.restart()
-                    })
-
-                # Send weigand
-                elif action['operation'] == "send_weigand":
-                    weigand_parts = action['data'].split(":")
-                    weigand_parts[1] = int(weigand_parts[1])
-
-                    action_data.update({
-                        "result": target.send_weigand(weigand_parts[0], weigand_parts[1])
-                    })
-
-                # Delay
-                elif action['operation'] == "delay":
-                    time.sleep(action['sec'])
-                    action_data.update({"delay": action['sec']})
-
-
-                log_data['actions'].append(action_data.copy())
+                        pending = []
 
+                    action_data = self.__run_action(target_name, action)
+                    log_data['actions'].append(action_data.copy())
+                    record = {"type": "action", "task": task, "iteration": iteration,
+                              "action": action_idx, "data": action_data}
+
+                    if changes_state:
+                        self.__checkpoint(record)
+
+                    else:
+                        pending.append(record)
 
             # Write log data and inform user.
             if 'pretty_json' in this_task:
                 pretty_json=bool(this_task['pretty_json'])
-            
+
             if pretty_json:
                 json_dumps_kwargs.update({
                     "indent": 4
                 })
 
+            # Compact output can use the C encoder.
+            else:
+                json_dumps_kwargs.update({
+                    "separators": (",", ":")
+                })
+
+            self.__write_output(file_name, log_data, json_dumps_kwargs,
+                {"type": "run", "task": task, "iteration": iteration, "file": file_name})
+
+
+    def __checkpoint(self, record):
+        """Record completed work in the journal, or hand it to the parent process when running
+           as a shard.
+
+        Args:
+            record (dict): Journal record.
+        """
+
+        if self.__shard_queue is not None:
+            self.__shard_queue.put(("journal", record))
+
+        elif self.__journal is not None:
+            self.__journal.append(record)
+
+
+    def __write_output(self, file_name, log_data, json_dumps_kwargs, run_record):
+        """Queue a task's log data for the writer and record the run in the journal once it's on
+           disk, or hand both to the parent process when running as a shard.
+
+        Args:
+            file_name (str): Log file name.
+            log_data (dict): Log data.
+            json_dumps_kwargs (dict): Keyword arguments for json.dumps().
+            run_record (dict): Journal record for the task run.
+        """
+
+        if self.__shard_queue is not None:
+            with PROFILER.span("serialize", file=file_name):
+                json_str = json.dumps(log_data, default=LogEntry.json_default,
+                    **json_dumps_kwargs)
+
+            self.__shard_queue.put(("output", file_name, zlib.compress(json_str.encode(), 1)))
+            self.__checkpoint(run_record)
+            return
+
+        self.__writer.submit(file_name, log_data, json_dumps_kwargs,
+            callback=partial(self.__checkpoint, run_record))
+
+
+    def __run_tasks(self, espkeys=None):
+        """Run every task. Tasks run in order unless the recipe sets "concurrent", in which case
+           each task runs in its own thread and a task that is waiting doesn't hold up the others.
+           Tasks with dependencies always run as a graph.
+
+        Args:
+            espkeys (list, optional): Only run tasks targeting these ESPKeys. Defaults to None
+                                      which runs every task.
+        """
+
+        tasks = [task for task in self.__recipe['tasks'] if espkeys is None or
+                 self.__recipe['tasks'][task]['target'] in espkeys]
+
+        if len(tasks) == 0:
+            return
+
+        if any('depends_on' in self.__recipe['tasks'][task] for task in tasks):
+            self.__run_task_graph(tasks)
+
+        elif self.__recipe.get('concurrent', False):
+            with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+                futures = [executor.submit(self.__run_task, task) for task in tasks]
+
+                try:
+                    for future in futures:
+                        future.result()
+
+                except BaseException:
+                    # Wake up anything that's waiting so the pool can shut down.
+                    self.__stop_event.set()
+                    raise
+
+        else:
+            for task in tasks:
+                self.__run_task(task)
+
+
+    def __run_task_graph(self, tasks):
+        """Run tasks as a dependency graph. Each task starts in its own thread as soon as every
+           task it depends on has finished all of its runs, so independent branches run side by
+           side and the recipe takes as long as its longest chain of dependencies.
+
+        Args:
+            tasks (list): Task names.
+        """
+
+        # Dependencies each task is still waiting for.
+        waiting = {task: set(self.__dependencies(self.__recipe['tasks'][task])) for task in tasks}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            try:
+                while waiting or running:
+                    for task in [task for task in waiting if not waiting[task]]:
+                        del waiting[task]
+                        running.update({executor.submit(self.__run_task, task): task})
+
+                    if not running:
+                        raise RuntimeError("Tasks are waiting on each other: " \
+                            f"{', '.join(waiting)}.")
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                    for future in done:
+                        finished = running.pop(future)
+                        future.result()
+
+                        for dependencies in waiting.values():
+                            dependencies.discard(finished)
+
+            except BaseException:
+                # Wake up anything that's waiting so the pool can shut down.
+                self.__stop_event.set()
+                raise
+
+
+    def __plan_shards(self, processes):
+        """Split the ESPKeys that have tasks into balanced groups, one per process. ESPKeys whose
+           tasks depend on each other stay together.
+
+        Args:
+            processes (int): Maximum number of shards.
+
+        Returns:
+            list: Lists of ESPKey names.
+        """
+
+        task_cts = {}
+
+        for task in self.__recipe['tasks']:
+            target_name = self.__recipe['tasks'][task]['target']
+            task_cts.update({target_name: task_cts.get(target_name, 0) + 1})
+
+        # Join ESPKeys linked by task dependencies into one group.
+        groups = {espkey: [espkey] for espkey in task_cts}
+
+        for this_task in self.__recipe['tasks'].values():
+            for dependency in self.__dependencies(this_task):
+                group = groups[this_task['target']]
+                other_group = groups[self.__recipe['tasks'][dependency]['target']]
+
+                if group is not other_group:
+                    group.extend(other_group)
+
+                    for espkey in other_group:
+                        groups.update({espkey: group})
+
+        unique_groups = list({id(group): group for group in groups.values()}.values())
+        group_loads = {id(group): sum(task_cts[espkey] for espkey in group)
+                       for group in unique_groups}
+
+        shards = [[] for _ in range(min(processes, len(unique_groups)))]
+        shard_loads = [0] * len(shards)
+
+        # Give the busiest groups out first, each to the least loaded shard.
+        for group in sorted(unique_groups, key=lambda group: group_loads[id(group)], reverse=True):
+            shard_idx = shard_loads.index(min(shard_loads))
+            shards[shard_idx].extend(group)
+            shard_loads[shard_idx] += group_loads[id(group)]
+
+        return shards
+
+
+    def __forward_shard_queue(self, shard_queue):
+        """Write task logs, pass on events and record journal entries coming back from shard
+           processes until a None is received.
+
+        Args:
+            shard_queue (queue.Queue): Queue shared with the shard processes.
+        """
+
+        for message in iter(shard_queue.get, None):
+            if message[0] == "event":
+                self.__event_stream.send_line(message[1])
+
+            # Journal records wait for the logs queued before them.
+            elif message[0] == "journal":
+                self.__writer.call(partial(self.__checkpoint, message[1]))
+
+            else:
+                self.__writer.submit(message[1], zlib.decompress(message[2]).decode())
+
+
+    def __run_sharded(self, processes):
+        """Run tasks in a pool of processes, each owning a subset of the ESPKeys with its own
+           connections. Task logs and events are sent back to this process compressed.
+
+        Args:
+            processes (int): Maximum number of processes.
+
+        Returns:
+            list: Correlation summaries from each shard.
+        """
+
+        summaries = []
+
+        with multiprocessing.Manager() as manager:
+            shard_queue = manager.Queue()
+            forwarder = threading.Thread(target=self.__forward_shard_queue, args=(shard_queue,))
+            forwarder.start()
+
+            try:
+                shards = self.__plan_shards(processes)
+
+                with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+                    futures = [executor.submit(_run_shard, self.__file_name, shard, shard_queue,
+                               self.__event_stream.enabled, self.__journal_state)
+                               for shard in shards]
+
+                    for future in as_completed(futures):
+                        summary, metrics, spans, snapshots = future.result()
+                        summaries.append(summary)
+                        METRICS.merge(metrics)
+                        PROFILER.merge(spans)
+
+                        if self.__snapshots is not None:
+                            self.__snapshots.merge(snapshots)
+
+            finally:
+                shard_queue.put(None)
+                forwarder.join()
+
+        return summaries
+
+
+    def run_shard(self, espkeys, shard_queue, events=False, journal_state=None):
+        """Run the tasks for some of the recipe's ESPKeys as one shard of a sharded run.
+
+        Args:
+            espkeys (list): ESPKey names in this shard.
+            shard_queue (queue.Queue): Queue to send task logs, events and journal records to
+                                       the parent on.
+            events (bool, optional): Send events to the parent. Defaults to False.
+            journal_state (dict, optional): Completed work from a resumed journal. Defaults to
+                                            None.
+
+        Returns:
+            tuple(dict, dict): Correlation summary for this shard if correlation is enabled and
+                the snapshot state of its ESPKeys if diffing is enabled.
+        """
+
+        self.__shard_queue = shard_queue
+
+        if journal_state is not None:
+            self.__journal_state = journal_state
+
+        if events:
+            self.__event_stream = EventStream([QueueSink(shard_queue)])
+
+        self.__run_tasks(espkeys)
+
+        summary = None
+        snapshots = None
+
+        if self.__correlator is not None:
+            summary = self.__correlator.summary()
+
+        if self.__snapshots is not None:
+            snapshots = self.__snapshots.devices(espkeys)
+
+        return (summary, snapshots)
+
+
+    def run(self):
+        """Execute the recipe.
+        """
+
+        events_config = dict(self.__recipe.get('events', {}))
+        events_config.update(self.__extra_events)
+        self.__event_stream = EventStream.from_config(events_config)
+        summaries = []
+
+        journal_file = f"{self.__file_name}.journal"
+        self.__journal = Journal(journal_file, self.__file_name, resume=self.__resume)
+        self.__journal_state = self.__journal.state
+
+        self.__writer = OutputWriter(**self.__recipe.get('writer', {}))
+
+        try:
+            try:
+                if self.__processes > 1:
+                    summaries = self.__run_sharded(self.__processes)
+
+                else:
+                    self.__run_tasks()
+
+                    if self.__correlator is not None:
+                        summaries.append(self.__correlator.summary())
+
+            finally:
+                # Write what's queued, also when stopping on an error.
+                self.__writer.close()
+
+        except BaseException:
+            self.__journal.close()
+            print(f"Recipe stopped, progress saved to {journal_file}. Use --resume to continue.",
+                  file=sys.stderr)
+            raise
+
+        else:
+            # Nothing left to resume.
+            self.__journal.close(remove=True)
+
+            # The next run diffs against what this one recorded.
+            if self.__snapshots is not None:
+                self.__snapshots.save()
+
+        finally:
+            self.__event_stream.close()
+
+        if self.__correlator is not None:
+            run_end = datetime.datetime.utcnow()
+            file_name = f"{run_end.strftime('%Y%m%d-%H%M%S')}_correlation.json"
+
             with open(file_name, "w") as f:
-                json_str = json.dumps(log_data, **json_dumps_kwargs)
-                f.write(json_str)
-            
-            print(f"Wrote log: {file_name}")
\ No newline at end of file
+                f.write(json.dumps(Correlator.merge_summaries(summaries), indent=4))
+
+            print(f"Wrote correlation summary: {file_name}", file=sys.stderr)
+
+
+def _run_shard(recipe_file, espkeys, shard_queue, events, journal_state):
+    """Process pool entry point for one shard of a sharded recipe run.
+
+    Args:
+        recipe_file (str): Recipe file.
+        espkeys (list): ESPKey names in this shard.
+        shard_queue (queue.Queue): Queue to send task logs, events and journal records to the
+                                   parent on.
+        events (bool): Send events to the parent.
+        journal_state (dict): Completed work from a resumed journal.
+
+    Returns:
+        tuple(dict, dict, list, dict): Correlation summary for this shard if correlation is
+            enabled, a snapshot of the metrics it recorded, its profiling spans and the snapshot
+            state of its ESPKeys if diffing is enabled.
+    """
+
+    # Forked workers start with a copy of the parent's metrics and spans.
+    METRICS.reset()
+    PROFILER.reset()
+
+    summary, snapshots = Recipe(recipe_file).run_shard(espkeys, shard_queue, events,
+                                                       journal_state)
+
+    return (summary, METRICS.snapshot(), PROFILER.events(), snapshots)
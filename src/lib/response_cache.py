@@ -0,0 +1,238 @@
+from contextlib import contextmanager
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Windows has no fcntl. There the cache file is still replaced atomically, but concurrent
+# processes can lose each other's updates.
+try:
+    import fcntl
+
+except ImportError:
+    fcntl = None
+
+
+class ResponseCache:
+    def __init__(self, ttl=300, cache_file=None):
+        """TTL cache for responses from ESPKey endpoints that rarely change. Validators from the
+           response (ETag and Last-Modified) are kept so expired entries can be revalidated with
+           a conditional request instead of being downloaded again.
+
+        Args:
+            ttl (int, float, optional): Seconds a cached response is used without asking the
+                                        ESPKey. Defaults to 300.
+            cache_file (str, optional): JSON file to share the cache between processes and CLI
+                                        invocations. Defaults to None which keeps the cache in
+                                        memory only.
+        """
+
+        self.__ttl = ttl
+        self.__cache_file = cache_file
+        self.__entries = {}
+        self.__file_mtime = None
+        self.__lock = threading.Lock()
+
+        self.__load()
+
+
+    def __read_file(self):
+        """Read the cache file.
+
+        Returns:
+            dict: Entries in the file, empty if it's missing or corrupt.
+        """
+
+        try:
+            with open(self.__cache_file, "r") as f:
+                return json.loads(f.read())
+
+        # A missing or corrupt cache is just a cold cache.
+        except (FileNotFoundError, ValueError):
+            return {}
+
+
+    def __file_version(self):
+        """Identify the current cache file. Every save replaces the file, so the inode changes
+           even when two saves land within the same modification time.
+
+        Returns:
+            tuple, None: Modification time and inode, or None if there is no file.
+        """
+
+        try:
+            stat = os.stat(self.__cache_file)
+
+        except FileNotFoundError:
+            return None
+
+        return (stat.st_mtime_ns, stat.st_ino)
+
+
+    @contextmanager
+    def __file_lock(self):
+        """Hold an exclusive lock on a file next to the cache file, so processes sharing the
+           cache take turns to read, change and replace it.
+        """
+
+        if fcntl is None:
+            yield
+            return
+
+        with open(f"{self.__cache_file}.lock", "a") as lock_f:
+            fcntl.flock(lock_f.fileno(), fcntl.LOCK_EX)
+
+            try:
+                yield
+
+            finally:
+                fcntl.flock(lock_f.fileno(), fcntl.LOCK_UN)
+
+
+    def __load(self):
+        """Replace the entries with the cache file's if it changed since it was last read, so
+           entries other processes invalidated are dropped here too.
+        """
+
+        if self.__cache_file is None:
+            return
+
+        # Taken before reading so a file replaced in between is read again next time.
+        file_version = self.__file_version()
+
+        if file_version == self.__file_mtime:
+            return
+
+        self.__entries = self.__read_file()
+        self.__file_mtime = file_version
+
+
+    def __save(self, changed=(), removed_prefix=None):
+        """Apply changes to the cache file atomically so other processes never see a partial
+           file. The file is read again under the file lock first so entries other processes
+           stored or removed since it was last read are kept that way.
+
+        Args:
+            changed (tuple, optional): Keys stored or touched here. Defaults to ().
+            removed_prefix (str, optional): Drop keys starting with this. Defaults to None.
+        """
+
+        if self.__cache_file is None:
+            return
+
+        with self.__file_lock():
+            on_disk = self.__read_file()
+
+            if removed_prefix is not None:
+                on_disk = {key: entry for key, entry in on_disk.items()
+                           if not key.startswith(removed_prefix)}
+
+            # Keep whichever copy of a changed entry is newer.
+            for key in changed:
+                entry = self.__entries.get(key)
+
+                if entry is not None and (key not in on_disk or
+                                          on_disk[key].get('stored', 0) < entry['stored']):
+                    on_disk.update({key: entry})
+
+            self.__entries = on_disk
+
+            cache_dir = os.path.dirname(os.path.abspath(self.__cache_file))
+            fd, tmp_name = tempfile.mkstemp(dir=cache_dir, prefix=".espkey_cache")
+
+            with os.fdopen(fd, "w") as f:
+                f.write(json.dumps(self.__entries))
+
+            os.replace(tmp_name, self.__cache_file)
+            self.__file_mtime = self.__file_version()
+
+
+    def get(self, key):
+        """Get a cached response whether or not it's still fresh.
+
+        Args:
+            key (str): Cache key, normally the request URL.
+
+        Returns:
+            dict, None: Entry with "text", "stored" and optional "etag" and "last_modified", or
+                        None if nothing is cached.
+        """
+
+        with self.__lock:
+            self.__load()
+
+            entry = self.__entries.get(key)
+
+            if entry is None:
+                return None
+
+            return dict(entry)
+
+
+    def is_fresh(self, entry):
+        """Can a cached entry be used without asking the ESPKey?
+
+        Args:
+            entry (dict): Entry returned by get().
+
+        Returns:
+            bool: True if the entry is younger than the TTL.
+        """
+
+        return time.time() - entry['stored'] < self.__ttl
+
+
+    def put(self, key, text, headers):
+        """Store a response.
+
+        Args:
+            key (str): Cache key, normally the request URL.
+            text (str): Response body.
+            headers (dict): Response headers.
+        """
+
+        entry = {
+            "text": text,
+            "stored": time.time()
+        }
+
+        if headers.get('ETag'):
+            entry.update({"etag": headers['ETag']})
+
+        if headers.get('Last-Modified'):
+            entry.update({"last_modified": headers['Last-Modified']})
+
+        with self.__lock:
+            self.__entries.update({key: entry})
+            self.__save(changed=(key,))
+
+
+    def touch(self, key):
+        """Mark a cached response as fresh again after the ESPKey confirmed it's unchanged.
+
+        Args:
+            key (str): Cache key, normally the request URL.
+        """
+
+        with self.__lock:
+            self.__load()
+
+            if key in self.__entries:
+                self.__entries[key]['stored'] = time.time()
+                self.__save(changed=(key,))
+
+
+    def invalidate(self, prefix=""):
+        """Drop cached responses.
+
+        Args:
+            prefix (str, optional): Only drop keys starting with this, for example an ESPKey's
+                                    base URL. Defaults to "" which drops everything.
+        """
+
+        with self.__lock:
+            for key in [key for key in self.__entries if key.startswith(prefix)]:
+                del self.__entries[key]
+
+            self.__save(removed_prefix=prefix)
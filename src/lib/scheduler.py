@@ -0,0 +1,384 @@
+import datetime
+import threading
+import time
+
+
+class CronSchedule:
+    def __init__(self, cron_spec):
+        """Cron-like trigger using the classic 5-field format.
+
+        Args:
+            cron_spec (str): Cron specification: "<minute> <hour> <day of month> <month>
+                             <day of week>". Fields support *, */n, a-b, a-b/n and comma lists.
+                             Times are evaluated in UTC.
+
+        Raises:
+            ValueError: The cron specification is invalid.
+        """
+
+        self.__spec = cron_spec
+
+        # Field name, min value, max value.
+        field_limits = [
+            ("minute", 0, 59),
+            ("hour", 0, 23),
+            ("day of month", 1, 31),
+            ("month", 1, 12),
+            ("day of week", 0, 7)
+        ]
+
+        fields = cron_spec.split()
+
+        if len(fields) != 5:
+            raise ValueError(f"Cron specification \"{cron_spec}\" must have 5 fields.")
+
+        parsed = []
+
+        for field, limits in zip(fields, field_limits):
+            parsed.append(self.__parse_field(field, *limits))
+
+        self.__minutes, self.__hours, self.__days, self.__months, self.__weekdays = parsed
+
+        # Sunday can be specified as 0 or 7.
+        if 7 in self.__weekdays:
+            self.__weekdays = (self.__weekdays - {7}) | {0}
+
+        # Standard cron semantics: if both day fields are restricted either one may match.
+        self.__days_restricted = fields[2] != "*"
+        self.__weekdays_restricted = fields[4] != "*"
+
+
+    @staticmethod
+    def __parse_field(field, name, min_value, max_value):
+        """Parse a single cron field into a set of allowed values.
+
+        Args:
+            field (str): Cron field.
+            name (str): Field name used in error messages.
+            min_value (int): Smallest allowed value.
+            max_value (int): Largest allowed value.
+
+        Raises:
+            ValueError: The field is invalid.
+
+        Returns:
+            set: Allowed values.
+        """
+
+        values = set()
+
+        for part in field.split(","):
+            step = 1
+
+            if "/" in part:
+                part, step_str = part.split("/", 1)
+
+                if not step_str.isdigit() or int(step_str) == 0:
+                    raise ValueError(f"Invalid cron step in {name} field: \"{field}\".")
+
+                step = int(step_str)
+
+            if part == "*":
+                start = min_value
+                end = max_value
+
+            elif "-" in part:
+                start_str, end_str = part.split("-", 1)
+
+                if not (start_str.isdigit() and end_str.isdigit()):
+                    raise ValueError(f"Invalid cron range in {name} field: \"{field}\".")
+
+                start = int(start_str)
+                end = int(end_str)
+
+            elif part.isdigit():
+                start = int(part)
+                end = start
+
+                # A single value with a step means "from value to max".
+                if step != 1:
+                    end = max_value
+
+            else:
+                raise ValueError(f"Invalid cron value in {name} field: \"{field}\".")
+
+            if start < min_value or end > max_value or start > end:
+                raise ValueError(f"Cron {name} field out of range ({min_value}-{max_value}): " \
+                    f"\"{field}\".")
+
+            values.update(range(start, end + 1, step))
+
+        return values
+
+
+    def __day_matches(self, dts):
+        """Check the day of month and day of week fields against a date.
+
+        Args:
+            dts (datetime.datetime): Date to check.
+
+        Returns:
+            bool: The day matches.
+        """
+
+        # Python's Monday is 0, cron's Sunday is 0.
+        weekday = (dts.weekday() + 1) % 7
+
+        day_match = dts.day in self.__days
+        weekday_match = weekday in self.__weekdays
+
+        if self.__days_restricted and self.__weekdays_restricted:
+            return day_match or weekday_match
+
+        return day_match and weekday_match
+
+
+    def matches(self, dts):
+        """Does the given time match the cron specification?
+
+        Args:
+            dts (datetime.datetime): Time to check.
+
+        Returns:
+            bool: True if the specification matches at minute resolution.
+        """
+
+        return dts.month in self.__months and self.__day_matches(dts) and \
+            dts.hour in self.__hours and dts.minute in self.__minutes
+
+
+    def next_run(self, after):
+        """Find the next matching minute strictly after a given time.
+
+        Args:
+            after (datetime.datetime): Starting point.
+
+        Raises:
+            ValueError: No matching time exists within the next five years.
+
+        Returns:
+            datetime.datetime: Next matching time.
+        """
+
+        dts = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = dts + datetime.timedelta(days=366 * 5)
+
+        while dts < limit:
+            if dts.month not in self.__months:
+                # Jump to the first day of the next month.
+                dts = (dts.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)) \
+                    .replace(day=1)
+
+            elif not self.__day_matches(dts):
+                dts = dts.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+
+            elif dts.hour not in self.__hours:
+                dts = dts.replace(minute=0) + datetime.timedelta(hours=1)
+
+            elif dts.minute not in self.__minutes:
+                dts += datetime.timedelta(minutes=1)
+
+            else:
+                return dts
+
+        raise ValueError(f"Cron specification \"{self.__spec}\" never matches.")
+
+
+def _parse_until(until):
+    """Parse an ISO-8601 "until" timestamp as naive UTC. Timestamps with an offset are
+       converted, ones without are taken to be UTC already.
+
+    Args:
+        until (str): ISO-8601 timestamp.
+
+    Raises:
+        ValueError: The timestamp is invalid.
+
+    Returns:
+        datetime.datetime: Naive UTC time.
+    """
+
+    until_dts = datetime.datetime.fromisoformat(until)
+
+    if until_dts.tzinfo is not None:
+        until_dts = until_dts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    return until_dts
+
+
+class Schedule:
+    def __init__(self, config, stop_event=None, start=0):
+        """Run schedule for a recipe task or action.
+
+        Args:
+            config (dict): Task or action configuration. Scheduling keys are all optional:
+                           "repeat" (int) total number of runs, "every" (int, float) seconds
+                           between run starts, "until" (int, float, str) seconds after the
+                           schedule starts or an ISO-8601 timestamp to stop at, UTC unless it
+                           has an offset, "cron" (str)
+                           cron-like trigger. Without any of them the schedule runs once.
+            stop_event (threading.Event, optional): Event that aborts waits and the schedule.
+                                                    Defaults to None.
+            start (int, optional): Runs that already happened, for example before a resumed
+                                   recipe was interrupted. Defaults to 0.
+        """
+
+        self.__repeat = config.get('repeat')
+        self.__every = config.get('every')
+        self.__until = config.get('until')
+        self.__cron = None
+
+        if config.get('cron') is not None:
+            self.__cron = CronSchedule(config['cron'])
+
+        # Run once unless there is something telling us to keep going.
+        if self.__repeat is None and self.__every is None and self.__until is None and \
+            self.__cron is None:
+            self.__repeat = 1
+
+        if stop_event is None:
+            stop_event = threading.Event()
+
+        self.__stop_event = stop_event
+        self.__start = start
+
+
+    @staticmethod
+    def is_scheduled(config):
+        """Does a task or action configuration contain scheduling keys?
+
+        Args:
+            config (dict): Task or action configuration.
+
+        Returns:
+            bool: True if any scheduling key is present.
+        """
+
+        return any(key in config for key in ["repeat", "every", "until", "cron"])
+
+
+    @staticmethod
+    def validate(config):
+        """Validate scheduling keys in a task or action configuration.
+
+        Args:
+            config (dict): Task or action configuration.
+
+        Returns:
+            tuple(bool, list): Flag indicating the schedule is valid and a list of errors.
+        """
+
+        errors = []
+        valid = True
+
+        if 'repeat' in config:
+            if not isinstance(config['repeat'], int) or isinstance(config['repeat'], bool) or \
+                config['repeat'] < 1:
+                valid = False
+                errors.append("'repeat' must be an int greater than 0.")
+
+        if 'every' in config:
+            if not isinstance(config['every'], (int, float)) or \
+                isinstance(config['every'], bool) or config['every'] <= 0:
+                valid = False
+                errors.append("'every' must be an int or float greater than 0.")
+
+        if 'until' in config:
+            if isinstance(config['until'], str):
+                try:
+                    _parse_until(config['until'])
+
+                except ValueError:
+                    valid = False
+                    errors.append("'until' must be an ISO-8601 timestamp or a number of seconds.")
+
+            elif not isinstance(config['until'], (int, float)) or \
+                isinstance(config['until'], bool):
+                valid = False
+                errors.append("'until' must be an ISO-8601 timestamp or a number of seconds.")
+
+        # Without something spacing runs out they would be sent back to back until the deadline.
+        if 'until' in config and not any(key in config for key in ["repeat", "every", "cron"]):
+            valid = False
+            errors.append("'until' must be used with 'repeat', 'every' or 'cron'.")
+
+        if 'cron' in config:
+            if not isinstance(config['cron'], str):
+                valid = False
+                errors.append("'cron' must be a string.")
+
+            else:
+                try:
+                    CronSchedule(config['cron'])
+
+                except ValueError as e:
+                    valid = False
+                    errors.append(f"'cron': {e}")
+
+        return (valid, errors)
+
+
+    def wait(self, sec):
+        """Wait without blocking other threads, waking early if the schedule is stopped.
+
+        Args:
+            sec (int, float): Seconds to wait.
+
+        Returns:
+            bool: True if the wait was interrupted by a stop.
+        """
+
+        if sec <= 0:
+            return self.__stop_event.is_set()
+
+        return self.__stop_event.wait(sec)
+
+
+    def __iter__(self):
+        """Iterate over runs, waiting between them as specified.
+
+        Yields:
+            int: Zero-based run number.
+        """
+
+        start_mono = time.monotonic()
+        start_dts = datetime.datetime.utcnow()
+        until_dts = None
+        next_mono = start_mono
+        run_ct = self.__start
+
+        if isinstance(self.__until, str):
+            until_dts = _parse_until(self.__until)
+
+        elif self.__until is not None:
+            until_dts = start_dts + datetime.timedelta(seconds=self.__until)
+
+        while not self.__stop_event.is_set():
+            if self.__repeat is not None and run_ct >= self.__repeat:
+                break
+
+            # Wait for the next cron trigger or interval.
+            if self.__cron is not None:
+                now = datetime.datetime.utcnow()
+                next_dts = self.__cron.next_run(now)
+
+                if until_dts is not None and next_dts > until_dts:
+                    break
+
+                if self.wait((next_dts - now).total_seconds()):
+                    break
+
+            else:
+                if self.wait(next_mono - time.monotonic()):
+                    break
+
+            if until_dts is not None and datetime.datetime.utcnow() > until_dts:
+                break
+
+            yield run_ct
+
+            run_ct += 1
+
+            # Keep a steady cadence, but don't try to catch up on missed runs.
+            if self.__every is not None:
+                next_mono = max(next_mono + self.__every, time.monotonic())
@@ -0,0 +1,59 @@
+import threading
+
+
+class SingleFlight:
+    def __init__(self):
+        """Runs a call once for every caller that asks for the same key while it's in flight.
+           The first caller makes the call and the rest wait for its result, so a slow ESPKey
+           gets one request instead of one per caller.
+        """
+
+        self.__lock = threading.Lock()
+        self.__calls = {}
+
+
+    def do(self, key, fn):
+        """Run fn, or wait for the call already running under key.
+
+        Args:
+            key (hashable): Identifies calls that can share a result.
+            fn (callable): Makes the call.
+
+        Raises:
+            Exception: Whatever the call raised, for every caller waiting on it.
+
+        Returns:
+            tuple: The call's result and True if it was shared from another caller's call.
+        """
+
+        with self.__lock:
+            call = self.__calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self.__calls.update({key: call})
+
+        if leader:
+            try:
+                call['result'] = fn()
+
+            except BaseException as e:
+                call['error'] = e
+                raise
+
+            finally:
+                # Later callers start a new call instead of getting this result.
+                with self.__lock:
+                    del self.__calls[key]
+
+                call['done'].set()
+
+            return (call['result'], False)
+
+        call['done'].wait()
+
+        if call['error'] is not None:
+            raise call['error']
+
+        return (call['result'], True)
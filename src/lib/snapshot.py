@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import threading
+
+from .dict_diff import dict_diff
+
+
+class SnapshotState:
+    def __init__(self, state_file):
+        """What each ESPKey returned the last time a recipe ran, so a run can record only what
+           changed since. Logs are tracked by their length and the first and last entry, other
+           responses are kept whole so they can be diffed.
+
+        Args:
+            state_file (str): JSON file the state is kept in between runs.
+        """
+
+        self.__state_file = state_file
+        self.__lock = threading.Lock()
+        self.__devices = {}
+
+        if os.path.exists(state_file):
+            with open(state_file, "r") as f:
+                self.__devices = json.loads(f.read()).get('devices', {})
+
+
+    @staticmethod
+    def __entry_hash(entry):
+        """Short hash identifying a log entry.
+
+        Args:
+            entry (LogEntry, dict): Log entry.
+
+        Returns:
+            str: Hex digest.
+        """
+
+        data = entry.get('data_hex', entry.get('log_msg'))
+
+        return hashlib.blake2b(f"{entry['time_raw']}:{data}".encode(), digest_size=8).hexdigest()
+
+
+    def diff_log(self, device, entries):
+        """Find the log entries added since the previous run. The ESPKey only appends to its
+           log, so if the entries seen last time are still at the start of the log only the
+           ones after them are new. If the log was deleted or replaced everything is new.
+
+        Args:
+            device (str): ESPKey name.
+            entries (list): Log entries in log order.
+
+        Returns:
+            tuple(list, str): New entries and "diff", or "full" if there was nothing to compare
+                              with.
+        """
+
+        with self.__lock:
+            previous = self.__devices.get(device, {}).get('get_log')
+
+            log_state = {"count": len(entries)}
+
+            if entries:
+                log_state.update({"first": self.__entry_hash(entries[0]),
+                                  "last": self.__entry_hash(entries[-1])})
+
+            self.__devices.setdefault(device, {}).update({"get_log": log_state})
+
+        if previous is None:
+            return (entries, "full")
+
+        count = previous['count']
+
+        if count == 0:
+            return (entries, "diff")
+
+        if len(entries) >= count and self.__entry_hash(entries[0]) == previous['first'] and \
+            self.__entry_hash(entries[count - 1]) == previous['last']:
+            return (entries[count:], "diff")
+
+        return (entries, "diff")
+
+
+    def diff_value(self, device, operation, value):
+        """Find what changed in a response since the previous run.
+
+        Args:
+            device (str): ESPKey name.
+            operation (str): Operation the response came from, for example "get_config".
+            value (dict): Response.
+
+        Returns:
+            tuple(dict, str): Changes from dict_diff() and "diff", or the whole response and
+                              "full" if there was nothing to compare with.
+        """
+
+        with self.__lock:
+            previous = self.__devices.get(device, {}).get(operation)
+            self.__devices.setdefault(device, {}).update({operation: value})
+
+        if previous is None:
+            return (value, "full")
+
+        return (dict_diff(previous, value), "diff")
+
+
+    def devices(self, names=None):
+        """Copy the state of some or all ESPKeys.
+
+        Args:
+            names (list, optional): ESPKey names. Defaults to None for every ESPKey.
+
+        Returns:
+            dict: ESPKey names mapped to their state.
+        """
+
+        with self.__lock:
+            return {device: dict(state) for device, state in self.__devices.items()
+                    if names is None or device in names}
+
+
+    def merge(self, devices):
+        """Take the state of ESPKeys that were run in another process.
+
+        Args:
+            devices (dict): State from devices().
+        """
+
+        with self.__lock:
+            self.__devices.update(devices)
+
+
+    def save(self):
+        """Write the state file. It's replaced atomically so an interruption can't leave it
+           half written.
+        """
+
+        with self.__lock:
+            state_str = json.dumps({"devices": self.__devices}, separators=(",", ":"))
+
+        tmp_file = f"{self.__state_file}.tmp"
+
+        with open(tmp_file, "w") as f:
+            f.write(state_str)
+
+        os.replace(tmp_file, self.__state_file)
@@ -0,0 +1,241 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import threading
+
+
+class Upgrader:
+    def __init__(self, espkeys, manifest, max_workers=4, restart_timeout=120, state_file=None):
+        """Upgrade the firmware and web UI files of many ESPKeys at once. Files are streamed
+           from disk, ESPKeys already running the target firmware version are skipped and, with
+           a state file, an interrupted upgrade picks up where it left off.
+
+        Args:
+            espkeys (dict): ESPKey name mapped to ESPKey object.
+            manifest (dict): Manifest from load_manifest().
+            max_workers (int, optional): ESPKeys to upgrade at the same time. Defaults to 4.
+            restart_timeout (int, float, optional): Seconds to wait for an ESPKey to come back
+                                                    after a restart. Defaults to 120.
+            state_file (str, optional): JSON file recording the files each ESPKey has already
+                                        received. Defaults to None.
+        """
+
+        self.__espkeys = espkeys
+        self.__manifest = manifest
+        self.__max_workers = max_workers
+        self.__restart_timeout = restart_timeout
+        self.__state_file = state_file
+        self.__state_lock = threading.Lock()
+        self.__state = {}
+
+        if state_file is not None and os.path.exists(state_file):
+            with open(state_file, "r") as f:
+                self.__state = json.load(f)
+
+
+    @staticmethod
+    def load_manifest(manifest_file):
+        """Load an upgrade manifest. Paths are relative to the manifest.
+
+        Example:
+            {
+                "version": "132",
+                "firmware": "espkey-132.bin",
+                "files": {"/index.htm": "www/index.htm"}
+            }
+
+        Args:
+            manifest_file (str): Manifest file name.
+
+        Raises:
+            ValueError: The manifest is missing the version, has nothing to upload or points
+                        to files that don't exist.
+
+        Returns:
+            dict: Manifest with absolute paths.
+        """
+
+        with open(manifest_file, "r") as f:
+            manifest = json.load(f)
+
+        base_dir = os.path.dirname(os.path.abspath(manifest_file))
+        errors = []
+
+        if not isinstance(manifest.get('version'), str):
+            errors.append("version must be a string.")
+
+        if 'firmware' not in manifest and not manifest.get('files'):
+            errors.append("firmware or files are required.")
+
+        if 'firmware' in manifest:
+            manifest['firmware'] = os.path.join(base_dir, manifest['firmware'])
+
+        manifest['files'] = {remote_name: os.path.join(base_dir, local_path)
+                             for remote_name, local_path in manifest.get('files', {}).items()}
+
+        for local_path in [manifest.get('firmware')] + list(manifest['files'].values()):
+            if local_path is not None and not os.path.isfile(local_path):
+                errors.append(f"{local_path} doesn't exist.")
+
+        if errors:
+            raise ValueError(" ".join(errors))
+
+        return manifest
+
+
+    def __record(self, name, asset):
+        """Record that an ESPKey received a file. The state file is replaced atomically so an
+           interruption can't leave it half written.
+
+        Args:
+            name (str): ESPKey name.
+            asset (str): Remote file name, "firmware" or "restart".
+        """
+
+        if self.__state_file is None:
+            return
+
+        with self.__state_lock:
+            key_state = self.__state.setdefault(name, {"version": self.__manifest['version'],
+                                                       "done": []})
+            key_state['done'].append(asset)
+
+            tmp_file = f"{self.__state_file}.tmp"
+
+            with open(tmp_file, "w") as f:
+                f.write(json.dumps(self.__state, indent=4))
+
+            os.replace(tmp_file, self.__state_file)
+
+
+    def __done(self, name):
+        """Files an ESPKey received during an earlier run for the same target version.
+
+        Args:
+            name (str): ESPKey name.
+
+        Returns:
+            set: Remote file names, "firmware" if the image was uploaded and "restart" if the
+                 ESPKey was restarted to serve new web UI files.
+        """
+
+        with self.__state_lock:
+            key_state = self.__state.get(name, {})
+
+            if key_state.get('version') != self.__manifest['version']:
+                self.__state.pop(name, None)
+                return set()
+
+            return set(key_state['done'])
+
+
+    def __upgrade_one(self, name):
+        """Upgrade a single ESPKey, capturing errors so one failure doesn't stop the others.
+
+        Args:
+            name (str): ESPKey name.
+
+        Returns:
+            dict: "status" of "skipped", "upgraded" or "failed", the "uploaded" files and the
+                  "version" afterwards, or an "error".
+        """
+
+        espkey = self.__espkeys[name]
+        target_version = self.__manifest['version']
+        result = {"status": "failed", "uploaded": []}
+
+        try:
+            done = self.__done(name)
+
+            if 'firmware' in self.__manifest:
+                version = espkey.get_version().get('version')
+
+                if version == target_version:
+                    result.update({"status": "skipped", "version": version})
+                    return result
+
+            # The firmware version says nothing about the web UI files, only the state file
+            # knows which were sent and whether the ESPKey was restarted to serve them.
+            elif "restart" in done and done.issuperset(self.__manifest['files']):
+                result.update({"status": "skipped"})
+                return result
+
+            # Web UI files first, the firmware upload restarts the ESPKey.
+            for remote_name, local_path in self.__manifest['files'].items():
+                if remote_name in done:
+                    continue
+
+                if not espkey.upload_file(remote_name, local_path):
+                    raise RuntimeError(f"Upload of {remote_name} failed.")
+
+                self.__record(name, remote_name)
+                result['uploaded'].append(remote_name)
+
+            if 'firmware' in self.__manifest and 'firmware' not in done:
+                endpoint = self.__manifest.get('firmware_endpoint', "/update")
+
+                if not espkey.upload_firmware(self.__manifest['firmware'], endpoint):
+                    raise RuntimeError("Firmware upload failed.")
+
+                self.__record(name, "firmware")
+                result['uploaded'].append("firmware")
+
+            else:
+                # Web UI only, restart to serve the new files. The connection may drop
+                # before the response.
+                try:
+                    espkey.restart()
+
+                except Exception:
+                    pass
+
+                self.__record(name, "restart")
+
+            version = espkey.wait_for_version(self.__restart_timeout).get('version')
+            result.update({"version": version})
+
+            if 'firmware' in self.__manifest and version != target_version:
+                raise RuntimeError(f"Version is {version} after the upgrade, expected " \
+                    f"{target_version}.")
+
+            result.update({"status": "upgraded"})
+
+        except Exception as e:
+            result.update({"error": str(e)})
+
+        return result
+
+
+    def run(self):
+        """Upgrade every ESPKey.
+
+        Returns:
+            dict: ESPKey name mapped to its result.
+        """
+
+        names = list(self.__espkeys)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.__max_workers, len(names)))) \
+             as executor:
+            results = executor.map(self.__upgrade_one, names)
+
+            return dict(zip(names, results))
+
+
+    @staticmethod
+    def summarize(results):
+        """Count the outcome of an upgrade.
+
+        Args:
+            results (dict): Results from run().
+
+        Returns:
+            dict: Counts of ESPKeys that were "skipped", "upgraded" and "failed".
+        """
+
+        summary = {"skipped": 0, "upgraded": 0, "failed": 0}
+
+        for result in results.values():
+            summary[result['status']] += 1
+
+        return summary
@@ -0,0 +1,350 @@
+from array import array
+import re
+
+
+# Parity of every 16-bit value, built from an 8-bit table. Wider values are folded 16 bits at a
+# time so computing parity never has to count bits one by one.
+_PARITY_8 = bytes(bin(value).count("1") & 0x01 for value in range(0x100))
+_PARITY_16 = bytes(_PARITY_8[value & 0xff] ^ _PARITY_8[value >> 8] for value in range(0x10000))
+
+# HID keypad characters - 1st nibble is the logical NOT of the second. This is the inverse of the
+# table LogEntry uses to decode keypad data.
+_KEYPAD_TABLE = {
+    "1": 0xe1, "2": 0xd2, "3": 0xc3,
+    "4": 0xb4, "5": 0xa5, "6": 0x96,
+    "7": 0x87, "8": 0x78, "9": 0x69,
+    "*": 0x5a, "0": 0xf0, "#": 0x4b
+}
+
+
+def _parity(value):
+    """Compute the parity of a non-negative int using the precomputed table.
+
+    Args:
+        value (int): Value to compute parity for.
+
+    Returns:
+        int: 1 if an odd number of bits are set, 0 otherwise.
+    """
+
+    parity = 0
+
+    while value:
+        parity ^= _PARITY_16[value & 0xffff]
+        value >>= 16
+
+    return parity
+
+
+def _build_format(bits, fields, parity_bits):
+    """Build a frame format from bit positions. Positions count from 0 at the first (most
+       significant) bit sent.
+
+    Args:
+        bits (int): Frame length in bits.
+        fields (dict): Field name mapped to a (first position, length) tuple.
+        parity_bits (list): (position, odd, covered positions) tuples, computed in order.
+
+    Returns:
+        dict: Format with shifts and masks ready for encoding.
+    """
+
+    fmt = {
+        "bits": bits,
+        "fields": {},
+        "parity": []
+    }
+
+    for field, (position, length) in fields.items():
+        fmt['fields'].update({field: (bits - position - length, (1 << length) - 1)})
+
+    for position, odd, covered in parity_bits:
+        mask = 0
+
+        for covered_position in covered:
+            mask |= 1 << (bits - 1 - covered_position)
+
+        fmt['parity'].append((1 << (bits - 1 - position), mask, int(odd)))
+
+    return fmt
+
+
+# Supported frame formats.
+FORMATS = {
+    # HID H10301 26-bit: even parity, 8-bit facility code, 16-bit card number, odd parity.
+    "h10301": _build_format(26, {"fc": (1, 8), "cn": (9, 16)}, [
+        (0, False, range(1, 13)),
+        (25, True, range(13, 25))
+    ]),
+    # HID Corporate 1000 35-bit: 12-bit company code, 20-bit card number and three parity bits.
+    "c1k35": _build_format(35, {"fc": (2, 12), "cn": (14, 20)}, [
+        (1, False, [pos for pos in range(2, 34) if pos % 3 != 1]),
+        (34, True, [pos for pos in range(1, 33) if pos % 3 != 0]),
+        (0, True, range(1, 35))
+    ]),
+    # HID H10304 37-bit: even parity, 16-bit facility code, 19-bit card number, odd parity.
+    "h10304": _build_format(37, {"fc": (1, 16), "cn": (17, 19)}, [
+        (0, False, range(1, 19)),
+        (36, True, range(18, 36))
+    ])
+}
+
+# Alternate names for formats.
+FORMAT_ALIASES = {
+    "hid_26": "h10301",
+    "hid_35": "c1k35",
+    "hid_37": "h10304"
+}
+
+
+class WeigandEncoder:
+    """Build Weigand frames from credential data. Frames are (hex string, bit length) tuples
+       which is the same form ESPKey.send_weigand() accepts.
+    """
+
+    @staticmethod
+    def __get_format(fmt_name):
+        """Look up a frame format by name or alias.
+
+        Args:
+            fmt_name (str): Format name.
+
+        Raises:
+            ValueError: Unknown format.
+
+        Returns:
+            dict: Format.
+        """
+
+        fmt_name = FORMAT_ALIASES.get(fmt_name, fmt_name)
+
+        if fmt_name not in FORMATS:
+            supported = ", ".join(sorted(list(FORMATS) + list(FORMAT_ALIASES)))
+            raise ValueError(f"Unknown weigand format \"{fmt_name}\". Supported: {supported}")
+
+        return FORMATS[fmt_name]
+
+
+    @staticmethod
+    def __check_field(fmt, field, value):
+        """Make sure a field value fits in a format.
+
+        Args:
+            fmt (dict): Format.
+            field (str): Field name.
+            value (int): Field value.
+
+        Raises:
+            ValueError: The value doesn't fit in the field.
+        """
+
+        max_value = fmt['fields'][field][1]
+
+        if not 0 <= value <= max_value:
+            raise ValueError(f"{field} must be between 0 and {max_value}: {value}")
+
+
+    @staticmethod
+    def formats():
+        """List supported frame format names, including aliases.
+
+        Returns:
+            list: Format names.
+        """
+
+        return sorted(list(FORMATS) + list(FORMAT_ALIASES))
+
+
+    @staticmethod
+    def encode(fmt_name, fc, cn):
+        """Encode a single frame.
+
+        Args:
+            fmt_name (str): Format name, for example "h10301".
+            fc (int): Facility or company code.
+            cn (int): Card number.
+
+        Raises:
+            ValueError: Unknown format or a value is out of range.
+
+        Returns:
+            tuple(str, int): Hex string and bit length.
+        """
+
+        return WeigandEncoder.encode_batch(fmt_name, fc, [cn])[0]
+
+
+    @staticmethod
+    def encode_values(fmt_name, fc, cns):
+        """Encode frames for many card numbers with a single facility code as raw ints. The
+           facility code portion and its share of each parity bit are computed once.
+
+        Args:
+            fmt_name (str): Format name, for example "h10301".
+            fc (int): Facility or company code.
+            cns (iterable): Card numbers.
+
+        Raises:
+            ValueError: Unknown format or a value is out of range.
+
+        Returns:
+            array.array: Frames as unsigned 64-bit ints.
+        """
+
+        fmt = WeigandEncoder.__get_format(fmt_name)
+        WeigandEncoder.__check_field(fmt, "fc", fc)
+
+        fc_shift, fc_max = fmt['fields']['fc']
+        cn_shift, cn_max = fmt['fields']['cn']
+        base = fc << fc_shift
+        parity_16 = _PARITY_16
+
+        # Parity contributed by the facility code for each parity bit that only covers payload.
+        # Parity bits covering other parity bits have to be computed per frame.
+        payload_mask = (fc_max << fc_shift) | (cn_max << cn_shift)
+        linear = []
+        chained = []
+
+        for bit, mask, odd in fmt['parity']:
+            if mask & ~payload_mask:
+                chained.append((bit, mask, odd))
+
+            else:
+                linear.append((bit, mask >> cn_shift & cn_max, _parity(base & mask) ^ odd))
+
+        frames = array("Q")
+
+        for cn in cns:
+            if not 0 <= cn <= cn_max:
+                raise ValueError(f"cn must be between 0 and {cn_max}: {cn}")
+
+            frame = base | (cn << cn_shift)
+
+            for bit, cn_mask, fc_parity in linear:
+                masked = cn & cn_mask
+
+                if parity_16[masked & 0xffff] ^ parity_16[masked >> 16] ^ fc_parity:
+                    frame |= bit
+
+            for bit, mask, odd in chained:
+                if _parity(frame & mask) ^ odd:
+                    frame |= bit
+
+            frames.append(frame)
+
+        return frames
+
+
+    @staticmethod
+    def encode_batch(fmt_name, fc, cns):
+        """Encode frames for many card numbers with a single facility code.
+
+        Args:
+            fmt_name (str): Format name, for example "h10301".
+            fc (int): Facility or company code.
+            cns (iterable): Card numbers.
+
+        Raises:
+            ValueError: Unknown format or a value is out of range.
+
+        Returns:
+            list: Frames as (hex string, bit length) tuples.
+        """
+
+        bits = WeigandEncoder.__get_format(fmt_name)['bits']
+        hex_fmt = f"0{(bits + 3) // 4}x"
+
+        return [(format(frame, hex_fmt), bits) for frame in
+                WeigandEncoder.encode_values(fmt_name, fc, cns)]
+
+
+    @staticmethod
+    def encode_keypad(pin, burst=False):
+        """Encode HID keypad presses as 8-bit frames.
+
+        Args:
+            pin (str): Keys to press: 0-9, * and #.
+            burst (bool, optional): Send every key in a single frame instead of one frame per
+                                    key. ESPKey only decodes bursts of up to 5 keys as keypad
+                                    data. Defaults to False.
+
+        Raises:
+            ValueError: The PIN contains an unsupported key.
+
+        Returns:
+            list: Frames as (hex string, bit length) tuples.
+        """
+
+        for key in pin:
+            if key not in _KEYPAD_TABLE:
+                raise ValueError(f"Unsupported keypad key \"{key}\". Supported: 0-9, * and #")
+
+        if burst:
+            return [("".join(f"{_KEYPAD_TABLE[key]:02x}" for key in pin), len(pin) * 8)]
+
+        return [(f"{_KEYPAD_TABLE[key]:02x}", 8) for key in pin]
+
+
+    @staticmethod
+    def parse_spec(spec):
+        """Turn a frame specification string into frames. Supported specifications:
+           - Raw data: 0aabbcc:26
+           - Encoded card: h10301:fc=77,cn=34302
+           - Card range: h10301:fc=77,cn=100-200
+           - Keypad: keypad:pin=1234 or keypad:pin=1234,burst=1
+
+        Args:
+            spec (str): Frame specification.
+
+        Raises:
+            ValueError: The specification is invalid.
+
+        Returns:
+            list: Frames as (hex string, bit length) tuples.
+        """
+
+        raw_match = re.match(r"^([0-9a-fA-F]+):([0-9]+)$", spec)
+
+        if raw_match:
+            return [(raw_match.group(1), int(raw_match.group(2)))]
+
+        if ":" not in spec:
+            raise ValueError(f"Invalid weigand specification \"{spec}\".")
+
+        fmt_name, args_str = spec.split(":", 1)
+        args = {}
+
+        for arg in args_str.split(","):
+            if "=" not in arg:
+                raise ValueError(f"Invalid weigand specification argument \"{arg}\".")
+
+            key, value = arg.split("=", 1)
+            args.update({key.strip(): value.strip()})
+
+        if fmt_name == "keypad":
+            if "pin" not in args:
+                raise ValueError("The keypad format requires a pin.")
+
+            return WeigandEncoder.encode_keypad(args['pin'], burst=args.get('burst') == "1")
+
+        if "fc" not in args or "cn" not in args:
+            raise ValueError(f"The {fmt_name} format requires fc and cn.")
+
+        try:
+            fc = int(args['fc'])
+
+            if "-" in args['cn']:
+                cn_start, cn_end = args['cn'].split("-", 1)
+                cns = range(int(cn_start), int(cn_end) + 1)
+
+            else:
+                cns = [int(args['cn'])]
+
+        except ValueError:
+            raise ValueError(f"Invalid fc or cn in weigand specification \"{spec}\".")
+
+        if len(cns) == 0:
+            raise ValueError(f"Empty card number range in weigand specification \"{spec}\". " \
+                "The first card number must not be greater than the last.")
+
+        return WeigandEncoder.encode_batch(fmt_name, fc, cns)
@@ -0,0 +1,65 @@
+import os
+import sys
+
+import pytest
+
+# The automator runs from src/ and imports its library as "lib".
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from lib import recipe as recipe_module
+
+
+class FakeESPKey:
+    """Stands in for ESPKey in recipe runs. Records the operations run on every instance in
+       calls, and operations in fail raise once they've succeeded that many times.
+    """
+
+    calls = []
+    fail = {}
+
+    def __init__(self, config):
+        self.name = config['name']
+
+    def __call(self, operation, result):
+        if FakeESPKey.fail.get(operation, -1) == 0:
+            raise RuntimeError(f"{operation} failed")
+
+        if operation in FakeESPKey.fail:
+            FakeESPKey.fail[operation] -= 1
+
+        FakeESPKey.calls.append(operation)
+
+        return result
+
+    def get_version(self):
+        return self.__call("get_version", {"version": "132"})
+
+    def get_diagnostics(self):
+        return self.__call("get_diagnostics", {"heap": 20000, "uptime": len(FakeESPKey.calls)})
+
+    def get_config(self):
+        return self.__call("get_config", {"ssid": "lobby"})
+
+    def get_log(self, compact=False):
+        return self.__call("get_log", [{"time_raw": 1000, "data_hex": "29b0bfc", "data_len": 26}])
+
+    def delete_log(self, post_method=False):
+        return self.__call("delete_log", True)
+
+    def restart(self):
+        return self.__call("restart", True)
+
+    def send_weigand(self, data_hex, data_len):
+        return self.__call("send_weigand", True)
+
+
+@pytest.fixture
+def fake_espkeys(monkeypatch, tmp_path):
+    """Run recipes against FakeESPKey from a temporary directory."""
+
+    monkeypatch.setattr(recipe_module, "ESPKey", FakeESPKey)
+    monkeypatch.setattr(FakeESPKey, "calls", [])
+    monkeypatch.setattr(FakeESPKey, "fail", {})
+    monkeypatch.chdir(tmp_path)
+
+    return FakeESPKey
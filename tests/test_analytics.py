@@ -0,0 +1,57 @@
+import datetime
+import json
+
+from lib.analytics import LogAnalytics
+from lib.log_entry import LogEntry
+
+
+BOOT_US = LogEntry.dts_to_us(datetime.datetime(2026, 1, 1, 12))
+
+
+def read(time_raw, data_hex, boot_us=None, latency_ms=0):
+    entry = {"time_raw": time_raw, "data_hex": data_hex, "data_len": 26}
+
+    if boot_us is not None:
+        dts_us = boot_us + (time_raw + latency_ms) * 1000
+        entry.update({"dts": LogEntry(time_raw, dts_us=dts_us).dts})
+
+    return entry
+
+
+def write_output(path, name, entries):
+    output = {"actions": [{"action": "get_log", "result": entries}], "metadata": {"espkey": "door"}}
+    (path / name).write_text(json.dumps(output))
+
+
+def device_row(path):
+    return LogAnalytics([str(path)]).run()['devices'][0]
+
+
+def test_overlapping_pulls_across_a_reboot_count_once(tmp_path):
+    rebooted_us = BOOT_US + 3600 * 1000000
+
+    # The log was cleared after the first pull, so the second boot comes first in the second.
+    write_output(tmp_path, "20260101-130000_r.json",
+                 [read(8000, "aa"), read(5000, "aa", rebooted_us)])
+    write_output(tmp_path, "20260101-140000_r.json",
+                 [read(5000, "aa", rebooted_us, latency_ms=30), read(9000, "bb", rebooted_us)])
+
+    row = device_row(tmp_path)
+
+    assert row['entries'] == 3
+    assert row['reads'] == 3
+
+
+def test_same_raw_time_in_different_boots_is_not_merged(tmp_path):
+    write_output(tmp_path, "20260101-130000_r.json", [read(1000, "aa", BOOT_US)])
+    write_output(tmp_path, "20260101-140000_r.json",
+                 [read(1000, "aa", BOOT_US + 3600 * 1000000)])
+
+    assert device_row(tmp_path)['reads'] == 2
+
+
+def test_entries_without_timestamps_are_numbered_by_boot(tmp_path):
+    write_output(tmp_path, "20260101-130000_r.json", [read(1000, "aa"), read(500, "aa")])
+    write_output(tmp_path, "20260101-140000_r.json", [read(1000, "aa"), read(500, "aa")])
+
+    assert device_row(tmp_path)['reads'] == 2
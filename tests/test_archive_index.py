@@ -0,0 +1,96 @@
+import datetime
+import json
+import os
+
+from lib.archive_index import ArchiveIndex
+
+
+def write_output(archive_dir, file_name, espkey, entries, indent=4, **metadata):
+    output = {
+        "actions": [
+            {"action": "get_version", "run": "2026-01-01T12:00:00", "result": {"version": "132"}},
+            {"action": "get_log", "run": "2026-01-01T12:00:01", "result": entries}
+        ],
+        "metadata": dict(metadata, espkey=espkey, run_start="2026-01-01T12:00:00")
+    }
+
+    with open(os.path.join(archive_dir, file_name), "w") as f:
+        f.write(json.dumps(output, indent=indent))
+
+
+def read(data_hex, dts=None):
+    entry = {"time_raw": 1000, "data_hex": data_hex, "data_len": 26}
+
+    if dts is not None:
+        entry.update({"dts": dts})
+
+    return entry
+
+
+def test_query_finds_a_card_across_files(tmp_path):
+    write_output(tmp_path, "20260101-120000_door_t.json", "door",
+                 [read("29b0bfc", "2026-01-01T11:59:00"), read("2020002")])
+    write_output(tmp_path, "20260101-130000_gate_t_2.json", "gate",
+                 [read("29b0bfc", "2026-01-01T12:59:00")], indent=None, iteration=2)
+    (tmp_path / "notes.json").write_text("{}")
+
+    index = ArchiveIndex(str(tmp_path))
+
+    assert index.update() == {"indexed": 2, "unchanged": 0, "removed": 0}
+
+    matches = index.query(card=("29b0bfc", 26))
+
+    assert [(match['file'], match['espkey'], match['task']) for match in matches] == [
+        ("20260101-120000_door_t.json", "door", "t"),
+        ("20260101-130000_gate_t_2.json", "gate", "t")
+    ]
+    assert matches[1]['entry'] == read("29b0bfc", "2026-01-01T12:59:00")
+    assert index.query(card=("29b0bfc", 27)) == []
+
+
+def test_query_time_range_uses_entry_or_run_times(tmp_path):
+    write_output(tmp_path, "20260101-120000_door_t.json", "door",
+                 [read("aa", "2026-01-01T10:00:00"), read("bb")])
+
+    index = ArchiveIndex(str(tmp_path))
+    index.update()
+
+    since = index.query(since=datetime.datetime(2026, 1, 1, 11))
+    until = index.query(until=datetime.datetime(2026, 1, 1, 11))
+
+    # Entries without a timestamp are matched on when get_log ran.
+    assert [match['entry']['data_hex'] for match in since] == ["bb"]
+    assert [match['entry']['data_hex'] for match in until] == ["aa"]
+
+
+def test_update_only_reads_new_and_changed_files(tmp_path, monkeypatch):
+    for hour in ["12", "13", "14"]:
+        write_output(tmp_path, f"20260101-{hour}0000_door_t.json", "door", [read(f"{hour}")])
+
+    index = ArchiveIndex(str(tmp_path))
+    index.update()
+
+    scanned = []
+    scan_file = index._ArchiveIndex__scan_file
+
+    def counting_scan(file_name):
+        scanned.append(file_name)
+        return scan_file(file_name)
+
+    monkeypatch.setattr(index, "_ArchiveIndex__scan_file", counting_scan)
+
+    write_output(tmp_path, "20260101-130000_door_t.json", "door", [read("13"), read("ff")])
+    os.remove(tmp_path / "20260101-140000_door_t.json")
+    write_output(tmp_path, "20260101-150000_door_t.json", "door", [read("15")])
+
+    assert index.update() == {"indexed": 2, "unchanged": 1, "removed": 1}
+    assert scanned == ["20260101-130000_door_t.json", "20260101-150000_door_t.json"]
+
+    # Carried over and rescanned records agree on the renumbered files and segments.
+    assert [(match['file'][9:11], match['entry']['data_hex']) for match in index.query()] == \
+        [("12", "12"), ("13", "13"), ("13", "ff"), ("15", "15")]
+    assert [match['file'] for match in index.query(card=("12", 26))] == \
+        ["20260101-120000_door_t.json"]
+    assert index.query(card=("14", 26)) == []
+
+    assert index.update() == {"indexed": 0, "unchanged": 3, "removed": 0}
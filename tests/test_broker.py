@@ -0,0 +1,152 @@
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from lib.broker import Broker, BrokerClient, LogMirror
+from lib.log_entry import LogEntry
+
+
+def entries(*time_raws):
+    return [LogEntry(time_raw, data_hex=f"{time_raw:07x}", data_len=26) for time_raw in time_raws]
+
+
+def test_log_mirror_only_adds_new_entries():
+    mirror = LogMirror()
+
+    mirror.update(entries(1, 2, 3))
+    mirror.update(entries(1, 2, 3, 4, 5))
+
+    log = mirror.read()
+
+    assert [entry.time_raw for entry in log['entries']] == [1, 2, 3, 4, 5]
+    assert (log['start'], log['next']) == (0, 5)
+    assert [entry.time_raw for entry in mirror.read(since=3)['entries']] == [4, 5]
+
+
+def test_log_mirror_deleted_log_starts_a_new_log():
+    mirror = LogMirror()
+
+    mirror.update(entries(1, 2, 3))
+
+    # The log was deleted and two entries were logged since.
+    mirror.update(entries(7, 8))
+
+    log = mirror.read()
+
+    assert [entry.time_raw for entry in log['entries']] == [7, 8]
+    assert (log['start'], log['next']) == (3, 5)
+    assert len(mirror.read(since=0)['entries']) == 5
+
+
+def test_log_mirror_reset_after_delete():
+    mirror = LogMirror()
+
+    mirror.update(entries(1, 2))
+    mirror.reset()
+
+    # A new log that happens to start the same way is still a new log.
+    mirror.update(entries(1))
+
+    assert mirror.read()['start'] == 2
+
+
+def test_log_mirror_drops_oldest_past_max():
+    mirror = LogMirror(max_entries=3)
+
+    mirror.update(entries(1, 2, 3, 4, 5))
+
+    assert [entry.time_raw for entry in mirror.read(since=0)['entries']] == [3, 4, 5]
+    assert mirror.read(since=0)['start'] == 2
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def broker_url():
+    def start(token=None):
+        port = free_port()
+
+        # Nothing listens on the ESPKey's port so device operations fail quickly.
+        broker = Broker({"door": {"name": "door", "base_url": f"http://127.0.0.1:{free_port()}",
+                                  "web_user": "u", "web_pass": "p"}},
+                        port=port, interval=60, token=token)
+        thread = threading.Thread(target=broker.run, daemon=True)
+        thread.start()
+        started.append((broker, thread))
+
+        url = f"http://127.0.0.1:{port}"
+
+        for _ in range(50):
+            try:
+                requests.get(f"{url}/espkeys", timeout=1)
+                break
+
+            except requests.ConnectionError:
+                time.sleep(0.05)
+
+        return url
+
+    started = []
+    yield start
+
+    for broker, thread in started:
+        broker.stop()
+        thread.join(timeout=5)
+
+
+def test_broker_needs_token_beyond_loopback():
+    with pytest.raises(ValueError):
+        Broker({}, host="0.0.0.0")
+
+    Broker({}, host="0.0.0.0", token="secret")
+
+
+def test_broker_token_required(broker_url):
+    url = broker_url(token="secret")
+
+    assert requests.get(f"{url}/espkeys", timeout=5).status_code == 401
+    assert requests.get(f"{url}/espkeys", headers={"Authorization": "Bearer wrong"},
+                        timeout=5).status_code == 401
+    assert requests.get(f"{url}/espkeys", headers={"Authorization": "Bearer secret"},
+                        timeout=5).status_code == 200
+
+    with pytest.raises(RuntimeError, match="token"):
+        BrokerClient({"name": "door", "broker": url}).restart()
+
+    # The ESPKey isn't there, so the request gets through the broker and fails at the device.
+    with pytest.raises(RuntimeError) as e:
+        BrokerClient({"name": "door", "broker": url, "broker_token": "secret"}).restart()
+
+    assert "token" not in str(e.value)
+
+
+def test_broker_without_token_refuses_writes(broker_url):
+    url = broker_url()
+
+    r = requests.post(f"{url}/espkeys/door/restart", timeout=5)
+
+    assert r.status_code == 403
+
+
+def test_broker_rejects_non_object_bodies(broker_url):
+    url = broker_url(token="secret")
+    headers = {"Authorization": "Bearer secret"}
+
+    for body in ["[]", "5", "\"frames\""]:
+        r = requests.post(f"{url}/espkeys/door/send_weigand", data=body, headers=headers,
+                          timeout=5)
+
+        assert r.status_code == 400
+
+    r = requests.post(f"{url}/espkeys/door/send_weigand", json={}, headers=headers, timeout=5)
+
+    assert r.status_code == 400
+    assert requests.get(f"{url}/espkeys/nope/get_version", headers=headers,
+                        timeout=5).status_code == 404
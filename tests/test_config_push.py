@@ -0,0 +1,76 @@
+import json
+
+from lib.config_push import ConfigPush
+from lib.espkey import ESPKey
+
+
+def espkey_with_config(monkeypatch, name, config, applies=True, status=200):
+    """ESPKey serving config from /config.json. Uploads replace it unless applies is False."""
+
+    espkey = ESPKey({"name": name, "base_url": f"http://{name}", "web_user": "u",
+                     "web_pass": "p"})
+    espkey.device = {"config": dict(config), "uploads": 0, "restarts": 0}
+
+    def http_get(url, headers=None, coalesce=False):
+        if url.endswith("/restart"):
+            espkey.device['restarts'] += 1
+            return {"status": 200}
+
+        return {"status": 200, "text": json.dumps(espkey.device['config']), "headers": {}}
+
+    def http_form_post(url, file_name, data):
+        espkey.device['uploads'] += 1
+
+        if applies:
+            espkey.device['config'] = json.loads(data)
+
+        return {"status": status}
+
+    monkeypatch.setattr(espkey._ESPKey__http, "http_get", http_get)
+    monkeypatch.setattr(espkey._ESPKey__http, "http_form_post", http_form_post)
+
+    return espkey
+
+
+def test_set_config_only_uploads_a_changed_configuration(monkeypatch):
+    espkey = espkey_with_config(monkeypatch, "door", {"ssid": "lobby", "channel": 1})
+
+    assert espkey.set_config({"ssid": "lobby", "channel": 1}) == {"changed": False, "diff": {}}
+    assert espkey.device['uploads'] == 0
+
+    result = espkey.set_config({"channel": 6}, merge=True, restart=True)
+
+    assert result == {"changed": True, "diff": {"changed": {"channel": {"old": 1, "new": 6}}},
+                      "verified": True, "restarted": True}
+    assert espkey.device['config'] == {"ssid": "lobby", "channel": 6}
+    assert espkey.device['restarts'] == 1
+
+
+def test_set_config_without_merge_replaces_the_configuration(monkeypatch):
+    espkey = espkey_with_config(monkeypatch, "door", {"ssid": "lobby", "channel": 1})
+
+    result = espkey.set_config({"ssid": "dock"}, verify=False)
+
+    assert result['diff'] == {"changed": {"ssid": {"old": "lobby", "new": "dock"}},
+                              "removed": {"channel": 1}}
+    assert 'verified' not in result and 'restarted' not in result
+    assert espkey.device['config'] == {"ssid": "dock"}
+
+
+def test_push_reports_every_espkey_without_stopping_at_failures(monkeypatch):
+    config = {"ssid": "lobby"}
+    espkeys = {
+        "door": espkey_with_config(monkeypatch, "door", config),
+        "gate": espkey_with_config(monkeypatch, "gate", {"ssid": "old"}),
+        "lobby": espkey_with_config(monkeypatch, "lobby", {"ssid": "old"}, applies=False),
+        "dock": espkey_with_config(monkeypatch, "dock", {"ssid": "old"}, status=500)
+    }
+
+    results = ConfigPush(espkeys, max_workers=2).run(config)
+
+    assert list(results) == ["door", "gate", "lobby", "dock"]
+    assert results['gate']['verified'] is True
+    assert results['lobby']['verified'] is False
+    assert results['dock'] == {"changed": False, "error": "HTTP status: 500"}
+    assert ConfigPush.summarize(results) == \
+        {"unchanged": 1, "changed": 1, "verified": 1, "failed": 2}
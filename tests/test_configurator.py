@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from lib.configurator import Configurator
+
+
+def espkey(**settings):
+    return dict({"base_url": "http://127.0.0.1:9", "web_user": "u", "web_pass": "p"}, **settings)
+
+
+def write_config(path, contents):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(contents))
+
+    return str(path)
+
+
+def test_included_files_load_first_and_targets_know_their_source(tmp_path):
+    write_config(tmp_path / "sites" / "lobby.json", {"door": espkey(group="lobby"),
+                                                     "gate": espkey(group="lobby")})
+    write_config(tmp_path / "sites" / "dock.json", {"dock": espkey(tags=["outdoor"])})
+    config_file = write_config(tmp_path / "espkeys.json", {
+        "include": ["sites/*.json"],
+        "gate": espkey(tags=["outdoor"])
+    })
+
+    configurator = Configurator(config_file)
+
+    assert configurator.targets() == ["dock", "door", "gate"]
+    assert configurator.source("door") == str(tmp_path / "sites" / "lobby.json")
+    assert configurator.source("gate") == config_file
+    assert configurator.resolve("tag:outdoor,group:lobby,dock") == ["dock", "gate", "door"]
+    assert configurator.resolve("all") == configurator.targets()
+
+
+def test_include_loops_and_missing_includes_are_errors(tmp_path):
+    write_config(tmp_path / "a.json", {"include": ["b.json"]})
+    write_config(tmp_path / "b.json", {"include": ["a.json"]})
+
+    with pytest.raises(ValueError) as e:
+        Configurator(str(tmp_path / "a.json"))
+
+    assert str(e.value).startswith("Configuration include loop:")
+
+    with pytest.raises(FileNotFoundError):
+        Configurator(write_config(tmp_path / "c.json", {"include": ["missing.json"]}))
+
+
+def test_targets_are_validated_when_they_are_used(tmp_path):
+    configurator = Configurator(write_config(tmp_path / "espkeys.json", {
+        "door": espkey(),
+        "gate": {"base_url": "http://127.0.0.1:10"}
+    }))
+
+    assert configurator.get("door")['base_url'] == "http://127.0.0.1:9"
+
+    with pytest.raises(ValueError) as e:
+        configurator.get("gate")
+
+    assert str(e.value) == "Required configuration item missing: gate.web_user. " \
+        "Required configuration item missing: gate.web_pass."
+
+    for spec in ["lobby", "tag:outdoor", "group:lobby"]:
+        with pytest.raises(KeyError):
+            configurator.resolve(spec)
+
+
+def test_environment_variables_configure_the_env_target(tmp_path, monkeypatch):
+    monkeypatch.setenv("ESPKEY_WEB_PASS", "from-env")
+
+    configurator = Configurator(write_config(tmp_path / "espkeys.json", {"door": espkey()}),
+                                env_var_prefix="ESPKEY", env_target="door")
+
+    assert configurator.get("door")['web_pass'] == "from-env"
+    assert configurator.get("door")['web_user'] == "u"
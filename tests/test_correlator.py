@@ -0,0 +1,76 @@
+import datetime
+
+from lib.correlator import Correlator
+from lib.log_entry import LogEntry
+
+
+BOOT_US = LogEntry.dts_to_us(datetime.datetime(2026, 1, 1, 12))
+
+
+def entry(time_raw, data_hex, boot_us=BOOT_US, latency_ms=0):
+    """Log entry as a pull would parse it. Each pull anchors timestamps to its own request
+       time, so they're off by the request latency.
+    """
+
+    return LogEntry(time_raw, data_hex=data_hex, data_len=26,
+                    dts_us=boot_us + (time_raw + latency_ms) * 1000)
+
+
+def test_observe_returns_only_new_entries_across_pulls():
+    correlator = Correlator()
+    first = [entry(1000, "aa"), entry(2000, "bb")]
+
+    assert correlator.observe("door", first) == first
+    assert correlator.observe("door", first + [entry(3000, "cc")]) == [entry(3000, "cc")]
+    assert correlator.observe("gate", first) == first
+
+
+def test_observe_keeps_boots_apart_after_a_reboot():
+    correlator = Correlator()
+    rebooted_us = BOOT_US + 60 * 1000000
+
+    # The first pull is all one boot, the next starts with it and ends with a new boot.
+    correlator.observe("door", [entry(1000, "aa"), entry(2000, "bb")])
+    new_entries = correlator.observe("door", [
+        LogEntry(1000, data_hex="aa", data_len=26),
+        LogEntry(2000, data_hex="bb", data_len=26),
+        entry(1000, "aa", rebooted_us, latency_ms=40),
+        entry(2000, "bb", rebooted_us, latency_ms=40)
+    ])
+
+    assert [e.dts_us for e in new_entries] == [rebooted_us + 1040000, rebooted_us + 2040000]
+
+    # The reboot is at the start of this pull so it's the first boot in it, but it isn't new.
+    assert correlator.observe("door", [entry(1000, "aa", rebooted_us, latency_ms=-30),
+                                       entry(2000, "bb", rebooted_us, latency_ms=-30)]) == []
+
+
+def test_observe_correlates_reads_across_devices():
+    correlator = Correlator()
+
+    correlator.observe("door", [entry(1000, "aa")])
+    correlator.observe("gate", [entry(5000, "aa"), entry(6000, "aa")])
+
+    record = correlator.summary()['aa']
+
+    assert record['count'] == 3
+    assert record['devices'] == 2
+    assert record['first_seen']['device'] == "door"
+    assert record['seen_at']['gate']['count'] == 2
+
+
+def test_observe_forgets_beyond_max_entries():
+    correlator = Correlator(max_entries=1)
+
+    correlator.observe("door", [entry(1000, "aa"), entry(2000, "bb")])
+
+    assert correlator.observe("door", [entry(1000, "aa")]) == [entry(1000, "aa")]
+
+
+def test_boot_ids_follow_segments_in_log_order():
+    entries = [LogEntry(5000, log_msg="a"), LogEntry(9000, log_msg="b"),
+               LogEntry(100, log_msg="c"), entry(50, "aa"), entry(80, "bb")]
+
+    # The last boot is anchored by its timestamps, the earlier ones are only numbered.
+    assert LogEntry.boot_ids(entries, []) == [0, 0, 1, ("boot", BOOT_US // 1000),
+                                              ("boot", BOOT_US // 1000)]
@@ -0,0 +1,79 @@
+import json
+
+from lib.configurator import Configurator
+from lib.discovery import Discovery
+
+
+def found(chip_id, host):
+    return {"base_url": f"http://192.168.4.{host}", "chip_id": chip_id, "version": {}}
+
+
+def test_merge_adds_new_espkeys_with_credentials():
+    merged, changes = Discovery.merge({}, [found("111", 5)], {"web_user": "u", "web_pass": "p"})
+
+    assert merged == {"espkey-111": {"web_user": "u", "web_pass": "p",
+                                     "base_url": "http://192.168.4.5", "chip_id": "111"}}
+    assert changes == {"added": ["espkey-111"], "updated": []}
+
+
+def test_merge_matches_by_base_url_without_chip_id():
+    config = {"door": {"base_url": "http://192.168.4.5/", "web_user": "u"},
+              "default": {"base_url": "http://192.168.4.5", "web_user": "u"}}
+    merged, changes = Discovery.merge(config, [found("111", 5)])
+
+    assert merged['door']['chip_id'] == "111"
+    assert merged['default']['chip_id'] == "111"
+    assert changes == {"added": [], "updated": ["door", "default"]}
+
+
+def test_merge_unchanged_espkey_is_not_updated():
+    config = {"door": {"base_url": "http://192.168.4.5", "chip_id": "111"}}
+
+    assert Discovery.merge(config, [found("111", 5)]) == (config, {"added": [], "updated": []})
+
+
+def test_merge_moved_espkey_and_newcomer_on_its_old_address():
+    config = {"door": {"base_url": "http://192.168.4.5", "chip_id": "AAA"}}
+    merged, changes = Discovery.merge(config, [found("BBB", 5), found("AAA", 9)])
+
+    assert merged['door'] == {"base_url": "http://192.168.4.9", "chip_id": "AAA"}
+    assert merged['espkey-BBB'] == {"base_url": "http://192.168.4.5", "chip_id": "BBB"}
+    assert changes == {"added": ["espkey-BBB"], "updated": ["door"]}
+
+
+def test_merge_does_not_change_the_input():
+    config = {"door": {"base_url": "http://192.168.4.5", "chip_id": "AAA"}}
+
+    Discovery.merge(config, [found("AAA", 9)])
+
+    assert config['door']['base_url'] == "http://192.168.4.5"
+
+
+def test_merge_treats_int_chip_ids_and_trailing_slashes_as_unchanged():
+    config = {"door": {"base_url": "http://192.168.4.5/", "chip_id": 111}}
+
+    assert Discovery.merge(config, [found("111", 5)])[1] == {"added": [], "updated": []}
+
+
+def test_write_updates_espkeys_in_included_files(tmp_path):
+    config_file = tmp_path / "espkeys.json"
+    inventory_file = tmp_path / "inventory" / "lobby.json"
+    inventory_file.parent.mkdir()
+    config_file.write_text(json.dumps({"include": ["inventory/*.json"]}))
+    inventory_file.write_text(json.dumps({
+        "door": {"base_url": "http://192.168.4.5", "chip_id": "AAA", "web_user": "u"}
+    }))
+
+    configurator = Configurator(str(config_file))
+    config = configurator.configuration
+    merged, changes = Discovery.merge(config, [found("AAA", 9), found("BBB", 5)])
+    written = Discovery.write(merged, changes, str(config_file),
+                              {target: configurator.source(target) for target in config})
+
+    assert sorted(written) == sorted([str(config_file), str(inventory_file)])
+    assert json.loads(inventory_file.read_text()) == \
+        {"door": {"base_url": "http://192.168.4.9", "chip_id": "AAA", "web_user": "u"}}
+    assert json.loads(config_file.read_text()) == {
+        "include": ["inventory/*.json"],
+        "espkey-BBB": {"base_url": "http://192.168.4.5", "chip_id": "BBB"}
+    }
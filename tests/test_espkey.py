@@ -0,0 +1,78 @@
+import datetime
+
+from lib.espkey import ESPKey
+from lib.log_entry import LogEntry
+
+
+REQ_DTS = datetime.datetime(2026, 1, 1, 12)
+
+
+def espkey_serving(monkeypatch, log_body, now_ts):
+    """ESPKey whose /log.txt returns log_body with the Now header set to now_ts."""
+
+    espkey = ESPKey({"name": "door", "base_url": "http://127.0.0.1:9", "web_user": "u",
+                     "web_pass": "p"})
+
+    def http_get(url, raw=False, coalesce=False):
+        return {"status": 200, "content": log_body, "now_header": str(now_ts),
+                "req_dts": REQ_DTS}
+
+    monkeypatch.setattr(espkey._ESPKey__http, "http_get", http_get)
+
+    return espkey
+
+
+def dts_at(now_ts, time_raw):
+    """Timestamp of an entry logged at time_raw when the request saw the clock at now_ts."""
+
+    return (REQ_DTS - datetime.timedelta(milliseconds=now_ts - time_raw)).isoformat()
+
+
+def test_timestamps_are_anchored_to_the_request(monkeypatch):
+    log = espkey_serving(monkeypatch, b"508 Starting up!\r\n21319 29b0bfc:26\r\n", 30000).get_log()
+
+    assert [entry['dts'] for entry in log] == [dts_at(30000, 508), dts_at(30000, 21319)]
+
+
+def test_only_the_current_boot_gets_timestamps(monkeypatch):
+    log = espkey_serving(monkeypatch, b"9000 aa:8\n12000 bb:8\n300 cc:8\n700 dd:8\n", 1000) \
+        .get_log(compact=True)
+
+    assert [entry.dts_us for entry in log] == [None, None,
+        LogEntry.dts_to_us(REQ_DTS) - 700000, LogEntry.dts_to_us(REQ_DTS) - 300000]
+
+
+def test_no_timestamps_when_the_device_rebooted_after_the_last_entry(monkeypatch):
+    log = espkey_serving(monkeypatch, b"9000 aa:8\n12000 bb:8\n", 1000).get_log(compact=True)
+
+    assert [entry.dts_us for entry in log] == [None, None]
+
+
+def test_log_lines_are_parsed_from_bytes(monkeypatch):
+    body = b"508 Starting up!\r\n  21319 29b0bfc:26 \r\n25000 Aux changed to 1\r\n" \
+           b"26000 Caf\xc3\xa9 door\r\nnot a log line\r\n\r\n27000 e1d2:16"
+    log = espkey_serving(monkeypatch, body, 30000).get_log(compact=True)
+
+    assert [(entry.time_raw, entry.data_hex, entry.data_len, entry.log_msg, entry.aux_status)
+            for entry in log] == [
+        (508, None, None, "Starting up!", None),
+        (21319, "29b0bfc", 26, None, None),
+        (25000, None, None, "Aux changed to 1", True),
+        (26000, None, None, "Café door", None),
+        (27000, "e1d2", 16, None, None)
+    ]
+
+
+def test_log_files_are_parsed_without_timestamps(tmp_path):
+    log_file = tmp_path / "door.txt"
+    log_file.write_bytes(b"508 Starting up!\n21319 29b0bfc:26\n")
+    empty_file = tmp_path / "empty.txt"
+    empty_file.write_bytes(b"")
+    espkey = ESPKey({"name": "door"})
+
+    assert espkey.get_log(file_name=str(log_file)) == [
+        {"time_raw": 508, "log_msg": "Starting up!"},
+        {"time_raw": 21319, "data_hex": "29b0bfc", "data_len": 26,
+         "possible_hid_26": {"fc": 77, "cn": 34302}}
+    ]
+    assert espkey.get_log(file_name=str(empty_file)) == []
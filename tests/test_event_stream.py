@@ -0,0 +1,45 @@
+import json
+import queue
+
+from lib.event_stream import EventStream, QueueSink
+from lib.log_entry import LogEntry
+
+
+def published(event_queue):
+    lines = []
+
+    while not event_queue.empty():
+        lines.append(json.loads(event_queue.get()[1]))
+
+    return [(line['device'], line['entry']['time_raw']) for line in lines]
+
+
+def test_publish_log_only_sends_new_reads():
+    event_queue = queue.Queue()
+    event_stream = EventStream([QueueSink(event_queue)])
+    log = [LogEntry(100, log_msg="Starting up!"), LogEntry(200, "29b0bfc", 26)]
+
+    event_stream.publish_log("door", log)
+    assert published(event_queue) == [("door", 200)]
+
+    # Pulling the same log again sends nothing, a longer one sends only what was added.
+    event_stream.publish_log("door", log)
+    assert published(event_queue) == []
+
+    event_stream.publish_log("door", log + [LogEntry(300, "2c8636e", 26)])
+    assert published(event_queue) == [("door", 300)]
+
+    # Other ESPKeys are tracked separately.
+    event_stream.publish_log("lobby", log)
+    assert published(event_queue) == [("lobby", 200)]
+
+
+def test_publish_log_after_delete_sends_everything():
+    event_queue = queue.Queue()
+    event_stream = EventStream([QueueSink(event_queue)])
+
+    event_stream.publish_log("door", [LogEntry(100, "29b0bfc", 26), LogEntry(200, "29b0bfc", 26)])
+    published(event_queue)
+
+    event_stream.publish_log("door", [LogEntry(50, "1111111", 26)])
+    assert published(event_queue) == [("door", 50)]
@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import pytest
+
+from lib.http_requests import HTTPRequests
+
+
+@pytest.fixture
+def slow_server():
+    requests_seen = []
+
+    class SlowHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+
+        def do_GET(self):
+            requests_seen.append(self.headers.get("Authorization"))
+
+            # Long enough for the other callers to arrive while this one is in flight.
+            time.sleep(0.3)
+
+            body = self.headers.get("Authorization", "").encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield f"http://127.0.0.1:{server.server_address[1]}", requests_seen
+
+    server.shutdown()
+    server.server_close()
+
+
+def get_all(base_url, configs):
+    def get(config):
+        return HTTPRequests(dict(config, base_url=base_url)).http_get(f"{base_url}/all",
+                                                                     coalesce=True)['text']
+
+    with ThreadPoolExecutor(len(configs)) as executor:
+        return list(executor.map(get, configs))
+
+
+def test_identical_requests_share_one_response(slow_server):
+    base_url, requests_seen = slow_server
+    texts = get_all(base_url, [{"web_user": "u", "web_pass": "p"}] * 5)
+
+    assert len(requests_seen) == 1
+    assert len(set(texts)) == 1
+
+
+def test_different_passwords_are_not_shared(slow_server):
+    base_url, requests_seen = slow_server
+    texts = get_all(base_url, [{"web_user": "u", "web_pass": "right"},
+                               {"web_user": "u", "web_pass": "wrong"}])
+
+    assert len(requests_seen) == 2
+    assert texts[0] != texts[1]
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from lib.journal import Journal
+
+
+def recipe_file(tmp_path, text="{}"):
+    file_name = tmp_path / "recipe.json"
+    file_name.write_text(text)
+
+    return str(file_name)
+
+
+def test_resume_reads_completed_work(tmp_path):
+    journal_file = str(tmp_path / "recipe.json.journal")
+    journal = Journal(journal_file, recipe_file(tmp_path))
+    journal.append({"type": "action", "task": "t", "iteration": 0, "action": 1, "data": {"x": 1}})
+    journal.append({"type": "action", "task": "t", "iteration": 0, "action": 1, "data": {"x": 2}})
+    journal.append({"type": "run", "task": "u", "iteration": 2, "file": "out.json"})
+    journal.close()
+
+    state = Journal(journal_file, recipe_file(tmp_path), resume=True).state
+
+    assert state == {"runs": {"u": 3}, "actions": {("t", 0, 1): [{"x": 1}, {"x": 2}]}}
+
+
+def test_partly_written_last_line_is_ignored(tmp_path):
+    journal_file = str(tmp_path / "recipe.json.journal")
+    journal = Journal(journal_file, recipe_file(tmp_path))
+    journal.append({"type": "run", "task": "t", "iteration": 0, "file": "out.json"})
+    journal.close()
+
+    with open(journal_file, "a") as f:
+        f.write('{"type": "run", "task": "t", "itera')
+
+    assert Journal(journal_file, recipe_file(tmp_path), resume=True).state['runs'] == {"t": 1}
+
+
+def test_journal_of_an_edited_recipe_is_refused(tmp_path):
+    journal_file = str(tmp_path / "recipe.json.journal")
+    Journal(journal_file, recipe_file(tmp_path)).close()
+
+    with pytest.raises(ValueError):
+        Journal(journal_file, recipe_file(tmp_path, '{"tasks": {}}'), resume=True)
+
+
+def test_without_resume_a_new_journal_is_started(tmp_path):
+    journal_file = str(tmp_path / "recipe.json.journal")
+    journal = Journal(journal_file, recipe_file(tmp_path))
+    journal.append({"type": "run", "task": "t", "iteration": 0, "file": "out.json"})
+    journal.close()
+
+    Journal(journal_file, recipe_file(tmp_path)).close()
+
+    with open(journal_file, "r") as f:
+        assert [json.loads(line)['type'] for line in f] == ["start"]
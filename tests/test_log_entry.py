@@ -0,0 +1,59 @@
+import datetime
+import json
+
+import pytest
+
+from lib.log_entry import LogEntry
+
+
+def test_data_entry_matches_the_dict_form():
+    entry = LogEntry(21319, data_hex="29b0bfc", data_len=26,
+                     dts_us=LogEntry.dts_to_us(datetime.datetime(2026, 1, 1, 12, 0, 0, 500)))
+
+    assert entry.to_dict() == {
+        "time_raw": 21319,
+        "data_hex": "29b0bfc",
+        "data_len": 26,
+        "possible_hid_26": {"fc": 77, "cn": 34302},
+        "dts": "2026-01-01T12:00:00.000500"
+    }
+
+
+def test_keypad_and_uid_guesses():
+    assert LogEntry(1, data_hex="e1d2", data_len=16)['possible_hid_keypad'] == ["1", "2"]
+    assert 'possible_uid' in LogEntry(1, data_hex="04a1b2c3", data_len=32).to_dict()
+
+
+def test_aux_and_text_entries():
+    aux = LogEntry(25000, log_msg="Aux changed to 1", aux_status=True)
+    text = LogEntry(508, log_msg="Starting up!")
+
+    assert aux.to_dict() == {"aux_status": True, "log_msg": "Aux changed to 1", "time_raw": 25000}
+    assert text.to_dict() == {"time_raw": 508, "log_msg": "Starting up!"}
+    assert 'aux_status' not in text
+
+
+def test_entries_behave_like_read_only_dicts():
+    entry = LogEntry(21319, data_hex="29b0bfc", data_len=26)
+
+    assert entry == entry.to_dict()
+    assert list(entry) == ["time_raw", "data_hex", "data_len", "possible_hid_26"]
+    assert len(entry) == 4
+    assert entry.get('dts') is None
+    assert entry.get('log_msg') is None
+
+    with pytest.raises(KeyError):
+        entry['dts']
+
+    with pytest.raises(AttributeError):
+        entry.extra = 1
+
+
+def test_json_default_serializes_entries():
+    entries = [LogEntry(508, log_msg="Starting up!"), LogEntry(1, data_hex="4b", data_len=8)]
+
+    assert json.loads(json.dumps(entries, default=LogEntry.json_default)) == \
+        [entry.to_dict() for entry in entries]
+
+    with pytest.raises(TypeError):
+        json.dumps(object(), default=LogEntry.json_default)
@@ -0,0 +1,88 @@
+from urllib.request import urlopen
+
+from lib.metrics import MetricsRegistry
+
+
+def test_counters_and_histograms_render_in_exposition_format():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests.", ("device",))
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+
+    requests.inc("door")
+    requests.inc("door", amount=2)
+    requests.inc('g"ate')
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    assert registry.counter("requests_total", "Requests.", ("device",)) is requests
+    assert registry.render().splitlines() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1.0"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        "latency_seconds_sum 5.55",
+        "latency_seconds_count 3",
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{device="door"} 3',
+        'requests_total{device="g\\"ate"} 1'
+    ]
+
+
+def test_summary_skips_empty_metrics_and_reports_bucket_percentiles():
+    registry = MetricsRegistry()
+    registry.counter("unused_total", "Unused.")
+    latency = registry.histogram("latency_seconds", "Latency.", ("device",), buckets=(0.1, 1.0))
+
+    for value in [0.05] * 9 + [0.5]:
+        latency.observe(value, "door")
+
+    summary = registry.summary()
+
+    assert list(summary) == ["latency_seconds"]
+    assert summary['latency_seconds']['{device="door"}'] == {
+        "count": 10, "sum": 0.95, "mean": 0.095, "p50": 0.1, "p95": 1.0
+    }
+
+
+def test_worker_snapshots_merge_into_the_parent():
+    parent = MetricsRegistry()
+    worker = MetricsRegistry()
+
+    for registry in [parent, worker]:
+        registry.counter("requests_total", "Requests.", ("device",))
+        registry.histogram("latency_seconds", "Latency.", buckets=(1.0,))
+
+    parent.counter("requests_total", "Requests.").inc("door")
+    worker.counter("requests_total", "Requests.").inc("door", amount=4)
+    worker.counter("requests_total", "Requests.").inc("gate")
+    worker.histogram("latency_seconds", "Latency.").observe(2.0)
+    worker.counter("worker_only_total", "Not in the parent.").inc()
+
+    parent.merge(worker.snapshot())
+
+    assert parent.counter("requests_total", "Requests.").snapshot() == \
+        {("door",): 5, ("gate",): 1}
+    assert parent.histogram("latency_seconds", "Latency.").snapshot() == {(): [[0, 1], 2.0, 1]}
+    assert "worker_only_total" not in parent.snapshot()
+
+    worker.reset()
+
+    assert worker.summary() == {}
+
+
+def test_metrics_are_served_for_scraping():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests.").inc()
+    registry.serve(port=0)
+
+    try:
+        port = registry._MetricsRegistry__server.server_address[1]
+
+        with urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            assert response.read().decode() == registry.render()
+
+    finally:
+        registry.stop()
@@ -0,0 +1,109 @@
+import json
+import time
+
+from lib.monitor import DeviceTrend, Monitor
+
+
+def diagnostics(heap, analog=1000, gpio=None):
+    return {"heap": heap, "analog": analog, "parsed": gpio or {"d0": 1, "d1": 1}}
+
+
+def test_heap_slope_follows_the_ring_buffer():
+    trend = DeviceTrend(window=5)
+
+    assert trend.heap_slope is None
+
+    for t in range(5):
+        trend.add(t, diagnostics(20000 - (10 * t)))
+
+    assert round(trend.heap_slope, 6) == -10.0
+
+    # Old samples leave the fit as the heap levels off.
+    for t in range(5, 10):
+        trend.add(t, diagnostics(19950))
+
+    assert round(trend.heap_slope, 6) == 0.0
+
+
+def test_a_heap_leak_alerts_once_until_it_clears():
+    trend = DeviceTrend(window=10, leak_bytes_per_min=60, min_samples=5, min_span_sec=4)
+    leaks = []
+
+    for t in range(10):
+        alerts, _ = trend.add(t, diagnostics(20000 - (10 * t)))
+        leaks.extend(alert for alert in alerts if alert['alert'] == "heap_leak")
+
+    assert leaks == [{"alert": "heap_leak", "heap": 19960, "bytes_per_min": -600.0,
+                      "exhaustion_sec": 1996.0}]
+    assert trend.status()['active_alerts'] == ["heap_leak"]
+
+    for t in range(10, 30):
+        alerts, _ = trend.add(t, diagnostics(20000))
+        leaks.extend(alert for alert in alerts if alert['alert'] == "heap_leak")
+
+    assert leaks[-1] == {"alert": "heap_leak", "cleared": True, "heap": 20000}
+    assert trend.status()['active_alerts'] == []
+
+
+def test_low_heap_and_line_changes_alert_and_history_is_downsampled():
+    trend = DeviceTrend(downsample_sec=60, min_heap=8192)
+
+    alerts, history = trend.add(0, diagnostics(20000))
+
+    assert alerts == [] and history is None
+
+    alerts, history = trend.add(30, diagnostics(4000, gpio={"d0": 0, "d1": 1}))
+
+    assert alerts == [{"alert": "heap_low", "heap": 4000},
+                      {"alert": "gpio_change", "changed": {"d0": 0}}]
+    assert history is None
+
+    alerts, history = trend.add(60, diagnostics(20000))
+
+    assert {"alert": "heap_low", "cleared": True, "heap": 20000} in alerts
+    assert history == {"start": "1970-01-01T00:00:00", "samples": 2,
+                       "gpio": {"d0": 0, "d1": 1},
+                       "heap": {"min": 4000, "max": 20000, "mean": 12000.0},
+                       "analog": {"min": 1000, "max": 1000, "mean": 1000.0}}
+    assert trend.flush()['samples'] == 1
+    assert trend.flush() is None
+
+
+class PolledESPKey:
+    def __init__(self, delay=0, error=None):
+        self.polls = 0
+        self.__delay = delay
+        self.__error = error
+
+    def get_diagnostics(self):
+        self.polls += 1
+        time.sleep(self.__delay)
+
+        if self.__error is not None:
+            raise self.__error
+
+        return diagnostics(20000)
+
+
+def test_a_hung_espkey_doesnt_hold_up_the_others():
+    espkeys = {"door": PolledESPKey(), "gate": PolledESPKey(delay=0.5)}
+
+    status = Monitor(espkeys, interval=0.05).run(duration=0.3)
+
+    assert espkeys['gate'].polls == 1
+    assert espkeys['door'].polls >= 4
+    assert status['door']['samples'] == espkeys['door'].polls
+
+
+def test_unreachable_espkeys_are_alerted_and_recorded(tmp_path):
+    history_file = tmp_path / "history.jsonl"
+    espkeys = {"door": PolledESPKey(error=ConnectionError("refused"))}
+
+    status = Monitor(espkeys, interval=0.01, history_file=str(history_file)).run(duration=0.05)
+
+    records = [json.loads(line) for line in history_file.read_text().splitlines()]
+
+    assert espkeys['door'].polls > 1
+    assert [(record['type'], record['alert'], record['error']) for record in records] == \
+        [("alert", "unreachable", "refused")]
+    assert status['door']['reachable'] is False
@@ -0,0 +1,51 @@
+import json
+import os
+
+import pytest
+
+from lib.log_entry import LogEntry
+from lib.output_writer import OutputWriter
+
+
+def test_callbacks_run_in_order_once_their_files_are_written(tmp_path):
+    writer = OutputWriter(fsync_batch=2)
+    seen = []
+
+    for idx in range(5):
+        file_name = str(tmp_path / f"{idx}.json")
+        writer.submit(file_name, {"idx": idx},
+                      callback=lambda idx=idx, file_name=file_name:
+                          seen.append((idx, os.path.exists(file_name))))
+
+    writer.call(lambda: seen.append(("done", len(os.listdir(tmp_path)))))
+    writer.close()
+
+    assert seen == [(idx, True) for idx in range(5)] + [("done", 5)]
+
+
+def test_logs_are_serialized_with_log_entries_and_dumps_settings(tmp_path):
+    writer = OutputWriter(fsync=False)
+    entry = LogEntry(1000, data_hex="29b0bfc", data_len=26)
+
+    writer.submit(str(tmp_path / "compact.json"), {"result": [entry]},
+                  {"separators": (",", ":")})
+    writer.submit(str(tmp_path / "serialized.json"), '{"already": "serialized"}')
+    writer.close()
+
+    compact = (tmp_path / "compact.json").read_text()
+
+    assert compact.startswith('{"result":[{"time_raw":1000,')
+    assert json.loads(compact)['result'][0]['possible_hid_26'] == {"fc": 77, "cn": 34302}
+    assert (tmp_path / "serialized.json").read_text() == '{"already": "serialized"}'
+
+
+def test_a_failed_write_is_raised_to_the_caller(tmp_path):
+    writer = OutputWriter()
+    called = []
+
+    writer.submit(str(tmp_path / "missing" / "log.json"), {}, callback=lambda: called.append(1))
+
+    with pytest.raises(FileNotFoundError):
+        writer.close()
+
+    assert called == []
@@ -0,0 +1,75 @@
+import cProfile
+import json
+
+from lib.profiler import Profiler
+
+
+def test_a_disabled_profiler_records_nothing():
+    profiler = Profiler()
+
+    with profiler.span("get_log"):
+        pass
+
+    assert profiler.events() == []
+
+
+def test_spans_nest_and_add_up_per_phase():
+    profiler = Profiler()
+    profiler.enable()
+
+    with profiler.span("get_log", device="door"):
+        for _ in range(2):
+            with profiler.span("http", category="io"):
+                pass
+
+    events = profiler.events()
+
+    # Inner spans finish first.
+    assert [event['name'] for event in events] == ["http", "http", "get_log"]
+    assert events[2]['args'] == {"device": "door"} and 'args' not in events[0]
+    assert events[0]['cat'] == "io" and events[0]['ph'] == "X"
+
+    breakdown = profiler.breakdown()
+
+    assert breakdown['phases']['http']['count'] == 2
+    assert list(breakdown['phases']) == ["get_log", "http"]
+    assert breakdown['wall_ms'] >= breakdown['phases']['get_log']['total_ms']
+
+
+def test_worker_spans_merge_into_the_parent():
+    parent = Profiler()
+    worker = Profiler()
+    worker.enable()
+
+    with worker.span("parse_log"):
+        pass
+
+    parent.merge(worker.events())
+    worker.reset()
+
+    assert [event['name'] for event in parent.events()] == ["parse_log"]
+    assert worker.events() == []
+
+
+def test_report_writes_the_trace_breakdown_and_cprofile_stats(tmp_path):
+    profiler = Profiler()
+    profiler.enable()
+    cprofile = cProfile.Profile()
+    cprofile.enable()
+
+    with profiler.span("run"):
+        sum(range(1000))
+
+    cprofile.disable()
+    base_name = str(tmp_path / "profile")
+
+    assert profiler.write_report(base_name, cprofile=cprofile) == \
+        [f"{base_name}_trace.json", f"{base_name}.pstats", f"{base_name}.json"]
+
+    trace = json.loads((tmp_path / "profile_trace.json").read_text())
+    report = json.loads((tmp_path / "profile.json").read_text())
+
+    assert [event['name'] for event in trace['traceEvents']] == ["run"]
+    assert report['phases']['run']['count'] == 1
+    assert report['cprofile'] == f"{base_name}.pstats"
+    assert 'memory' not in report
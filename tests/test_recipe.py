@@ -0,0 +1,273 @@
+import json
+import os
+
+import pytest
+
+from lib import espkey, http_requests
+from lib.recipe import InvlalidRecipe, Recipe
+
+
+def write_recipe(path, recipe):
+    recipe_file = path / "recipe.json"
+    recipe_file.write_text(json.dumps(recipe))
+
+    return str(recipe_file)
+
+
+def test_espkey_timeout_reaches_http_requests(tmp_path, monkeypatch):
+    configs = {}
+
+    class RecordingHTTPRequests(http_requests.HTTPRequests):
+        def __init__(self, config):
+            configs.update({config['name']: config})
+            super().__init__(config)
+
+    monkeypatch.setattr(espkey, "HTTPRequests", RecordingHTTPRequests)
+
+    Recipe(write_recipe(tmp_path, {
+        "espkeys": {
+            "door": {"base_url": "http://127.0.0.1:9", "timeout": [2, 10]},
+            "gate": {"base_url": "http://127.0.0.1:9"}
+        },
+        "tasks": {"t": {"target": "door", "actions": [{"operation": "get_version"}]}}
+    }))
+
+    assert configs['door']['timeout'] == [2, 10]
+    assert 'timeout' not in configs['gate']
+
+
+def journal_actions(recipe_file):
+    with open(f"{recipe_file}.journal", "r") as f:
+        return [(record['action'], record['data']['action']) for record in map(json.loads, f)
+                if record['type'] == "action"]
+
+
+def test_resume_skips_state_changes_and_keeps_logs_pulled_before_them(tmp_path, fake_espkeys):
+    recipe_file = write_recipe(tmp_path, {
+        "espkeys": {"door": {"base_url": "http://127.0.0.1:9"}},
+        "tasks": {"t": {"target": "door", "actions": [
+            {"operation": "send_weigand", "data": "29b0bfc:26"},
+            {"operation": "get_log"},
+            {"operation": "delete_log"},
+            {"operation": "get_version"}
+        ]}}
+    })
+    fake_espkeys.fail.update({"delete_log": 0})
+
+    with pytest.raises(RuntimeError):
+        Recipe(recipe_file).run()
+
+    assert journal_actions(recipe_file) == [(0, "send_weigand"), (1, "get_log")]
+
+    fake_espkeys.fail.clear()
+    fake_espkeys.calls.clear()
+    Recipe(recipe_file, resume=True).run()
+
+    assert fake_espkeys.calls == ["delete_log", "get_version"]
+    assert not os.path.exists(f"{recipe_file}.journal")
+
+    output_files = [name for name in os.listdir(tmp_path) if name.endswith("_door_t.json")]
+    output = json.loads((tmp_path / output_files[0]).read_text())
+
+    assert [action['action'] for action in output['actions']] == \
+        ["send_weigand", "get_log", "delete_log", "get_version"]
+    assert output['actions'][1]['result'][0]['data_hex'] == "29b0bfc"
+    assert output['metadata']['resumed'] is True
+
+
+def test_read_only_actions_are_run_again_on_resume(tmp_path, fake_espkeys):
+    recipe_file = write_recipe(tmp_path, {
+        "espkeys": {"door": {"base_url": "http://127.0.0.1:9"}},
+        "tasks": {"t": {"target": "door", "actions": [
+            {"operation": "get_log"},
+            {"operation": "get_version"}
+        ]}}
+    })
+    fake_espkeys.fail.update({"get_version": 0})
+
+    with pytest.raises(RuntimeError):
+        Recipe(recipe_file).run()
+
+    assert journal_actions(recipe_file) == []
+
+    fake_espkeys.fail.clear()
+    fake_espkeys.calls.clear()
+    Recipe(recipe_file, resume=True).run()
+
+    assert fake_espkeys.calls == ["get_log", "get_version"]
+
+
+def validation_errors(tmp_path, action):
+    recipe_file = write_recipe(tmp_path, {
+        "espkeys": {"door": {"base_url": "http://127.0.0.1:9"}},
+        "tasks": {"t": {"target": "door", "actions": [action]}}
+    })
+
+    with pytest.raises(InvlalidRecipe) as e:
+        Recipe(recipe_file)
+
+    return str(e.value)
+
+
+@pytest.mark.parametrize("action, error", [
+    ({"operation": "send_weigand_sequence", "format": ["h10301"], "fc": 1, "cn_start": 1,
+      "cn_end": 2}, "format: Must be a format name string."),
+    ({"operation": "send_weigand_sequence", "format": {}, "fc": 1, "cn_start": 1,
+      "cn_end": 2}, "format: Must be a format name string."),
+    ({"operation": "send_weigand_sequence", "format": "h10301", "fc": True, "cn_start": 1,
+      "cn_end": 2}, "fc: An int is required."),
+    ({"operation": "send_weigand_sequence", "format": "h10301", "fc": 1, "cn_start": False,
+      "cn_end": 2}, "cn_start: An int is required."),
+    ({"operation": "send_weigand_sequence", "frames": ["29b0bfc:26"], "rate": True},
+     "rate: Must be an int or float greater than 0."),
+    ({"operation": "send_weigand", "format": ["h10301"], "fc": 1, "cn": 1},
+     "format must be a format name string."),
+    ({"operation": "send_weigand", "format": "h10301", "fc": 1, "cn": True},
+     "fc and cn must be ints."),
+    ({"operation": "send_weigand", "data": 26}, "data: Invalid data format.")
+])
+def test_invalid_weigand_actions_are_reported(tmp_path, action, error):
+    assert error in validation_errors(tmp_path, action)
+
+
+def output_files(path, suffix):
+    return sorted(name for name in os.listdir(path) if name.endswith(suffix))
+
+
+def test_resume_after_an_interrupted_repeat_runs_only_what_is_left(tmp_path, fake_espkeys):
+    recipe_file = write_recipe(tmp_path, {
+        "espkeys": {"door": {"base_url": "http://127.0.0.1:9"}},
+        "tasks": {"t": {"target": "door", "repeat": 3, "every": 0.01, "actions": [
+            {"operation": "send_weigand", "data": "29b0bfc:26"},
+            {"operation": "get_version"}
+        ]}}
+    })
+
+    # The second run is interrupted after its frame was sent.
+    fake_espkeys.fail.update({"get_version": 1})
+
+    with pytest.raises(RuntimeError):
+        Recipe(recipe_file).run()
+
+    assert output_files(tmp_path, "_0.json") and not output_files(tmp_path, "_1.json")
+
+    fake_espkeys.fail.clear()
+    fake_espkeys.calls.clear()
+    Recipe(recipe_file, resume=True).run()
+
+    # The first run isn't repeated and the second run's frame isn't sent again.
+    assert fake_espkeys.calls == ["get_version", "send_weigand", "get_version"]
+
+    second = json.loads((tmp_path / output_files(tmp_path, "_1.json")[0]).read_text())
+
+    assert [action['action'] for action in second['actions']] == ["send_weigand", "get_version"]
+    assert second['metadata'] == dict(second['metadata'], iteration=1, resumed=True)
+    assert len(output_files(tmp_path, "_2.json")) == 1
+
+
+def test_a_finished_run_removes_its_journal(tmp_path, fake_espkeys):
+    recipe_file = write_recipe(tmp_path, {
+        "espkeys": {"door": {"base_url": "http://127.0.0.1:9"}},
+        "tasks": {"t": {"target": "door", "actions": [{"operation": "restart"}]}}
+    })
+
+    Recipe(recipe_file).run()
+
+    assert not os.path.exists(f"{recipe_file}.journal")
+    assert fake_espkeys.calls == ["restart"]
+
+
+def task(target, operation, **settings):
+    return dict(settings, target=target, actions=[{"operation": operation}])
+
+
+def graph_recipe(tmp_path, tasks):
+    return write_recipe(tmp_path, {
+        "espkeys": {"door": {"base_url": "http://127.0.0.1:9"},
+                    "gate": {"base_url": "http://127.0.0.1:10"}},
+        "tasks": tasks
+    })
+
+
+@pytest.mark.parametrize("tasks, error", [
+    ({"a": task("door", "get_version", depends_on="c"),
+      "b": task("door", "get_config", depends_on="a"),
+      "c": task("door", "get_log", depends_on=["b"])},
+     "'depends_on' forms a cycle: a -> c -> b -> a."),
+    ({"a": task("door", "get_version", depends_on="a")}, "'depends_on' forms a cycle: a -> a."),
+    ({"a": task("door", "get_version", depends_on="missing")},
+     "a: 'depends_on' task \"missing\" doesn't exist."),
+    ({"a": task("door", "get_version", depends_on=[1])},
+     "a: 'depends_on' must be a task name or a list of them.")
+])
+def test_invalid_dependencies_are_reported(tmp_path, tasks, error):
+    with pytest.raises(InvlalidRecipe) as e:
+        Recipe(graph_recipe(tmp_path, tasks))
+
+    # Task errors are listed as a repr.
+    assert error in str(e.value).replace("\\'", "'")
+
+
+def test_tasks_wait_for_their_dependencies(tmp_path, fake_espkeys):
+    Recipe(graph_recipe(tmp_path, {
+        "report": task("gate", "get_log", depends_on=["reboot", "probe"]),
+        "reboot": task("door", "restart", depends_on="probe"),
+        "probe": task("door", "get_version", repeat=3, every=0.01)
+    })).run()
+
+    assert fake_espkeys.calls == ["get_version"] * 3 + ["restart", "get_log"]
+
+
+def test_dependents_of_a_failed_task_never_run(tmp_path, fake_espkeys):
+    fake_espkeys.fail.update({"get_version": 0})
+
+    with pytest.raises(RuntimeError):
+        Recipe(graph_recipe(tmp_path, {
+            "probe": task("door", "get_version"),
+            "reboot": task("door", "restart", depends_on="probe")
+        })).run()
+
+    assert "restart" not in fake_espkeys.calls
+
+
+def fleet_recipe(tmp_path, tasks, **settings):
+    return write_recipe(tmp_path, dict(settings, espkeys={
+        name: {"base_url": f"http://127.0.0.1:{port}"}
+        for port, name in enumerate(["door", "gate", "lobby", "dock"], 9)
+    }, tasks=tasks))
+
+
+def test_shards_balance_tasks_and_keep_dependent_espkeys_together(tmp_path):
+    recipe = Recipe(fleet_recipe(tmp_path, {
+        "door1": task("door", "get_log"),
+        "door2": task("door", "get_version"),
+        "door3": task("door", "get_config"),
+        "gate": task("gate", "get_log"),
+        "lobby": task("lobby", "get_log", depends_on="gate"),
+        "dock": task("dock", "get_log")
+    }))
+
+    shards = recipe._Recipe__plan_shards(2)
+
+    assert sorted(sorted(shard) for shard in shards) == [["dock", "gate", "lobby"], ["door"]]
+    assert sorted(sorted(shard) for shard in recipe._Recipe__plan_shards(8)) == \
+        [["dock"], ["door"], ["gate", "lobby"]]
+
+
+def test_sharded_run_writes_every_log_and_merges_correlation(tmp_path, fake_espkeys):
+    recipe_file = fleet_recipe(tmp_path, {
+        name: task(name, "get_log") for name in ["door", "gate", "lobby", "dock"]
+    }, correlate=True)
+
+    Recipe(recipe_file, processes=2).run()
+
+    assert sorted(name.split("_", 1)[1] for name in output_files(tmp_path, ".json")
+                  if not name.endswith(("_correlation.json", "recipe.json"))) == \
+        ["dock_dock.json", "door_door.json", "gate_gate.json", "lobby_lobby.json"]
+
+    correlation = json.loads((tmp_path / output_files(tmp_path, "_correlation.json")[0])
+                             .read_text())
+
+    assert correlation['29b0bfc']['count'] == 4
+    assert correlation['29b0bfc']['devices'] == 4
+    assert not os.path.exists(f"{recipe_file}.journal")
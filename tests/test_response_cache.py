@@ -0,0 +1,99 @@
+import multiprocessing
+
+from lib.response_cache import ResponseCache
+
+
+def test_put_and_get_share_one_file(tmp_path):
+    cache_file = str(tmp_path / "cache.json")
+    first = ResponseCache(cache_file=cache_file)
+    second = ResponseCache(cache_file=cache_file)
+
+    first.put("http://10.0.0.1/version", "v1", {"ETag": "abc"})
+    second.put("http://10.0.0.2/version", "v2", {})
+
+    assert first.get("http://10.0.0.2/version")['text'] == "v2"
+    assert second.get("http://10.0.0.1/version")['etag'] == "abc"
+
+
+def test_invalidation_reaches_other_instances(tmp_path):
+    cache_file = str(tmp_path / "cache.json")
+    first = ResponseCache(cache_file=cache_file)
+    second = ResponseCache(cache_file=cache_file)
+
+    first.put("http://10.0.0.1/config.json", "old", {})
+    assert second.get("http://10.0.0.1/config.json")['text'] == "old"
+
+    # Another process changes the configuration and drops its cached copy.
+    second.invalidate("http://10.0.0.1/")
+
+    assert first.get("http://10.0.0.1/config.json") is None
+
+    # Storing something else must not bring the dropped entry back.
+    first.put("http://10.0.0.1/version", "v1", {})
+
+    assert second.get("http://10.0.0.1/config.json") is None
+    assert ResponseCache(cache_file=cache_file).get("http://10.0.0.1/config.json") is None
+
+
+def test_invalidate_prefix_leaves_similar_addresses(tmp_path):
+    cache = ResponseCache(cache_file=str(tmp_path / "cache.json"))
+
+    cache.put("http://10.0.0.1/version", "a", {})
+    cache.put("http://10.0.0.10/version", "b", {})
+    cache.invalidate("http://10.0.0.1/")
+
+    assert cache.get("http://10.0.0.1/version") is None
+    assert cache.get("http://10.0.0.10/version")['text'] == "b"
+
+
+def test_ttl_and_touch():
+    cache = ResponseCache(ttl=0)
+
+    cache.put("http://10.0.0.1/version", "a", {})
+    entry = cache.get("http://10.0.0.1/version")
+
+    assert not cache.is_fresh(entry)
+    assert ResponseCache(ttl=60).is_fresh(entry)
+
+    cache.touch("http://10.0.0.1/version")
+
+    assert cache.get("http://10.0.0.1/version")['stored'] >= entry['stored']
+
+
+def test_espkey_invalidate_cache_only_drops_its_own_entries(tmp_path):
+    from lib.espkey import ESPKey
+
+    cache_file = str(tmp_path / "cache.json")
+    cache = ResponseCache(cache_file=cache_file)
+    cache.put("http://10.0.0.1/version", "a", {})
+    cache.put("http://10.0.0.10/version", "b", {})
+
+    ESPKey({"base_url": "http://10.0.0.1", "cache": {"file": cache_file}}).invalidate_cache()
+
+    assert cache.get("http://10.0.0.1/version") is None
+    assert cache.get("http://10.0.0.10/version")['text'] == "b"
+
+
+def _put_many(cache_file, worker):
+    cache = ResponseCache(cache_file=cache_file)
+
+    for idx in range(50):
+        cache.put(f"http://10.0.{worker}.{idx}/version", "v", {})
+
+
+def test_processes_sharing_the_file_keep_each_others_entries(tmp_path):
+    cache_file = str(tmp_path / "cache.json")
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_put_many, args=(cache_file, worker))
+               for worker in range(4)]
+
+    for worker in workers:
+        worker.start()
+
+    for worker in workers:
+        worker.join()
+
+    cache = ResponseCache(cache_file=cache_file)
+
+    assert all(cache.get(f"http://10.0.{worker}.{idx}/version") is not None
+               for worker in range(4) for idx in range(50))
@@ -0,0 +1,87 @@
+import datetime
+import threading
+
+import pytest
+
+from lib.scheduler import CronSchedule, Schedule
+
+
+def test_cron_next_run_steps_and_ranges():
+    cron = CronSchedule("*/15 9-17 * * 1-5")
+
+    # Friday 17:50 rolls over the weekend to Monday 09:00.
+    after = datetime.datetime(2024, 12, 13, 17, 50)
+
+    assert cron.next_run(after) == datetime.datetime(2024, 12, 16, 9, 0)
+    assert cron.next_run(datetime.datetime(2024, 12, 16, 9, 0)) == \
+        datetime.datetime(2024, 12, 16, 9, 15)
+
+
+def test_cron_day_fields_match_either_when_both_restricted():
+    # The 1st of the month or any Sunday.
+    cron = CronSchedule("0 0 1 * 0")
+
+    assert cron.matches(datetime.datetime(2024, 12, 1, 0, 0))
+    assert cron.matches(datetime.datetime(2024, 12, 8, 0, 0))
+    assert not cron.matches(datetime.datetime(2024, 12, 9, 0, 0))
+
+
+def test_cron_sunday_as_seven():
+    assert CronSchedule("0 0 * * 7").matches(datetime.datetime(2024, 12, 8, 0, 0))
+
+
+@pytest.mark.parametrize("spec", ["* * * *", "60 * * * *", "*/0 * * * *", "5-1 * * * *",
+                                  "a * * * *"])
+def test_cron_invalid(spec):
+    with pytest.raises(ValueError):
+        CronSchedule(spec)
+
+
+def test_cron_never_matches():
+    with pytest.raises(ValueError):
+        CronSchedule("0 0 31 2 *").next_run(datetime.datetime(2024, 1, 1))
+
+
+def test_schedule_runs_once_by_default():
+    assert list(Schedule({})) == [0]
+
+
+def test_schedule_repeat_and_resume():
+    assert list(Schedule({"repeat": 3})) == [0, 1, 2]
+    assert list(Schedule({"repeat": 3}, start=2)) == [2]
+
+
+def test_schedule_stop_event():
+    stop_event = threading.Event()
+    stop_event.set()
+
+    assert list(Schedule({"repeat": 3}, stop_event=stop_event)) == []
+
+
+@pytest.mark.parametrize("until", ["2000-01-01T00:00:00+00:00", "2000-01-01T00:00:00Z",
+                                   "2000-01-01T01:00:00+01:00", "2000-01-01T00:00:00"])
+def test_schedule_until_in_the_past(until):
+    config = {"every": 0.01, "until": until}
+
+    assert Schedule.validate(config) == (True, [])
+    assert list(Schedule(config)) == []
+
+
+def test_schedule_until_with_offset_in_the_future():
+    until = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1))
+    config = {"repeat": 2, "until": until.astimezone(
+        datetime.timezone(datetime.timedelta(hours=-5))).isoformat()}
+
+    assert Schedule.validate(config) == (True, [])
+    assert list(Schedule(config)) == [0, 1]
+
+
+@pytest.mark.parametrize("config", [
+    {"repeat": 0}, {"repeat": True}, {"every": 0}, {"every": "1"}, {"until": "tomorrow"},
+    {"until": 10}, {"until": "2030-01-01T00:00:00Z"}, {"cron": 5}, {"cron": "* * *"}
+])
+def test_schedule_validate_rejects(config):
+    valid, errors = Schedule.validate(config)
+
+    assert valid is False
+    assert errors
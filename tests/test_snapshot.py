@@ -0,0 +1,70 @@
+import json
+import os
+
+from lib.recipe import Recipe
+from lib.snapshot import SnapshotState
+
+
+def entries(*time_raws):
+    return [{"time_raw": time_raw, "data_hex": f"{time_raw:x}", "data_len": 26}
+            for time_raw in time_raws]
+
+
+def test_only_entries_appended_since_the_last_run_are_new(tmp_path):
+    state = SnapshotState(str(tmp_path / "state"))
+
+    assert state.diff_log("door", entries(1, 2)) == (entries(1, 2), "full")
+    assert state.diff_log("door", entries(1, 2, 3, 4)) == (entries(3, 4), "diff")
+    assert state.diff_log("door", entries(1, 2, 3, 4)) == ([], "diff")
+
+    # The log was deleted and refilled.
+    assert state.diff_log("door", entries(5, 6, 7, 8)) == (entries(5, 6, 7, 8), "diff")
+    assert state.diff_log("door", []) == ([], "diff")
+    assert state.diff_log("door", entries(9)) == (entries(9), "diff")
+
+
+def test_responses_are_diffed_per_espkey_and_kept_between_runs(tmp_path):
+    state_file = str(tmp_path / "state")
+    state = SnapshotState(state_file)
+
+    assert state.diff_value("door", "get_config", {"ssid": "lobby"}) == \
+        ({"ssid": "lobby"}, "full")
+    assert state.diff_value("gate", "get_config", {"ssid": "dock"})[1] == "full"
+
+    state.diff_log("door", entries(1))
+    state.save()
+    state = SnapshotState(state_file)
+
+    assert state.diff_value("door", "get_config", {"ssid": "lobby", "channel": 6}) == \
+        ({"added": {"channel": 6}}, "diff")
+    assert state.diff_log("door", entries(1, 2)) == (entries(2), "diff")
+    assert list(state.devices(["gate"])) == ["gate"]
+
+
+def test_a_second_diffed_run_records_only_changes(tmp_path, fake_espkeys):
+    recipe_file = tmp_path / "recipe.json"
+    recipe_file.write_text(json.dumps({
+        "diff": True,
+        "espkeys": {"door": {"base_url": "http://127.0.0.1:9"}},
+        "tasks": {"t": {"target": "door", "actions": [
+            {"operation": "get_log"},
+            {"operation": "get_config"}
+        ]}}
+    }))
+    runs = []
+
+    for _ in range(2):
+        Recipe(str(recipe_file)).run()
+
+        output_file = next(name for name in os.listdir(tmp_path)
+                           if name.endswith("_door_t.json"))
+        runs.append(json.loads((tmp_path / output_file).read_text())['actions'])
+        os.remove(tmp_path / output_file)
+
+    assert [(action['snapshot'], action['result']) for action in runs[0]] == [
+        ("full", [{"time_raw": 1000, "data_hex": "29b0bfc", "data_len": 26}]),
+        ("full", {"ssid": "lobby"})
+    ]
+    assert [(action['snapshot'], action['result']) for action in runs[1]] == \
+        [("diff", []), ("diff", {})]
+    assert os.path.exists(f"{recipe_file}.state")
@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+from lib.espkey import ESPKey
+from lib.upgrade import Upgrader
+
+
+class UpgradedESPKey:
+    """Stands in for ESPKey in upgrades. Uploads in fail return False."""
+
+    def __init__(self, version="131", fail=()):
+        self.version = version
+        self.fail = set(fail)
+        self.calls = []
+
+    def get_version(self):
+        return {"version": self.version}
+
+    def upload_file(self, remote_name, file_path):
+        self.calls.append(remote_name)
+        return remote_name not in self.fail
+
+    def upload_firmware(self, file_path, endpoint="/update"):
+        self.calls.append(endpoint)
+        self.version = "132"
+        return True
+
+    def restart(self):
+        self.calls.append("restart")
+        return True
+
+    def wait_for_version(self, timeout=120):
+        return self.get_version()
+
+
+def write_manifest(tmp_path, **manifest):
+    (tmp_path / "www").mkdir(exist_ok=True)
+
+    for name in ["espkey-132.bin", "www/index.htm", "www/app.js"]:
+        (tmp_path / name).write_text(name)
+
+    manifest_file = tmp_path / "manifest.json"
+    manifest_file.write_text(json.dumps(manifest))
+
+    return Upgrader.load_manifest(str(manifest_file))
+
+
+def test_manifests_are_checked_and_resolved_against_their_directory(tmp_path):
+    manifest = write_manifest(tmp_path, version="132", firmware="espkey-132.bin",
+                              files={"/index.htm": "www/index.htm"})
+
+    assert manifest['firmware'] == str(tmp_path / "espkey-132.bin")
+    assert manifest['files'] == {"/index.htm": str(tmp_path / "www" / "index.htm")}
+
+    with pytest.raises(ValueError) as e:
+        write_manifest(tmp_path, version=132, files={"/missing.htm": "www/missing.htm"})
+
+    assert str(e.value) == "version must be a string. " \
+        f"{tmp_path / 'www' / 'missing.htm'} doesn't exist."
+
+
+def test_espkeys_on_the_target_firmware_are_skipped(tmp_path):
+    manifest = write_manifest(tmp_path, version="132", firmware="espkey-132.bin",
+                              firmware_endpoint="/ota", files={"/index.htm": "www/index.htm"})
+    espkeys = {"door": UpgradedESPKey(), "gate": UpgradedESPKey(version="132")}
+
+    results = Upgrader(espkeys, manifest).run()
+
+    assert results == {
+        "door": {"status": "upgraded", "uploaded": ["/index.htm", "firmware"], "version": "132"},
+        "gate": {"status": "skipped", "uploaded": [], "version": "132"}
+    }
+    assert espkeys['door'].calls == ["/index.htm", "/ota"]
+    assert espkeys['gate'].calls == []
+    assert Upgrader.summarize(results) == {"skipped": 1, "upgraded": 1, "failed": 0}
+
+
+def test_web_ui_upgrades_resume_from_the_state_file(tmp_path):
+    manifest = write_manifest(tmp_path, version="132", files={
+        "/index.htm": "www/index.htm", "/app.js": "www/app.js"
+    })
+    state_file = str(tmp_path / "upgrade_state.json")
+    espkey = UpgradedESPKey(fail={"/app.js"})
+
+    result = Upgrader({"door": espkey}, manifest, state_file=state_file).run()['door']
+
+    assert result == {"status": "failed", "uploaded": ["/index.htm"],
+                      "error": "Upload of /app.js failed."}
+
+    espkey.fail.clear()
+    espkey.calls.clear()
+    result = Upgrader({"door": espkey}, manifest, state_file=state_file).run()['door']
+
+    assert result['status'] == "upgraded"
+    assert espkey.calls == ["/app.js", "restart"]
+
+    # The version doesn't change, only the state file knows the files were delivered.
+    espkey.calls.clear()
+    result = Upgrader({"door": espkey}, manifest, state_file=state_file).run()['door']
+
+    assert result['status'] == "skipped" and espkey.calls == []
+
+    # A new target version starts over.
+    manifest.update({"version": "133"})
+    Upgrader({"door": espkey}, manifest, state_file=state_file).run()
+
+    assert espkey.calls == ["/index.htm", "/app.js", "restart"]
+
+
+def test_uploads_are_streamed_with_their_own_timeout(tmp_path, monkeypatch):
+    espkey = ESPKey({"name": "door", "base_url": "http://127.0.0.1:9", "web_user": "u",
+                     "web_pass": "p"})
+    posts = []
+
+    def http_stream_post(url, field_name, file_name, file_path, timeout=None):
+        posts.append((url, field_name, file_name, timeout))
+        return {"status": 200}
+
+    monkeypatch.setattr(espkey._ESPKey__http, "http_stream_post", http_stream_post)
+
+    assert espkey.upload_file("/index.htm", str(tmp_path / "index.htm"), timeout=30)
+    assert espkey.upload_firmware(str(tmp_path / "espkey-132.bin"))
+    assert posts == [("http://127.0.0.1:9/edit", "file", "/index.htm", 30),
+                     ("http://127.0.0.1:9/update", "firmware", "espkey-132.bin", 300)]
@@ -0,0 +1,69 @@
+import pytest
+
+from lib.log_entry import LogEntry
+from lib.weigand import WeigandEncoder
+
+
+@pytest.mark.parametrize("fmt_name, fc, cn, frame", [
+    ("h10301", 77, 34302, ("29b0bfc", 26)),
+    ("h10301", 1, 1, ("2020002", 26)),
+    ("hid_26", 1, 1, ("2020002", 26)),
+    ("h10304", 1, 1, ("1000100002", 37))
+])
+def test_encode_known_cards(fmt_name, fc, cn, frame):
+    assert WeigandEncoder.encode(fmt_name, fc, cn) == frame
+
+
+def test_encode_batch_matches_single_frames():
+    for fmt_name in WeigandEncoder.formats():
+        assert WeigandEncoder.encode_batch(fmt_name, 12, range(500, 520)) == \
+            [WeigandEncoder.encode(fmt_name, 12, cn) for cn in range(500, 520)]
+
+
+def test_encoded_h10301_decodes_back():
+    data_hex, data_len = WeigandEncoder.encode("h10301", 200, 4321)
+
+    assert LogEntry(0, data_hex=data_hex, data_len=data_len)['possible_hid_26'] == \
+        {"fc": 200, "cn": 4321}
+
+
+def test_encode_rejects_out_of_range_values():
+    with pytest.raises(ValueError):
+        WeigandEncoder.encode("h10301", 256, 1)
+
+    with pytest.raises(ValueError):
+        WeigandEncoder.encode("h10301", 1, 65536)
+
+    with pytest.raises(ValueError):
+        WeigandEncoder.encode("h99999", 1, 1)
+
+
+def test_encode_keypad():
+    assert WeigandEncoder.encode_keypad("12#") == [("e1", 8), ("d2", 8), ("4b", 8)]
+    assert WeigandEncoder.encode_keypad("0*", burst=True) == [("f05a", 16)]
+
+    with pytest.raises(ValueError):
+        WeigandEncoder.encode_keypad("12a")
+
+
+@pytest.mark.parametrize("spec, frames", [
+    ("0aabbcc:26", [("0aabbcc", 26)]),
+    ("h10301:fc=77,cn=34302", [("29b0bfc", 26)]),
+    ("h10301:fc=77, cn=34302-34303", [("29b0bfc", 26), WeigandEncoder.encode("h10301", 77, 34303)]),
+    ("h10301:fc=77,cn=5-5", [WeigandEncoder.encode("h10301", 77, 5)]),
+    ("keypad:pin=12,burst=1", [("e1d2", 16)])
+])
+def test_parse_spec(spec, frames):
+    assert WeigandEncoder.parse_spec(spec) == frames
+
+
+@pytest.mark.parametrize("spec", [
+    "h10301:fc=77,cn=200-100",
+    "h10301:fc=77,cn=abc",
+    "h10301:fc=77",
+    "h10301",
+    "keypad:burst=1"
+])
+def test_parse_spec_rejects_invalid_specifications(spec):
+    with pytest.raises(ValueError):
+        WeigandEncoder.parse_spec(spec)